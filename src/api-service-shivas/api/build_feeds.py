@@ -0,0 +1,39 @@
+"""
+Rebuild the per-user feeds served by /feed and upload them to feeds/feeds.bin.
+
+Run from the api-service-shivas folder, e.g. on a schedule after new content is published:
+
+    python -m api.build_feeds
+
+Only users whose level or reading history changed since the last run are scored again, unless
+the content changed or --full is given. Needs NumPy.
+"""
+import argparse
+import time
+from api.dependencies import GCP_BUCKET_NAME
+from api.utils.feed_builder import FEED_SIZE, publish_feeds
+from api.utils.gcs import create_storage_client
+from api.utils.media_manager import MediaManager
+from api.utils.user_store import USER_STORE_BACKEND, create_user_store
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bucket", default=GCP_BUCKET_NAME)
+    parser.add_argument("--backend", default=USER_STORE_BACKEND, help="User store to read users from")
+    parser.add_argument("--full", action="store_true", help="Score every user again")
+    parser.add_argument("--feed-size", type=int, default=FEED_SIZE, help="Items kept per user")
+    args = parser.parse_args()
+
+    client = create_storage_client()
+    store = create_user_store(args.bucket, lambda: client, args.backend)
+    media_manager = MediaManager(bucket_name=args.bucket, storage_client=client)
+
+    start = time.perf_counter()
+    counts = publish_feeds(client, args.bucket, store.iter_records(), media_manager, args.full, args.feed_size)
+    print(f"Built feeds of {counts['users']} users ({counts['scored']} scored, {counts['reused']} unchanged) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
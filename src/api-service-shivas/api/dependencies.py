@@ -0,0 +1,122 @@
+import os
+import threading
+from typing import Optional
+import jwt
+from fastapi import HTTPException, Request
+from google.cloud import storage
+from .utils.cefr_classifier import CefrClassifier
+from .utils.gcs import create_storage_client
+from .utils.media_manager import MediaManager
+from .utils.micro_batcher import MicroBatcher
+from .utils.search_index import SearchIndex
+from .utils.single_flight import AsyncSingleFlight
+from .utils.storage_io import run_storage
+from .utils.user_manager import UserManager
+
+# GCP Configuration
+GCP_BUCKET_NAME = os.getenv("GCP_BUCKET_NAME", "innit_articles_bucket")
+
+# Metadata updates of one user within this many seconds are written to the user store as one write
+USER_WRITE_BEHIND_SECONDS = float(os.getenv("USER_WRITE_BEHIND_SECONDS", "2"))
+
+# Items a user opens within this many seconds are added to their recently read list with one update
+READ_HISTORY_WINDOW_SECONDS = float(os.getenv("READ_HISTORY_WINDOW_SECONDS", "60"))
+
+# One manager of each kind per process, shared by every router
+media_manager = MediaManager(bucket_name=GCP_BUCKET_NAME)
+user_manager = UserManager(bucket_name=GCP_BUCKET_NAME, write_behind_window=USER_WRITE_BEHIND_SECONDS,
+                           read_history_window=READ_HISTORY_WINDOW_SECONDS)
+search_index = SearchIndex(bucket_name=GCP_BUCKET_NAME)
+cefr_classifier = CefrClassifier(bucket_name=GCP_BUCKET_NAME)
+
+# Concurrent /classify requests share forward passes of the classifier
+classify_batcher = MicroBatcher(cefr_classifier.predict, name="classify")
+
+# User lookups of requests without a token in flight, by username
+user_loads = AsyncSingleFlight("user_metadata")
+
+_storage_client: Optional[storage.Client] = None
+_storage_client_lock = threading.Lock()
+
+
+def bind_storage_client(client: storage.Client):
+    """Make `client` the storage client of the process and of the shared managers (called from the app lifespan)."""
+    global _storage_client
+    _storage_client = client
+    media_manager.storage_client = client
+    user_manager.storage_client = client
+    search_index.storage_client = client
+    cefr_classifier.storage_client = client
+
+
+def get_storage_client() -> storage.Client:
+    """Dependency returning the shared storage client; created on first use when running outside the app lifespan."""
+    if _storage_client is None:
+        with _storage_client_lock:
+            if _storage_client is None:
+                bind_storage_client(create_storage_client())
+    return _storage_client
+
+
+def get_media_manager() -> MediaManager:
+    return media_manager
+
+
+def get_user_manager() -> UserManager:
+    return user_manager
+
+
+def get_search_index() -> SearchIndex:
+    return search_index
+
+
+def get_classify_batcher() -> MicroBatcher:
+    return classify_batcher
+
+
+class CurrentUser:
+    """The user a request is made for, and their CEFR level (None when not set yet)."""
+
+    def __init__(self, username: str, level: Optional[str]):
+        self.username = username
+        self.level = level
+
+
+async def get_token_claims(request: Request) -> Optional[dict]:
+    """
+    Claims of the request's bearer token, or None when the request sends no Authorization header.
+    A token that does not verify is a 401; it never falls back to a username from a header or the query.
+    """
+    authorization = request.headers.get("authorization")
+    if authorization is None:
+        return None
+    if authorization[:7].lower() == "bearer ":
+        try:
+            return user_manager.decode_token(authorization[7:].strip())
+        except jwt.InvalidTokenError:
+            pass
+    raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+
+
+async def get_current_user(request: Request, username: Optional[str] = None) -> CurrentUser:
+    """
+    Resolve the user of a request.
+    A bearer token from /login is verified and its `level` claim used as is, without any storage I/O.
+    Requests without an Authorization header still work with an X-Username header or `username` query parameter,
+    at the cost of a user lookup. An invalid or expired token is rejected; the client has to log in again.
+    """
+    claims = await get_token_claims(request)
+    if claims is not None:
+        if "level" in claims:
+            return CurrentUser(claims["username"], claims["level"])
+        username = claims["username"]  # Token issued before tokens carried the level
+    else:
+        username = request.headers.get("X-Username") or username
+
+    if not username:
+        raise HTTPException(status_code=401, detail="Unauthorized: Username not found in headers")
+    try:
+        metadata = await user_loads.do(username, run_storage, user_manager.get_metadata, username)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return CurrentUser(username, metadata.get("level"))
@@ -0,0 +1,35 @@
+"""
+Export the level catalogs as static JSON files for nginx to serve under /content/.
+
+Run from the api-service-shivas folder after new content is published, e.g.
+
+    python -m api.export_static --out /static
+
+Each level gets a content-hashed version folder of listing pages and item documents (with .gz twins)
+and a current.json pointer to it. Unchanged levels keep their version and are not written again.
+"""
+import argparse
+import time
+from api.dependencies import GCP_BUCKET_NAME
+from api.utils.gcs import create_storage_client
+from api.utils.media_manager import MediaManager
+from api.utils.static_export import STATIC_PAGE_SIZE, export_catalogs
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="Folder served by nginx as its static root")
+    parser.add_argument("--bucket", default=GCP_BUCKET_NAME)
+    parser.add_argument("--page-size", type=int, default=STATIC_PAGE_SIZE, help="Items per listing page")
+    args = parser.parse_args()
+
+    media_manager = MediaManager(bucket_name=args.bucket, storage_client=create_storage_client())
+    start = time.perf_counter()
+    for summary in export_catalogs(args.out, media_manager, page_size=args.page_size):
+        state = f"{summary['written']} files written" if summary["written"] else "unchanged"
+        print(f"{summary['kind']}/{summary['level']}: version {summary['version']}, {summary['files']} files, {state}")
+    print(f"Exported the catalogs to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Bulk-import the users/ prefix of the bucket into the SQLite user store.
+
+Run from the api-service-shivas folder, then start the API with USER_STORE_BACKEND=sqlite:
+
+    python -m api.migrate_users --db users.db
+
+Running it again is safe: users already in the database are replaced by their blob.
+"""
+import argparse
+import time
+from api.dependencies import GCP_BUCKET_NAME
+from api.utils.gcs import create_storage_client
+from api.utils.user_store import USER_DB_PATH, GCSUserStore, SQLiteUserStore, migrate_users
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bucket", default=GCP_BUCKET_NAME)
+    parser.add_argument("--db", default=USER_DB_PATH, help="SQLite database file to import into")
+    parser.add_argument("--batch-size", type=int, default=500, help="Users written per transaction")
+    args = parser.parse_args()
+
+    client = create_storage_client()
+    source = GCSUserStore(args.bucket, lambda: client)
+    target = SQLiteUserStore(args.db)
+
+    start = time.perf_counter()
+    copied = migrate_users(source, target, batch_size=args.batch_size)
+    print(f"Imported {copied} users from gs://{args.bucket}/users/ into {args.db} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import traceback
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from ..dependencies import CurrentUser, get_classify_batcher, get_current_user
+from ..utils.cefr_classifier import ClassifierUnavailable
+from ..utils.micro_batcher import BatcherBusy, MicroBatcher
+
+# Longest text accepted, in characters. The classifier only reads the first CLASSIFIER_MAX_TOKENS tokens anyway.
+CLASSIFY_MAX_CHARS = int(os.getenv("CLASSIFY_MAX_CHARS", "20000"))
+
+router = APIRouter()
+
+
+class ClassifyRequest(BaseModel):
+    text: str
+
+
+@router.post("/classify")
+async def classify_text(request: ClassifyRequest, user: CurrentUser = Depends(get_current_user),
+                        batcher: MicroBatcher = Depends(get_classify_batcher)):
+    """
+    CEFR level of a text and the probability of each level.
+    The text is classified together with the other texts sent at the same time, in one forward pass.
+    """
+    text = request.text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Text is empty")
+    if len(text) > CLASSIFY_MAX_CHARS:
+        raise HTTPException(status_code=413, detail=f"Text is longer than {CLASSIFY_MAX_CHARS} characters")
+    try:
+        return await batcher.submit(text)
+    except BatcherBusy:
+        raise HTTPException(status_code=503, detail="Too many texts waiting to be classified, please retry",
+                            headers={"Retry-After": "1"})
+    except ClassifierUnavailable:
+        raise HTTPException(status_code=503, detail="The classifier is not available")
+    except Exception as e:
+        print(f"Error classifying text for {user.username}: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Error classifying text")
@@ -1,31 +1,53 @@
 import os
-import json
 import traceback
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
+from ..dependencies import GCP_BUCKET_NAME, get_storage_client
+from ..utils.blob_cache import VersionedBlobCache
+from ..utils.http_cache import DIAGNOSTIC_CACHE_CONTROL, etag_matches, make_etag, not_modified
+from ..utils.response_cache import ResponseCache, encoded_response
+from ..utils.single_flight import AsyncSingleFlight
+from ..utils.storage_io import run_storage
 
 # Define Router
 router = APIRouter()
 
 # GCP Configuration
-GCP_BUCKET_NAME = os.getenv("GCP_BUCKET_NAME", "innit_articles_bucket")  # Use environment variable for bucket name
 DIAGNOSTIC_TEST_PATH = "generated_questions/diagnostic_test.json"  # Path in the GCP bucket
 
+# The test only changes when diagnostic_test/gen_test.py runs, so its generation is checked at most this often
+DIAGNOSTIC_CHECK_INTERVAL_SECONDS = float(os.getenv("DIAGNOSTIC_CHECK_INTERVAL_SECONDS", "30"))
+
+# Parsed test and its encoded response bodies, keyed by blob generation
+diagnostic_cache = VersionedBlobCache(DIAGNOSTIC_TEST_PATH, DIAGNOSTIC_CHECK_INTERVAL_SECONDS, name="diagnostic_blob")
+response_cache = ResponseCache(max_entries=4, name="diagnostic_response")
+
+# Concurrent requests share one cache check (and, when the interval has passed, one bucket request)
+diagnostic_loads = AsyncSingleFlight("diagnostic")
+
 @router.get("/diagnostic")
-async def get_diagnostic_test():
-    """Fetch diagnostic test questions from GCP bucket."""
+async def get_diagnostic_test(request: Request, storage_client: storage.Client = Depends(get_storage_client)):
+    """
+    Fetch diagnostic test questions from GCP bucket.
+    The parsed test is cached by blob generation and the bucket is only checked once per interval.
+    The ETag is the blob generation, so a matching If-None-Match is answered without a body.
+    """
     try:
-        # Initialize GCP Storage client
-        storage_client = storage.Client()
         bucket = storage_client.bucket(GCP_BUCKET_NAME)
-        blob = bucket.blob(DIAGNOSTIC_TEST_PATH)
-        
-        if not blob.exists():
+        try:
+            generation, diagnostic_data = await diagnostic_loads.do(DIAGNOSTIC_TEST_PATH, run_storage,
+                                                                    diagnostic_cache.get, bucket)
+        except NotFound:
             raise HTTPException(status_code=404, detail="Diagnostic test file not found.")
 
-        # Load diagnostic test data
-        diagnostic_data = json.loads(blob.download_as_text())
-        return {"questions": diagnostic_data}
+        etag = make_etag("diagnostic", generation)
+        if etag_matches(request, etag):
+            return not_modified(etag, DIAGNOSTIC_CACHE_CONTROL)
+        body = response_cache.get_or_build(etag, lambda: {"questions": diagnostic_data})
+        return encoded_response(request, body, {"ETag": etag, "Cache-Control": DIAGNOSTIC_CACHE_CONTROL})
+    except HTTPException:
+        raise
     except Exception as e:
         # Log the error for debugging
         print(f"Error fetching diagnostic test: {str(e)}")
@@ -1,90 +1,410 @@
-from fastapi import APIRouter, HTTPException
-from ..utils.media_manager import MediaManager
+import asyncio
+import json
+import os
+from typing import Dict, Iterator, Optional, Tuple
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+from ..dependencies import (
+    GCP_BUCKET_NAME, CurrentUser, get_current_user, get_media_manager, get_storage_client, get_user_manager,
+    media_manager
+)
+from ..utils.blob_cache import VersionedBlobCache
+from ..utils.change_log import changes_between
+from ..utils.feed_store import FEED_BLOB, FeedIndex, read_key
+from ..utils.http_cache import (
+    DETAIL_CACHE_CONTROL, LISTING_CACHE_CONTROL, etag_matches, make_etag, not_modified
+)
+from ..utils.response_cache import ResponseCache, encoded_response
+from ..utils.single_flight import AsyncSingleFlight
+from ..utils.static_export import StaticExporter
+from ..utils.storage_io import run_storage
+from ..utils.media_manager import (
+    CatalogSnapshot, MediaManager, ARTICLE_LISTING_FIELDS, LEVELS, TRANSCRIPT_LISTING_FIELDS
+)
 from ..utils.user_manager import UserManager
 
-# Initialize MediaManager
-media_manager = MediaManager(bucket_name="innit_articles_bucket")
-user_manager = UserManager(bucket_name="innit_articles_bucket")
+# How often (in seconds) the background task re-checks the bucket for changed content
+MEDIA_REFRESH_INTERVAL_SECONDS = float(os.getenv("MEDIA_REFRESH_INTERVAL_SECONDS", "30"))
+
+# Page size of the listing endpoints
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Who may open an article or video by ID: "any" serves items of every level (e.g. reached through search
+# or a shared link), "own_level" answers 403 for items of another level than the user's
+DETAIL_LEVEL_POLICY = os.getenv("DETAIL_LEVEL_POLICY", "any")
+
+# How often (in seconds) the bucket is checked for feeds rebuilt by `python -m api.build_feeds`
+FEED_CHECK_INTERVAL_SECONDS = float(os.getenv("FEED_CHECK_INTERVAL_SECONDS", "60"))
+
+# Encoded (and compressed) bodies, keyed by ETag
+response_cache = ResponseCache(name="media_response")
+
+# Precomputed feeds of every user, keyed by blob generation
+feed_cache = VersionedBlobCache(FEED_BLOB, FEED_CHECK_INTERVAL_SECONDS, parse=FeedIndex, name="feed")
+
+# Snapshot and item lookups in flight, so a burst of requests for a level or an item holds one storage thread
+snapshot_loads = AsyncSingleFlight("media_snapshot")
+item_loads = AsyncSingleFlight("media_item")
 
 router = APIRouter()
 
+
+async def refresh_media_catalogs(interval: float = MEDIA_REFRESH_INTERVAL_SECONDS,
+                                 static_exporter: Optional[StaticExporter] = None):
+    """
+    Keep the level catalogs warm so listing requests are always served from a snapshot.
+    Runs for the lifetime of the app; each pass only downloads blobs that changed.
+    With a `static_exporter`, levels whose catalog changed are also exported again for nginx.
+    """
+    while True:
+        try:
+            await run_storage(media_manager.refresh_all)
+            if static_exporter is not None:
+                await run_storage(static_exporter.export_changed)
+        except Exception as e:
+            print(f"Error refreshing media catalogs: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+def listing_level(user: CurrentUser) -> str:
+    """The level whose catalog the user is served (B2 if none is set), or a 400 for a level with no content."""
+    level = user.level or "B2"
+    if level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"Unknown level '{level}'")
+    return level
+
+
+def detail_level(user: CurrentUser) -> Optional[str]:
+    """The user's level for lookups by ID (None if not set), or a 400 for a level with no content."""
+    if user.level is not None and user.level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"Unknown level '{user.level}'")
+    return user.level
+
+
+async def load_snapshot(media_manager: MediaManager, kind: str, level: str) -> CatalogSnapshot:
+    """The current catalog snapshot of a level for `kind` "article" or "video", shared by concurrent requests."""
+    get_snapshot = media_manager.article_snapshot if kind == "article" else media_manager.transcript_snapshot
+    return await snapshot_loads.do((media_manager, kind, level), run_storage, get_snapshot, level)
+
+
+async def find_item(media_manager: MediaManager, kind: str, item_id: str, user: CurrentUser):
+    """
+    Find an article or video of any level by ID, or raise a 404.
+    Raises a 403 for items of another level than the user's under the "own_level" policy.
+    Returns (item, content version).
+    """
+    find = media_manager.find_article if kind == "article" else media_manager.find_video
+    level = detail_level(user)
+    found = await item_loads.do((media_manager, kind, item_id, level), run_storage, find, item_id, level)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"{kind.capitalize()} not found")
+    item_level, item, version = found
+    if DETAIL_LEVEL_POLICY == "own_level" and item_level != user.level:
+        raise HTTPException(status_code=403, detail=f"This {kind} is for level {item_level}")
+    return item, version
+
+
+async def cached_item_etag(request: Request, media_manager: MediaManager, kind: str, item_id: str,
+                           user: CurrentUser) -> Optional[str]:
+    """
+    The ETag of an item when the request revalidates it with If-None-Match and it matches, else None.
+    It comes from the version in the id index or the user's catalog, so a 304 reads neither the item nor storage.
+    """
+    if not request.headers.get("if-none-match"):
+        return None
+    locate = media_manager.locate_article if kind == "article" else media_manager.locate_video
+    located = await run_storage(locate, item_id, detail_level(user))
+    if located is None:
+        return None
+    item_level, version = located
+    if DETAIL_LEVEL_POLICY == "own_level" and item_level != user.level:
+        raise HTTPException(status_code=403, detail=f"This {kind} is for level {item_level}")
+    etag = make_etag(kind, version, item_id)
+    return etag if etag_matches(request, etag) else None
+
+
+def parse_fields(fields: Optional[str], default: Optional[Tuple[str, ...]]) -> Optional[Tuple[str, ...]]:
+    """Turn a comma-separated `fields` query parameter into a projection."""
+    if not fields:
+        return default
+    return tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+
+
+def parse_cursor(cursor: Optional[str]) -> int:
+    """Cursors are the offset of the next page, as returned in `next_cursor`."""
+    if not cursor:
+        return 0
+    if not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return int(cursor)
+
+
+def wants_ndjson(request: Request, format: Optional[str]) -> bool:
+    """Clients ask for a streamed listing with ?format=ndjson or an Accept: application/x-ndjson header."""
+    return format == "ndjson" or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_lines(items: Iterator[Dict]) -> Iterator[str]:
+    """Serialize items one per line as they are read, so the whole listing is never held as one string."""
+    for item in items:
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+
+def listing_response(request: Request, snapshot: CatalogSnapshot, key: str,
+                     fields: Optional[str], default_fields: Tuple[str, ...], offset: int, limit: int,
+                     stream: bool):
+    """
+    Build a listing response from one catalog snapshot.
+    The ETag covers the snapshot version and every parameter that shapes the body,
+    so a matching If-None-Match is answered with a 304 before anything is serialized,
+    and pages are serialized and compressed once per ETag.
+    """
+    projection = parse_fields(fields, None if stream else default_fields)
+    etag = make_etag(key, snapshot.version, projection, offset, limit, stream) if snapshot.version else None
+    if etag and etag_matches(request, etag):
+        return not_modified(etag, LISTING_CACHE_CONTROL)
+    headers = {"ETag": etag, "Cache-Control": LISTING_CACHE_CONTROL} if etag else {}
+
+    if stream:
+        return StreamingResponse(ndjson_lines(snapshot.iter_items(projection)), media_type=NDJSON_MEDIA_TYPE,
+                                 headers=headers)
+
+    def build():
+        items, next_offset, total = snapshot.page(projection, offset, limit)
+        return {
+            key: items,
+            "next_cursor": str(next_offset) if next_offset is not None else None,
+            "total": total,
+        }
+
+    if not etag:
+        return build()  # No snapshot version to key the cache on
+    return encoded_response(request, response_cache.get_or_build(etag, build), headers)
+
+
+def changes_response(request: Request, snapshot: CatalogSnapshot, change_log: Optional[Tuple[int, Dict]],
+                     key: str, since: int, fields: Optional[str], default_fields: Tuple[str, ...]):
+    """
+    Build a delta sync response: the items added or updated and the IDs removed since version `since`.
+    The version reached is the one both the snapshot and the change log know, so a client never skips changes.
+    When the log no longer covers `since`, "reset" is true and "added" holds the whole level.
+    """
+    if change_log is None or snapshot.change_version is None:
+        raise HTTPException(status_code=404, detail="No change log is published for this level")
+    generation, log = change_log
+    version = min(snapshot.change_version, log["version"])
+    projection = parse_fields(fields, default_fields)
+    etag = make_etag(f"{key}-changes", snapshot.version, generation, since, projection)
+    if etag_matches(request, etag):
+        return not_modified(etag, LISTING_CACHE_CONTROL)
+
+    def build():
+        def project(item_ids):
+            items = (snapshot.by_id.get(item_id) for item_id in item_ids)
+            return [{field: item[field] for field in projection if field in item} for item in items if item is not None]
+
+        changes = changes_between(log, since, version)
+        if changes is None:
+            return {"version": version, "reset": True, "added": snapshot.project(projection), "updated": [],
+                    "removed": []}
+        return {"version": version, "reset": False, "added": project(changes["added"]),
+                "updated": project(changes["updated"]), "removed": changes["removed"]}
+
+    return encoded_response(request, response_cache.get_or_build(etag, build),
+                            {"ETag": etag, "Cache-Control": LISTING_CACHE_CONTROL})
+
+
 @router.get("/transcripts")
-def list_video_transcripts(username: str):
-    """Fetch video transcripts based on the user's level."""
+async def list_video_transcripts(request: Request,
+                                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                 cursor: Optional[str] = None,
+                                 fields: Optional[str] = None,
+                                 format: Optional[str] = None,
+                                 user: CurrentUser = Depends(get_current_user),
+                                 media_manager: MediaManager = Depends(get_media_manager)):
+    """
+    Fetch one page of video transcripts based on the user's level.
+    Items only carry `fields` (default: video_id, video_name, summary); use /videos/{id} for the full transcript.
+    With ?format=ndjson every full transcript of the level is streamed instead, one JSON object per line.
+    """
+    offset = parse_cursor(cursor)
+    user_level = listing_level(user)
     try:
-        # Fetch user metadata to determine the level
-        user_metadata = user_manager.get_metadata(username)  # Assuming you have this method
-        user_level = user_metadata.get("level", "B2")  # Default to B2 if no level is set
-        
         # Fetch transcripts based on the user's level
-        transcripts = media_manager.get_video_transcripts(level=user_level)
-        return {"transcripts": transcripts}
+        snapshot = await load_snapshot(media_manager, "video", user_level)
+        return listing_response(request, snapshot, "transcripts", fields, TRANSCRIPT_LISTING_FIELDS,
+                                offset, limit, wants_ndjson(request, format))
     except Exception as e:
         print(f"Error fetching video transcripts: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching video transcripts.")
 
+@router.get("/transcripts/changes")
+async def video_transcript_changes(request: Request,
+                                   since: int = Query(..., ge=0),
+                                   fields: Optional[str] = None,
+                                   user: CurrentUser = Depends(get_current_user),
+                                   media_manager: MediaManager = Depends(get_media_manager)):
+    """
+    Video transcripts of the user's level added, updated or removed since change log version `since`
+    (0 for everything). Clients keep the returned `version` and pass it as `since` on their next sync.
+    """
+    level = listing_level(user)
+    try:
+        snapshot = await load_snapshot(media_manager, "video", level)
+        change_log = await run_storage(media_manager.get_change_log, "yt_transcripts", level)
+        return changes_response(request, snapshot, change_log, "transcripts", since, fields,
+                                TRANSCRIPT_LISTING_FIELDS)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching video transcript changes: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching video transcript changes.")
+
 @router.get("/articles")
-def list_articles(username: str):
-    """Fetch articles based on the user's level."""
+async def list_articles(request: Request,
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None,
+                        fields: Optional[str] = None,
+                        format: Optional[str] = None,
+                        user: CurrentUser = Depends(get_current_user),
+                        media_manager: MediaManager = Depends(get_media_manager)):
+    """
+    Fetch one page of articles based on the user's level.
+    Items only carry `fields` (default: id, Title, summary); use /articles/{id} for the full article.
+    With ?format=ndjson every full article of the level is streamed instead, one JSON object per line.
+    """
+    offset = parse_cursor(cursor)
+    user_level = listing_level(user)
     try:
-        # Fetch user metadata to determine the level
-        user_metadata = user_manager.get_metadata(username)  # Assuming you have this method
-        user_level = user_metadata.get("level", "B2")  # Default to B2 if no level is set
-        
         # Fetch articles based on the user's level
-        articles = media_manager.get_articles(level=user_level)
-        return {"articles": articles}
+        snapshot = await load_snapshot(media_manager, "article", user_level)
+        return listing_response(request, snapshot, "articles", fields, ARTICLE_LISTING_FIELDS,
+                                offset, limit, wants_ndjson(request, format))
     except Exception as e:
         print(f"Error fetching articles: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching articles.")
 
-    
-from fastapi import HTTPException, Request
+# Declared before /articles/{id}, which would otherwise take "changes" as an article ID
+@router.get("/articles/changes")
+async def article_changes(request: Request,
+                          since: int = Query(..., ge=0),
+                          fields: Optional[str] = None,
+                          user: CurrentUser = Depends(get_current_user),
+                          media_manager: MediaManager = Depends(get_media_manager)):
+    """
+    Articles of the user's level added, updated or removed since change log version `since` (0 for everything).
+    Clients keep the returned `version` and pass it as `since` on their next sync.
+    """
+    level = listing_level(user)
+    try:
+        snapshot = await load_snapshot(media_manager, "article", level)
+        change_log = await run_storage(media_manager.get_change_log, "bbc_news", level)
+        return changes_response(request, snapshot, change_log, "articles", since, fields, ARTICLE_LISTING_FIELDS)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching article changes: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching article changes.")
 
-def get_authenticated_user(request: Request):
-    username = request.headers.get("X-Username")
-    if not username:
-        raise HTTPException(status_code=401, detail="Unauthorized: Username not found in headers")
-    return username
+@router.get("/feed")
+async def get_feed(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                   user: CurrentUser = Depends(get_current_user),
+                   media_manager: MediaManager = Depends(get_media_manager),
+                   storage_client: storage.Client = Depends(get_storage_client)):
+    """
+    The user's recommended articles and videos, best first, as ranked by `python -m api.build_feeds`.
+    Serving it is a lookup in the precomputed feeds plus the listing fields of each item.
+    Users without a feed yet (e.g. new sign-ups) get the first articles of their level.
+    """
+    user_level = listing_level(user)
+    try:
+        try:
+            _, feeds = await run_storage(feed_cache.get, storage_client.bucket(GCP_BUCKET_NAME))
+        except NotFound:
+            feeds = None  # No feeds built yet
+        refs = feeds.feed_for(user.username) if feeds is not None else None
 
-from fastapi import Depends
+        if refs is None:
+            snapshot = await load_snapshot(media_manager, "article", user_level)
+            items, _, _ = snapshot.page(ARTICLE_LISTING_FIELDS, 0, limit)
+            return {"feed": [{"type": "article", **item} for item in items], "personalized": False}
+
+        snapshots: Dict[Tuple[str, str], CatalogSnapshot] = {}
+        feed = []
+        for kind, level, item_id in refs:
+            if len(feed) >= limit:
+                break
+            if (kind, level) not in snapshots:
+                snapshots[kind, level] = await load_snapshot(media_manager, kind, level)
+            item = snapshots[kind, level].by_id.get(item_id)
+            if item is None:
+                continue  # Removed since the feeds were built
+            fields = ARTICLE_LISTING_FIELDS if kind == "article" else TRANSCRIPT_LISTING_FIELDS
+            feed.append({"type": kind, **{field: item[field] for field in fields if field in item}})
+        return {"feed": feed, "personalized": True}
+    except Exception as e:
+        print(f"Error fetching feed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching feed.")
 
 @router.get("/articles/{id}")
-def get_article(id: str, username: str = Depends(get_authenticated_user)):
+async def get_article(id: str, request: Request, background_tasks: BackgroundTasks,
+                      user: CurrentUser = Depends(get_current_user),
+                      user_manager: UserManager = Depends(get_user_manager),
+                      media_manager: MediaManager = Depends(get_media_manager)):
     """
-    Fetch a specific article by ID.
-    Validate the user's level before providing access.
+    Fetch a specific article by ID, whatever its level, with one lookup in the published id index.
+    Items of other levels than the user's are only served under the "any" DETAIL_LEVEL_POLICY.
+    A matching If-None-Match is answered with 304 without reading the article or recording a read.
     """
     try:
-        # Fetch the user's level from the database or metadata
-        user_metadata = user_manager.get_metadata(username)
-        user_level = user_metadata.get("level", "NA")
-
-        # Fetch the article based on the user's level
-        article = media_manager.get_article_by_id(id, user_level)
-        if not article:
-            raise HTTPException(status_code=404, detail="Article not found")
-        return {"article": article}
+        # A revalidation of a copy the client already has is answered before any fetch and is not a new read
+        etag = await cached_item_etag(request, media_manager, "article", id, user)
+        if etag is not None:
+            return not_modified(etag, DETAIL_CACHE_CONTROL)
+
+        article, version = await find_item(media_manager, "article", id, user)
+        # Reading history for the feed builder, written after the response is sent
+        background_tasks.add_task(run_storage, user_manager.record_read, user.username, read_key("article", id))
+
+        etag = make_etag("article", version, id)
+        body = response_cache.get_or_build(etag, lambda: {"article": article})
+        return encoded_response(request, body, {"ETag": etag, "Cache-Control": DETAIL_CACHE_CONTROL})
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching article {id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching article")
 
 @router.get("/videos/{id}")
-def get_video(id: str, username: str = Depends(get_authenticated_user)):
+async def get_video(id: str, request: Request, background_tasks: BackgroundTasks,
+                    user: CurrentUser = Depends(get_current_user),
+                    user_manager: UserManager = Depends(get_user_manager),
+                    media_manager: MediaManager = Depends(get_media_manager)):
     """
-    Fetch a specific video by ID.
-    Validate the user's level before providing access.
+    Fetch a specific video by ID, whatever its level, with one lookup in the published id index.
+    Items of other levels than the user's are only served under the "any" DETAIL_LEVEL_POLICY.
+    A matching If-None-Match is answered with 304 without reading the video or recording a read.
     """
     try:
-        # Fetch the user's level from the database or metadata
-        user_metadata = user_manager.get_metadata(username)
-        user_level = user_metadata.get("level", "NA")
-
-        # Fetch the video based on the user's level
-        video = media_manager.get_video_by_id(id, user_level)
-        if not video:
-            raise HTTPException(status_code=404, detail="Video not found")
-        return {"video": video}
+        # A revalidation of a copy the client already has is answered before any fetch and is not a new read
+        etag = await cached_item_etag(request, media_manager, "video", id, user)
+        if etag is not None:
+            return not_modified(etag, DETAIL_CACHE_CONTROL)
+
+        video, version = await find_item(media_manager, "video", id, user)
+        # Reading history for the feed builder, written after the response is sent
+        background_tasks.add_task(run_storage, user_manager.record_read, user.username, read_key("video", id))
+
+        etag = make_etag("video", version, id)
+        body = response_cache.get_or_build(etag, lambda: {"video": video})
+        return encoded_response(request, body, {"ETag": etag, "Cache-Control": DETAIL_CACHE_CONTROL})
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching video {id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching video")
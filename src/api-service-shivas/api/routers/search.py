@@ -0,0 +1,38 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from ..dependencies import CurrentUser, get_current_user, get_search_index
+from ..utils.media_manager import LEVELS
+from ..utils.search_index import SearchIndex
+from ..utils.storage_io import run_storage
+
+# Results returned per content kind
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+router = APIRouter()
+
+
+@router.get("/search")
+async def search(q: str = Query(..., min_length=1, max_length=200),
+                 level: Optional[str] = None,
+                 limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+                 user: CurrentUser = Depends(get_current_user),
+                 search_index: SearchIndex = Depends(get_search_index)):
+    """
+    Full-text search over the articles and transcripts of a level (default: the user's level).
+    Matches every word of `q` in titles, text, summaries and vocab, best BM25 score first.
+    Articles and transcripts are ranked separately, since their scores come from different indexes.
+    """
+    level = level or user.level or "B2"
+    if level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"Unknown level '{level}'")
+    try:
+        articles, transcripts = await asyncio.gather(
+            run_storage(search_index.search, "articles", level, q, limit),
+            run_storage(search_index.search, "transcripts", level, q, limit),
+        )
+    except Exception as e:
+        print(f"Error searching for '{q}': {str(e)}")
+        raise HTTPException(status_code=500, detail="Error searching content")
+    return {"query": q, "level": level, "articles": articles, "transcripts": transcripts}
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 import logging
+from ..dependencies import get_token_claims, get_user_manager, user_loads
+from ..utils.password_hasher import PasswordHasherBusy
+from ..utils.storage_io import run_storage
 from ..utils.user_manager import UserManager
 
-# Initialize Router and User Manager
+# Initialize Router
 router = APIRouter()
-user_manager = UserManager(bucket_name="innit_articles_bucket")
 
 # Define a schema for the register request
 class RegisterRequest(BaseModel):
@@ -25,44 +28,63 @@ class MetadataResponse(BaseModel):
     metadata: dict
 
 
+def busy_error() -> HTTPException:
+    """Logins and sign-ups over the password hashing capacity are told to come back shortly."""
+    return HTTPException(status_code=503, detail="Too many login attempts, please retry", headers={"Retry-After": "1"})
+
+
 @router.post("/register")
-def register_user(request: RegisterRequest):
+async def register_user(request: RegisterRequest, user_manager: UserManager = Depends(get_user_manager)):
     """Register a new user."""
     try:
-        user_manager.register_user(request.username, request.password, {})
+        await user_manager.register(request.username, request.password, {})
         return {"message": "User registered successfully"}
+    except PasswordHasherBusy:
+        raise busy_error()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/login")
-def login_user(request: LoginRequest):
+async def login_user(request: LoginRequest, user_manager: UserManager = Depends(get_user_manager)):
     """Authenticate user with username and password."""
     username = request.username
     password = request.password
     logging.info(f"Login attempt for username: {username}")
     try:
-        token = user_manager.authenticate_user(username, password)
+        token = await user_manager.authenticate(username, password)
         logging.info(f"User '{username}' authenticated successfully")
         return {"message": "Login successful", "token": token}
+    except PasswordHasherBusy:
+        logging.warning(f"Login for '{username}' rejected: password hash queue is full")
+        raise busy_error()
     except Exception as e:
         logging.error(f"Authentication failed for '{username}': {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
 @router.patch("/update-metadata")
-def update_metadata(request: MetadataUpdateRequest):
-    """Update user metadata."""
+async def update_metadata(request: MetadataUpdateRequest, user_manager: UserManager = Depends(get_user_manager),
+                          claims: Optional[dict] = Depends(get_token_claims)):
+    """
+    Update user metadata.
+    Tokens carry the user's level, so a level change comes back with a new token to replace the old one.
+    The new token is only issued to a caller that already holds a valid token for the same user.
+    """
     try:
-        user_manager.update_metadata(request.username, request.metadata)
+        metadata = await run_storage(user_manager.update_metadata, request.username, request.metadata)
+        user_loads.forget(request.username)  # Lookups that started before the update must not be joined
+        if "level" in request.metadata and claims is not None and claims.get("username") == request.username:
+            return {"message": "Metadata updated successfully",
+                    "token": user_manager.issue_token(request.username, metadata)}
         return {"message": "Metadata updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
 @router.get("/get-metadata", response_model=MetadataResponse)
-def get_metadata(username: str):
+async def get_metadata(username: str, user_manager: UserManager = Depends(get_user_manager)):
     """Fetch user metadata."""
     try:
-        metadata = user_manager.get_metadata(username)
+        metadata = await run_storage(user_manager.get_metadata, username)
         return {"username": username, "metadata": metadata}
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1,11 +1,39 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from starlette.middleware.cors import CORSMiddleware
+from api.routers import classify
 from api.routers import diagnostic
 from api.routers import media
+from api.routers import search
 from api.routers import users
+from api.dependencies import bind_storage_client, cefr_classifier, classify_batcher, user_manager
+from api.utils.gcs import create_storage_client
+from api.utils.metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, render
+from api.utils.static_export import STATIC_EXPORT_DIR, StaticExporter
+from api.utils.storage_io import run_storage, storage_io
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One storage client (and connection pool) for the whole process, shared through api.dependencies
+    bind_storage_client(await run_storage(create_storage_client))
+    # Build and keep refreshing the media snapshots in the background, and the static export with them
+    static_exporter = StaticExporter(STATIC_EXPORT_DIR, media.media_manager) if STATIC_EXPORT_DIR else None
+    refresher = asyncio.create_task(media.refresh_media_catalogs(static_exporter=static_exporter))
+    # Load the CEFR classifier in the background, so the first /classify does not wait for it
+    if cefr_classifier.available:
+        asyncio.get_running_loop().run_in_executor(classify_batcher.executor, cefr_classifier.preload)
+    yield
+    refresher.cancel()
+    await classify_batcher.close()
+    # Queued metadata updates must reach the user store before the process exits
+    await run_storage(user_manager.flush_pending)
+    storage_io.shutdown()
+
 
 # Setup FastAPI app
-app = FastAPI(title="API Server", description="API Server", version="v1")
+app = FastAPI(title="API Server", description="API Server", version="v1", lifespan=lifespan)
 
 # Enable CORSMiddleware
 app.add_middleware(
@@ -16,13 +44,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latency, status and GCS usage per route, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
 
 # Routes
 @app.get("/")
 async def get_index():
     return {"message": "Welcome to innit"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # Additional routers here
+app.include_router(classify.router)
 app.include_router(diagnostic.router)
 app.include_router(media.router)
+app.include_router(search.router)
 app.include_router(users.router)
\ No newline at end of file
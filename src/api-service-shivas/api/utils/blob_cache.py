@@ -0,0 +1,78 @@
+import json
+import time
+from typing import Any, Callable, Optional, Tuple
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+from .metrics import record_cache_lookup, record_gcs_call
+from .single_flight import SingleFlight
+
+
+class VersionedBlobCache:
+    """
+    Parsed copy of one blob (JSON unless another `parse` function is given), keyed by the blob generation.
+    The bucket is asked for the blob metadata at most once per `check_interval` seconds, and the
+    body is only downloaded again when the generation changed. One caller refreshes at a time;
+    callers that arrive meanwhile share its result, or its error.
+    """
+
+    def __init__(self, blob_name: str, check_interval: float, parse: Optional[Callable[[bytes], Any]] = None,
+                 name: str = "blob"):
+        self.blob_name = blob_name
+        self.check_interval = check_interval
+        self.parse = parse  # Builds the cached value from the blob bytes; None for JSON
+        self.name = name  # Label of the cache in the metrics
+        self.generation: Optional[int] = None
+        self.data: Any = None
+        self.checked_at = 0.0
+        self.reloads = 0  # Number of body downloads, for tests and diagnostics
+        self._refreshes = SingleFlight(name)
+
+    def _is_fresh(self) -> bool:
+        return self.generation is not None and time.monotonic() - self.checked_at < self.check_interval
+
+    def get(self, bucket: storage.Bucket) -> Tuple[int, Any]:
+        """Return (generation, parsed content), checking the bucket only when the interval has passed."""
+        if self._is_fresh():
+            record_cache_lookup(self.name, "hit")
+            return self.generation, self.data
+
+        return self._refreshes.do(self.blob_name, self._refresh, bucket)
+
+    def expire(self):
+        """Check the bucket on the next get, e.g. when the cached copy points at content that has changed."""
+        self.checked_at = 0.0
+
+    def _refresh(self, bucket: storage.Bucket) -> Tuple[int, Any]:
+        if self._is_fresh():
+            record_cache_lookup(self.name, "hit")
+            return self.generation, self.data  # Refreshed by a caller that finished just before
+
+        record_cache_lookup(self.name, "stale" if self.generation is not None else "miss")
+        blob = bucket.blob(self.blob_name)
+        record_gcs_call("blob_cache", "metadata")
+        try:
+            blob.reload()  # Metadata only
+        except NotFound:
+            raise
+        except Exception as e:
+            if self.generation is None:
+                raise
+            # Keep serving the copy we have and try again after the next interval
+            print(f"Error checking {self.blob_name}, serving cached generation {self.generation}: {str(e)}")
+            self.checked_at = time.monotonic()
+            return self.generation, self.data
+
+        if self.generation is None or blob.generation != self.generation:
+            if self.parse is None:
+                text = blob.download_as_text()
+                record_gcs_call("blob_cache", "download", len(text))
+                data = json.loads(text)
+            else:
+                content = blob.download_as_bytes()
+                record_gcs_call("blob_cache", "download", len(content))
+                data = self.parse(content)
+            # The download refreshes blob.generation in case the file changed since the metadata check
+            self.generation, self.data = blob.generation, data
+            self.reloads += 1
+        self.checked_at = time.monotonic()
+        return self.generation, self.data
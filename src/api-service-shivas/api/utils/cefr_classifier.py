@@ -0,0 +1,110 @@
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+from google.cloud import storage
+from .gcs import create_storage_client
+from .metrics import record_gcs_call
+
+try:
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+except ImportError:  # The API runs without them; /classify then answers 503
+    torch = None
+
+# Class order of the fine-tuned model, as in news_text/level_articles.py
+CEFR_LABELS = ("A1", "A2", "B1", "B2", "C1")
+
+# Pretrained model the fine-tuned weights apply to, and where the weights are
+CLASSIFIER_BASE_MODEL = os.getenv("CLASSIFIER_BASE_MODEL", "microsoft/deberta-v3-small")
+CLASSIFIER_WEIGHTS_BLOB = os.getenv("CLASSIFIER_WEIGHTS_BLOB", "distill_bert_a1_weights.pth")
+CLASSIFIER_WEIGHTS_PATH = os.getenv("CLASSIFIER_WEIGHTS_PATH", "classifier_weights.pth")
+
+# Tokens read from each text; longer texts are truncated, as in the offline leveling
+CLASSIFIER_MAX_TOKENS = int(os.getenv("CLASSIFIER_MAX_TOKENS", "800"))
+
+
+class ClassifierUnavailable(Exception):
+    """Raised when the classifier cannot run (PyTorch or transformers missing, or the weights failed to load)."""
+
+
+def classification(probabilities: Sequence[float]) -> Dict:
+    """Level and per-level probabilities of one text, from the softmax output of the model."""
+    best = max(range(len(CEFR_LABELS)), key=lambda i: probabilities[i])
+    return {"level": CEFR_LABELS[best],
+            "probabilities": {label: round(float(p), 4) for label, p in zip(CEFR_LABELS, probabilities)}}
+
+
+class CefrClassifier:
+    """
+    The DeBERTa CEFR classifier of the offline leveling, for texts sent to the API.
+    The weights are downloaded from the bucket and the model loaded on first use.
+    predict() runs a whole batch of texts in one forward pass, each padded only to the longest text of the batch.
+    """
+
+    def __init__(self, bucket_name: str, storage_client: Optional[storage.Client] = None,
+                 base_model: str = CLASSIFIER_BASE_MODEL, weights_blob: str = CLASSIFIER_WEIGHTS_BLOB,
+                 weights_path: str = CLASSIFIER_WEIGHTS_PATH, max_tokens: int = CLASSIFIER_MAX_TOKENS):
+        self.bucket_name = bucket_name
+        self.storage_client = storage_client
+        self.base_model = base_model
+        self.weights_blob = weights_blob
+        self.weights_path = weights_path
+        self.max_tokens = max_tokens
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return torch is not None
+
+    def _download_weights(self):
+        if os.path.exists(self.weights_path):
+            return
+        if self.storage_client is None:
+            self.storage_client = create_storage_client()
+        blob = self.storage_client.bucket(self.bucket_name).blob(self.weights_blob)
+        partial_path = f"{self.weights_path}.partial"
+        blob.download_to_filename(partial_path)
+        os.replace(partial_path, self.weights_path)
+        record_gcs_call("classifier", "download", os.path.getsize(self.weights_path))
+        print(f"Downloaded classifier weights gs://{self.bucket_name}/{self.weights_blob}")
+
+    def load(self):
+        """Load the tokenizer and model once; later calls return them right away."""
+        if self._model is not None:
+            return self._tokenizer, self._model
+        if torch is None:
+            raise ClassifierUnavailable("PyTorch and transformers are not installed")
+        with self._lock:
+            if self._model is None:
+                try:
+                    self._download_weights()
+                    tokenizer = AutoTokenizer.from_pretrained(self.base_model)
+                    model = AutoModelForSequenceClassification.from_pretrained(self.base_model,
+                                                                               num_labels=len(CEFR_LABELS))
+                    model.load_state_dict(torch.load(self.weights_path, map_location=torch.device("cpu")))
+                    model.eval()
+                except Exception as e:
+                    print(f"Error loading the CEFR classifier: {str(e)}")
+                    raise ClassifierUnavailable(f"Could not load the classifier: {str(e)}")
+                self._tokenizer = tokenizer
+                self._model = model
+                print("CEFR classifier loaded")
+        return self._tokenizer, self._model
+
+    def preload(self):
+        """Load the model ahead of the first request. A failure is logged and retried by the next batch."""
+        try:
+            self.load()
+        except ClassifierUnavailable:
+            pass
+
+    def predict(self, texts: List[str]) -> List[Dict]:
+        """Level and per-level probabilities of each text, in order."""
+        tokenizer, model = self.load()
+        encoded = tokenizer(list(texts), truncation=True, max_length=self.max_tokens, padding="longest",
+                            return_tensors="pt")
+        with torch.inference_mode():
+            logits = model(input_ids=encoded["input_ids"], attention_mask=encoded["attention_mask"]).logits
+        return [classification(row) for row in torch.softmax(logits, dim=-1).tolist()]
@@ -0,0 +1,38 @@
+"""
+Change logs written next to each level bundle by summary_vocab/publish_bundle.py.
+
+A level's changes.json holds its current "version" (a counter of publishes that changed something)
+and one entry per version with the IDs "added", "updated" and "removed" since the version before.
+Only the latest entries are kept, so clients that synced too long ago get the whole level again.
+"""
+from typing import Dict, List, Optional
+
+CHANGES_FILE = "changes.json"
+
+
+def changes_between(change_log: Dict, since: int, until: int) -> Optional[Dict[str, List[str]]]:
+    """
+    IDs added, updated and removed between versions `since` and `until` of a level.
+    An item added and then removed in between is left out; one removed and then added back is updated.
+    Returns None if the log no longer covers `since` (or never had it), in which case the client must resync.
+    """
+    entries = change_log["entries"]
+    oldest = entries[0]["version"] if entries else change_log["version"] + 1
+    if since < oldest - 1 or since > change_log["version"]:
+        return None
+
+    existed: Dict[str, bool] = {}  # id -> whether the item existed at `since`, from its first change after it
+    exists: Dict[str, bool] = {}  # id -> whether it exists at `until`
+    for entry in entries:
+        if not since < entry["version"] <= until:
+            continue
+        for before, after, ids in ((False, True, entry["added"]), (True, True, entry["updated"]),
+                                   (True, False, entry["removed"])):
+            for item_id in ids:
+                existed.setdefault(item_id, before)
+                exists[item_id] = after
+    return {
+        "added": [item_id for item_id, now in exists.items() if now and not existed[item_id]],
+        "updated": [item_id for item_id, now in exists.items() if now and existed[item_id]],
+        "removed": [item_id for item_id, now in exists.items() if not now and existed[item_id]],
+    }
@@ -0,0 +1,235 @@
+"""
+Offline scoring of the per-user feeds served by /feed (run by `python -m api.build_feeds`).
+
+Candidates are the items of the user's level that they have not read. Each is scored by how well
+its vocab fits what the user has studied (the vocab of the items they read), aiming for mostly
+familiar words with some new ones, with a small bonus for items listed first. Vocab is hashed into
+bit vectors packed 64 dimensions to a word, and the overlap of a user and an item is the popcount of
+their AND. A batch of users is scored against a chunk of items at a time, keeping only the running
+top FEED_SIZE per user, so memory stays bounded however many items a level has.
+Needs NumPy 2, which the API itself does not.
+"""
+import hashlib
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from google.cloud import storage
+from .feed_store import FEED_BLOB, RECENTLY_READ_KEY, FeedIndex, ItemRef, pack_feeds, read_key
+from .media_manager import LEVELS, MediaManager
+
+# Items kept per user
+FEED_SIZE = int(os.getenv("FEED_SIZE", "50"))
+
+# Vocab words are hashed into this many dimensions (a multiple of 64, packed into uint64 words)
+VOCAB_DIMENSIONS = 2048
+VOCAB_WORDS = VOCAB_DIMENSIONS // 64
+
+# Share of an item's vocab the user should already know
+TARGET_VOCAB_OVERLAP = 0.6
+
+# Weights of the vocab fit and of the item's position in its level listing
+VOCAB_WEIGHT = 1.0
+ORDER_WEIGHT = 0.1
+
+# Users scored together, and user x item cells scored per step (bounds the size of the score arrays)
+USER_BATCH_SIZE = 1024
+SCORE_CHUNK_CELLS = 1 << 20
+
+ID_KEYS = {"article": "id", "video": "video_id"}
+
+
+def vocab_words(item: Dict) -> List[str]:
+    """Words of an item's vocab, which is a "A1: word, word\\nB1: ..." string or a list/dict of words."""
+    vocab = item.get("vocab")
+    if not vocab:
+        return []
+    text = vocab if isinstance(vocab, str) else json.dumps(vocab)
+    return re.findall(r"[a-z][a-z'-]+", text.lower())
+
+
+def vocab_dimensions(words: List[str]) -> np.ndarray:
+    return np.unique(np.fromiter((zlib.crc32(word.encode("utf-8")) % VOCAB_DIMENSIONS for word in words),
+                                 dtype=np.int64, count=len(words)))
+
+
+def pack_dimensions(dimension_sets: List[np.ndarray]) -> np.ndarray:
+    """One row of VOCAB_WORDS uint64 words per set of dimensions, with the bits of those dimensions set."""
+    packed = np.zeros((len(dimension_sets), VOCAB_DIMENSIONS // 8), dtype=np.uint8)
+    for start in range(0, len(dimension_sets), USER_BATCH_SIZE):
+        block = dimension_sets[start:start + USER_BATCH_SIZE]
+        bits = np.zeros((len(block), VOCAB_DIMENSIONS), dtype=bool)
+        for row, dims in enumerate(block):
+            bits[row, dims] = True
+        packed[start:start + len(block)] = np.packbits(bits, axis=1)
+    return packed.view(np.uint64)
+
+
+class LevelCandidates:
+    """The items of one level as bit-packed vocab vectors."""
+
+    def __init__(self, indexes: List[int], dimensions: List[np.ndarray]):
+        self.indexes = np.asarray(indexes, dtype=np.int32)  # Position in the level -> global item index
+        self.bits = pack_dimensions(dimensions)  # (items, VOCAB_WORDS)
+        self.sizes = np.maximum(np.fromiter((len(dims) for dims in dimensions), dtype=np.float32,
+                                            count=len(dimensions)), 1.0)
+        # Items listed first get the full order bonus, the last ones none
+        self.order_bonus = (ORDER_WEIGHT * (1.0 - np.arange(len(indexes)) / max(len(indexes), 1))).astype(np.float32)
+
+    def overlap(self, studied: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """Share of the vocab of items [start, stop) each row of packed `studied` vocab covers, (users, items)."""
+        common = np.zeros((len(studied), stop - start), dtype=np.uint16)
+        for word in range(VOCAB_WORDS):
+            common += np.bitwise_count(studied[:, word, None] & self.bits[None, start:stop, word])
+        return common / self.sizes[start:stop]
+
+
+def top_positions(candidates: LevelCandidates, studied: np.ndarray, read_rows: np.ndarray, read_columns: np.ndarray,
+                  k: int) -> np.ndarray:
+    """
+    Positions in the level of the k best scored items of each user, best first, -1 past the unread items.
+    Items are scored a chunk at a time and merged into a running top k.
+    """
+    users = len(studied)
+    best_scores = np.full((users, k), -np.inf, dtype=np.float32)
+    best = np.full((users, k), -1, dtype=np.int64)
+    chunk = max(k, SCORE_CHUNK_CELLS // users)
+    for start in range(0, len(candidates.indexes), chunk):
+        stop = min(start + chunk, len(candidates.indexes))
+        overlap = candidates.overlap(studied, start, stop)
+        scores = VOCAB_WEIGHT * (1.0 - np.abs(overlap - TARGET_VOCAB_OVERLAP)) + candidates.order_bonus[start:stop]
+        in_chunk = (read_columns >= start) & (read_columns < stop)
+        scores[read_rows[in_chunk], read_columns[in_chunk] - start] = -np.inf  # Already read
+
+        merged_scores = np.concatenate([best_scores, scores.astype(np.float32)], axis=1)
+        merged = np.concatenate([best, np.broadcast_to(np.arange(start, stop), scores.shape)], axis=1)
+        top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best = np.take_along_axis(merged, top, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best = np.take_along_axis(best, order, axis=1)
+    best[np.isneginf(np.take_along_axis(best_scores, order, axis=1))] = -1
+    return best
+
+
+def catalog_refs(catalog: Dict[str, Dict[str, List[Dict]]]) -> Tuple[List[ItemRef], List[Dict]]:
+    """Flatten {kind: {level: items}} into item refs and items, in a stable order."""
+    refs, items = [], []
+    for kind in sorted(catalog):
+        for level in sorted(catalog[kind]):
+            for item in catalog[kind][level]:
+                refs.append((kind, level, str(item.get(ID_KEYS[kind]))))
+                items.append(item)
+    return refs, items
+
+
+def catalog_version(refs: List[ItemRef], items: List[Dict]) -> str:
+    digest = hashlib.sha256()
+    for ref, item in zip(refs, items):
+        digest.update(json.dumps([ref, item.get("vocab")], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def user_fingerprint(level: str, recently_read: List[str]) -> str:
+    """Changes whenever anything the user's feed depends on changes."""
+    return hashlib.sha256(json.dumps([level, recently_read]).encode("utf-8")).hexdigest()[:16]
+
+
+def build_feeds(catalog: Dict[str, Dict[str, List[Dict]]], users: Iterable[Dict],
+                previous: Optional[FeedIndex] = None, feed_size: int = FEED_SIZE) -> Tuple[bytes, Dict]:
+    """
+    Score the feed of every user with a level and pack them with pack_feeds.
+    With the `previous` feeds of the same catalog, only users whose level or reading history changed
+    are scored again. Returns (packed feeds, counts of users scored and reused).
+    """
+    refs, items = catalog_refs(catalog)
+    version = catalog_version(refs, items)
+    dimensions = [vocab_dimensions(vocab_words(item)) for item in items]
+    index_of_read = {read_key(kind, item_id): index for index, (kind, _, item_id) in enumerate(refs)}
+
+    levels: Dict[str, LevelCandidates] = {}
+    for level in LEVELS:
+        indexes = [index for index, ref in enumerate(refs) if ref[1] == level]
+        levels[level] = LevelCandidates(indexes, [dimensions[index] for index in indexes])
+
+    reusable = (previous is not None and previous.header.get("catalog_version") == version
+                and previous.feed_size == feed_size)
+    previous_rows = np.asarray(previous.rows, dtype=np.int32).reshape(-1, feed_size) if reusable else None
+    previous_fingerprints = previous.header.get("fingerprints", []) if reusable else []
+
+    usernames, fingerprints, histories, user_levels = [], [], [], []
+    for record in users:
+        metadata = record.get("metadata", {})
+        level = metadata.get("level")
+        if level not in levels:
+            continue  # No level yet: /feed falls back to the level listing
+        recently_read = [key for key in metadata.get(RECENTLY_READ_KEY, []) if isinstance(key, str)]
+        usernames.append(record["username"])
+        fingerprints.append(user_fingerprint(level, recently_read))
+        histories.append([index_of_read[key] for key in recently_read if key in index_of_read])
+        user_levels.append(level)
+
+    rows = np.full((len(usernames), feed_size), -1, dtype=np.int32)
+    to_score: Dict[str, List[int]] = {level: [] for level in levels}
+    reused = 0
+    for user, username in enumerate(usernames):
+        previous_row = previous.row_of.get(username) if reusable else None
+        if previous_row is not None and previous_fingerprints[previous_row] == fingerprints[user]:
+            rows[user] = previous_rows[previous_row]
+            reused += 1
+        else:
+            to_score[user_levels[user]].append(user)
+
+    for level, level_users in to_score.items():
+        candidates = levels[level]
+        if not level_users or not len(candidates.indexes):
+            continue
+        position_in_level = {int(index): position for position, index in enumerate(candidates.indexes)}
+        k = min(feed_size, len(candidates.indexes))
+        for start in range(0, len(level_users), USER_BATCH_SIZE):
+            batch = level_users[start:start + USER_BATCH_SIZE]
+            studied = pack_dimensions([np.concatenate([dimensions[index] for index in histories[user]] or
+                                                      [np.zeros(0, dtype=np.int64)]) for user in batch])
+            read_rows, read_columns = [], []
+            for row, user in enumerate(batch):
+                for index in histories[user]:
+                    if index in position_in_level:
+                        read_rows.append(row)
+                        read_columns.append(position_in_level[index])
+
+            top = top_positions(candidates, studied, np.asarray(read_rows, dtype=np.int64),
+                                np.asarray(read_columns, dtype=np.int64), k)
+            rows[batch, :k] = np.where(top >= 0, candidates.indexes[top], -1)
+
+    header = {
+        "created_at": datetime.utcnow().isoformat(),
+        "catalog_version": version,
+        "feed_size": feed_size,
+        "items": refs,
+        "users": usernames,
+        "fingerprints": fingerprints,
+    }
+    packed = pack_feeds(header, rows.astype("<i4").tobytes())
+    return packed, {"users": len(usernames), "scored": len(usernames) - reused, "reused": reused}
+
+
+def publish_feeds(storage_client: storage.Client, bucket_name: str, users: Iterable[Dict],
+                  media_manager: MediaManager, full: bool = False, feed_size: int = FEED_SIZE) -> Dict:
+    """Rebuild the feeds from the current catalogs and upload them to FEED_BLOB. Returns the counts of build_feeds."""
+    catalog = {
+        "article": {level: media_manager.article_snapshot(level).items for level in LEVELS},
+        "video": {level: media_manager.transcript_snapshot(level).items for level in LEVELS},
+    }
+    bucket = storage_client.bucket(bucket_name)
+    previous = None
+    if not full:
+        blob = bucket.get_blob(FEED_BLOB)
+        if blob is not None:
+            previous = FeedIndex(blob.download_as_bytes())
+    packed, counts = build_feeds(catalog, users, previous, feed_size)
+    bucket.blob(FEED_BLOB).upload_from_string(packed, content_type="application/octet-stream")
+    return counts
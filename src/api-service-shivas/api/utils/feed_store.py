@@ -0,0 +1,62 @@
+"""
+Storage format of the precomputed per-user feeds.
+
+One blob holds every feed: a 4-byte little-endian header length, a JSON header, then one row of
+`feed_size` int32 item indexes per user (-1 pads short feeds). Serving a feed is a dict lookup
+and a slice of the rows, with no parsing per user.
+"""
+import json
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+FEED_BLOB = "feeds/feeds.bin"
+
+# (kind, level, item id), kind being "article" or "video"
+ItemRef = Tuple[str, str, str]
+
+# Metadata key holding the items a user opened, most recent first ("article:12", "video:abc")
+RECENTLY_READ_KEY = "recently_read"
+
+# Entries kept in that list
+RECENTLY_READ_LIMIT = 50
+
+
+def read_key(kind: str, item_id: str) -> str:
+    return f"{kind}:{item_id}"
+
+
+def pack_feeds(header: Dict, rows: bytes) -> bytes:
+    """
+    Serialize the feeds. `header` holds "feed_size", "items" (the ItemRefs the rows index into) and
+    "users" (one username per row, in row order); `rows` are the little-endian int32 rows.
+    """
+    encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return len(encoded).to_bytes(4, "little") + encoded + rows
+
+
+class FeedIndex:
+    """Parsed feeds blob."""
+
+    def __init__(self, data: bytes):
+        header_length = int.from_bytes(data[:4], "little")
+        self.header = json.loads(data[4:4 + header_length])
+        self.feed_size: int = self.header["feed_size"]
+        self.items: List[ItemRef] = [tuple(item) for item in self.header["items"]]
+        self.users: List[str] = self.header["users"]
+        self.row_of: Dict[str, int] = {username: row for row, username in enumerate(self.users)}
+        self.rows = array("i")
+        self.rows.frombytes(data[4 + header_length:])
+        if sys.byteorder != "little":
+            self.rows.byteswap()
+
+    def row(self, username: str) -> Optional[List[int]]:
+        """Item indexes of a user's feed, best first, or None if the user has no feed."""
+        row = self.row_of.get(username)
+        if row is None:
+            return None
+        return [index for index in self.rows[row * self.feed_size:(row + 1) * self.feed_size] if index >= 0]
+
+    def feed_for(self, username: str) -> Optional[List[ItemRef]]:
+        indexes = self.row(username)
+        return None if indexes is None else [self.items[index] for index in indexes]
@@ -0,0 +1,46 @@
+import hashlib
+from fastapi import Request, Response
+
+# Listings are per user, so only the browser may cache them, and it must revalidate every time
+LISTING_CACHE_CONTROL = "private, no-cache"
+# Item bodies only change when the publish step runs
+DETAIL_CACHE_CONTROL = "private, max-age=300"
+# The diagnostic test is the same for everybody
+DIAGNOSTIC_CACHE_CONTROL = "public, max-age=60"
+
+CONTENT_ENCODINGS = ("gzip", "br")
+
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from everything the response body depends on."""
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """ETag of a content-encoded variant of a representation."""
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _strip_encoding(etag: str) -> str:
+    for encoding in CONTENT_ENCODINGS:
+        if etag.endswith(f'-{encoding}"'):
+            return etag[:-len(encoding) - 2] + '"'
+    return etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison, as RFC 9110 requires).
+    ETags of compressed variants match the ETag of the representation they were encoded from.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in (_strip_encoding(candidate.removeprefix("W/")) for candidate in candidates)
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """Empty 304 response that keeps the validators the client should store."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
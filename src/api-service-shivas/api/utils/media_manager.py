@@ -1,12 +1,170 @@
+import contextvars
+import hashlib
 import json
+import os
+import threading
+import time
 import traceback
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Optional, Tuple
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from google.cloud import storage
+from .blob_cache import VersionedBlobCache
+from .change_log import CHANGES_FILE
+from .metrics import record_cache_lookup, record_gcs_call
+from .single_flight import SingleFlight
+
+# How long (in seconds) a level catalog is served from memory before a request
+# triggers a background check of the bucket listing for changed blob generations.
+CATALOG_TTL_SECONDS = float(os.getenv("MEDIA_CATALOG_TTL_SECONDS", "60"))
+
+# Maximum number of blobs downloaded at the same time by one MediaManager
+FETCH_CONCURRENCY = int(os.getenv("MEDIA_FETCH_CONCURRENCY", "16"))
+
+LEVELS = ["A1", "A2", "B1", "B2", "C1"]
+
+# Default shape of listing items: enough for a media card, full bodies come from the detail routes
+ARTICLE_LISTING_FIELDS = ("id", "Title", "summary")
+TRANSCRIPT_LISTING_FIELDS = ("video_id", "video_name", "summary")
+
+# Distinct field projections cached per catalog snapshot
+MAX_CACHED_PROJECTIONS = 16
+
+# Consolidated per-level bundles written by summary_vocab/publish_bundle.py
+BUNDLE_FOLDER = "bundles"
+
+# Index of every item of a module across levels, next to its bundles: item id -> level and byte range
+ID_INDEX_FILE = "ids.json"
+
+# How often (in seconds) a module's id index is checked for a new version
+ID_INDEX_CHECK_INTERVAL_SECONDS = float(os.getenv("ID_INDEX_CHECK_INTERVAL_SECONDS", "30"))
+
+# How often (in seconds) a level's change log is checked for a new version
+CHANGE_LOG_CHECK_INTERVAL_SECONDS = float(os.getenv("CHANGE_LOG_CHECK_INTERVAL_SECONDS", "30"))
+
+# (level, item, version of the content it was read from)
+ItemLocation = Tuple[str, Dict, str]
+
+
+class UnknownLevel(Exception):
+    """Raised for a level that is not one of LEVELS. No catalog is ever created or cached for it."""
+
+
+def check_level(level: str) -> str:
+    """Return `level`, or raise UnknownLevel if there is no content for it."""
+    if level not in LEVELS:
+        raise UnknownLevel(f"Unknown level '{level}'")
+    return level
+
+
+class CatalogSnapshot:
+    """One immutable version of a level catalog. Refreshes replace the whole snapshot."""
+
+    def __init__(self, items: List[Dict], id_key: str, version: Optional[str], manifest: Optional[Dict] = None):
+        self.items = items  # Items in bucket listing order
+        self.by_id = {str(item.get(id_key)): item for item in items}  # str(item[id_key]) -> item
+        self.version = version
+        # Generation of the bundle content and version of the level's change log; None without a bundle
+        self.content_generation: Optional[int] = manifest.get("content_generation") if manifest else None
+        self.change_version: Optional[int] = manifest.get("change_version") if manifest else None
+        self._projections: Dict[Tuple[str, ...], List[Dict]] = {}  # fields -> projected items
+
+    def project(self, fields: Tuple[str, ...]) -> List[Dict]:
+        """Return the items reduced to the given fields, cached for the lifetime of the snapshot."""
+        projected = self._projections.get(fields)
+        if projected is None:
+            projected = [{field: item[field] for field in fields if field in item} for item in self.items]
+            if len(self._projections) < MAX_CACHED_PROJECTIONS:
+                self._projections[fields] = projected
+        return projected
+
+    def page(self, fields: Tuple[str, ...], offset: int, limit: int) -> Tuple[List[Dict], Optional[int], int]:
+        """
+        Return one page of projected items.
+        Returns (items, offset of the next page or None on the last page, total item count).
+        """
+        projected = self.project(fields)
+        next_offset = offset + limit if offset + limit < len(projected) else None
+        return projected[offset:offset + limit], next_offset, len(projected)
+
+    def iter_items(self, fields: Optional[Tuple[str, ...]] = None) -> Iterator[Dict]:
+        """Iterate over the items, optionally reducing each to the given fields."""
+        if not fields:
+            return iter(self.items)
+        return ({field: item[field] for field in fields if field in item} for item in self.items)
+
+
+class LevelCatalog:
+    """Tracks the blobs stored under one level prefix and the current snapshot built from them."""
+
+    def __init__(self, folder_prefix: str, id_key: str):
+        self.folder_prefix = folder_prefix
+        self.id_key = id_key
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self.docs_by_blob: Dict[str, Dict] = {}  # blob name -> parsed item
+        self.generations: Dict[str, int] = {}  # blob name -> blob generation
+        self.failures: Dict[str, str] = {}  # blob name -> error from the last refresh
+        self.checked_at = 0.0
+        self.refresh_lock = threading.Lock()  # Held while a rebuild is in flight
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.snapshot.version if self.snapshot else None
+
+    @property
+    def items(self) -> List[Dict]:
+        return self.snapshot.items if self.snapshot else []
+
+    @property
+    def by_id(self) -> Dict[str, Dict]:
+        return self.snapshot.by_id if self.snapshot else {}
+
+    def is_stale(self, ttl: float) -> bool:
+        return time.monotonic() - self.checked_at >= ttl
+
+    def rebuild(self, docs_by_blob: Dict[str, Dict], generations: Dict[str, int]):
+        """Replace the snapshot with the given parsed blobs and their generations."""
+        items = [docs_by_blob[name] for name in generations if name in docs_by_blob]
+        self._swap(items, docs_by_blob, generations)
+
+    def rebuild_from_bundle(self, items: List[Dict], manifest_name: str, manifest_generation: int,
+                            manifest: Optional[Dict] = None):
+        """Replace the snapshot with the items of a level bundle."""
+        self._swap(items, {}, {manifest_name: manifest_generation}, manifest)
+
+    def _swap(self, items: List[Dict], docs_by_blob: Dict[str, Dict], generations: Dict[str, int],
+              manifest: Optional[Dict] = None):
+        self.docs_by_blob, self.generations = docs_by_blob, generations
+        # Readers only ever see a complete snapshot
+        self.snapshot = CatalogSnapshot(items, self.id_key, self.compute_version(generations), manifest)
+
+    @staticmethod
+    def compute_version(generations: Dict[str, int]) -> str:
+        """Derive a stable version string from the blob names and generations."""
+        digest = hashlib.sha1()
+        for name in sorted(generations):
+            digest.update(f"{name}:{generations[name]}\n".encode("utf-8"))
+        return digest.hexdigest()
+
 
 class MediaManager:
-    def __init__(self, bucket_name: str):
+    def __init__(self, bucket_name: str, catalog_ttl: float = CATALOG_TTL_SECONDS,
+                 fetch_concurrency: int = FETCH_CONCURRENCY, storage_client: Optional[storage.Client] = None,
+                 id_index_check_interval: float = ID_INDEX_CHECK_INTERVAL_SECONDS,
+                 change_log_check_interval: float = CHANGE_LOG_CHECK_INTERVAL_SECONDS):
         self.bucket_name = bucket_name
-        self._storage_client = None  # Delay client initialization
+        self._storage_client = storage_client  # Created lazily unless a shared client is passed in
+        self.catalog_ttl = catalog_ttl
+        self.fetch_concurrency = max(1, fetch_concurrency)
+        self._fetch_executor = None
+        self._catalogs: Dict[str, LevelCatalog] = {}
+        self._catalog_lock = threading.Lock()
+        self._cold_loads = SingleFlight("media_catalog")  # First loads, by folder prefix
+        self.id_index_check_interval = id_index_check_interval
+        self.change_log_check_interval = change_log_check_interval
+        # Id indexes and change logs written by the publish step, by blob name
+        self._published: Dict[str, VersionedBlobCache] = {}
+        self._missing_at: Dict[str, float] = {}  # blob name -> when it was last found missing
 
     @property
     def storage_client(self):
@@ -14,55 +172,415 @@ class MediaManager:
             self._storage_client = storage.Client()  # Initialize lazily
         return self._storage_client
 
+    @storage_client.setter
+    def storage_client(self, client):
+        self._storage_client = client
+
+    def _list_json_blobs(self, folder_prefix: str) -> List[storage.Blob]:
+        """List the JSON blobs stored under a folder prefix."""
+        bucket = self.storage_client.bucket(self.bucket_name)
+        blobs = [blob for blob in bucket.list_blobs(prefix=folder_prefix) if blob.name.endswith(".json")]
+        record_gcs_call("media", "list")
+        return blobs
+
+    @property
+    def fetch_executor(self) -> ThreadPoolExecutor:
+        """Shared download pool; its size caps concurrent GCS downloads across all refreshes."""
+        if self._fetch_executor is None:
+            self._fetch_executor = ThreadPoolExecutor(max_workers=self.fetch_concurrency,
+                                                      thread_name_prefix="media-fetch")
+        return self._fetch_executor
+
+    def _download_json_blobs(self, blobs: List[storage.Blob]) -> Tuple[List[Optional[Dict]], Dict[str, str]]:
+        """
+        Download and parse blobs concurrently.
+        Returns the parsed documents in the same order as the blobs (None where a blob failed)
+        and a dict of blob name -> error for every blob that could not be fetched.
+        """
+        def fetch(blob):
+            text = blob.download_as_text()
+            record_gcs_call("media", "download", len(text))
+            return json.loads(text)
+
+        if self.fetch_concurrency == 1 or len(blobs) <= 1:
+            futures = None
+        else:
+            # Each download runs in the caller's context so it is counted against the request that needed it
+            futures = [self.fetch_executor.submit(contextvars.copy_context().run, fetch, blob) for blob in blobs]
+
+        docs = []
+        failures = {}
+        for i, blob in enumerate(blobs):
+            try:
+                docs.append(futures[i].result() if futures else fetch(blob))
+            except Exception as e:
+                docs.append(None)
+                failures[blob.name] = str(e)
+                print(f"Error fetching {blob.name}: {str(e)}")
+        return docs, failures
+
     def _fetch_json_files_from_gcp(self, folder_prefix: str) -> List[Dict]:
-        """Fetch and parse JSON files from a specific folder in the GCP bucket."""
+        """
+        Fetch and parse JSON files from a specific folder in the GCP bucket.
+        Blobs that fail to download or parse are skipped instead of failing the whole listing.
+        """
         try:
-            bucket = self.storage_client.bucket(self.bucket_name)
-            blobs = bucket.list_blobs(prefix=folder_prefix)
+            blobs = self._list_json_blobs(folder_prefix)
+            docs, _ = self._download_json_blobs(blobs)
+            return [doc for doc in docs if doc is not None]
+        except Exception as e:
+            print(f"Error fetching data from GCP: {str(e)}")
+            traceback.print_exc()
+            return []
+
+    def _get_bundle_manifest_blob(self, folder_prefix: str) -> Optional[storage.Blob]:
+        """Fetch the metadata of a level's bundle manifest, or None if no bundle was published."""
+        bucket = self.storage_client.bucket(self.bucket_name)
+        blob = bucket.get_blob(f"{BUNDLE_FOLDER}/{folder_prefix}manifest.json")
+        record_gcs_call("media", "metadata")
+        return blob
 
-            data = []
+    def _refresh_from_bundle(self, catalog: LevelCatalog) -> bool:
+        """
+        Load a catalog from its published bundle: one small manifest plus one content object.
+        Returns False if the level has no bundle.
+        """
+        manifest_blob = self._get_bundle_manifest_blob(catalog.folder_prefix)
+        if manifest_blob is None:
+            return False
+        if catalog.version is not None and catalog.generations == {manifest_blob.name: manifest_blob.generation}:
+            return True  # Bundle unchanged since the last load
+
+        manifest_text = manifest_blob.download_as_text()
+        record_gcs_call("media", "download", len(manifest_text))
+        manifest = json.loads(manifest_text)
+        bucket = self.storage_client.bucket(self.bucket_name)
+        content_blob = bucket.blob(f"{BUNDLE_FOLDER}/{catalog.folder_prefix}content.jsonl")
+        content = content_blob.download_as_bytes(if_generation_match=manifest.get("content_generation"))
+        record_gcs_call("media", "download", len(content))
+        if hashlib.sha256(content).hexdigest() != manifest.get("content_sha256"):
+            raise Exception(f"Bundle content for {catalog.folder_prefix} does not match its manifest")
+
+        items = [json.loads(line) for line in content.splitlines() if line.strip()]
+        catalog.rebuild_from_bundle(items, manifest_blob.name, manifest_blob.generation, manifest)
+        print(f"Loaded {len(items)} items from bundle {manifest_blob.name} (version {catalog.version[:12]})")
+        return True
+
+    def _refresh_from_blobs(self, catalog: LevelCatalog):
+        """
+        Load a catalog from the individual JSON blobs of a level.
+        Only one listing is made; blobs are downloaded only when their generation changed.
+        """
+        blobs = self._list_json_blobs(catalog.folder_prefix)
+        generations = {blob.name: blob.generation for blob in blobs}
+
+        if catalog.version is None or generations != catalog.generations:
+            docs_by_blob = {}
+            changed = []
             for blob in blobs:
-                if blob.name.endswith(".json"):  # Process only JSON files
-                    content = blob.download_as_text()
-                    parsed_content = json.loads(content)
-                    data.append(parsed_content)
-            return data
+                cached = catalog.docs_by_blob.get(blob.name)
+                if cached is not None and catalog.generations.get(blob.name) == blob.generation:
+                    docs_by_blob[blob.name] = cached
+                else:
+                    changed.append(blob)
+
+            docs, failures = self._download_json_blobs(changed)
+            for blob, doc in zip(changed, docs):
+                if doc is not None:
+                    docs_by_blob[blob.name] = doc
+                elif blob.name in catalog.docs_by_blob:
+                    # Keep serving the previous copy; the stale generation makes the next refresh retry it
+                    docs_by_blob[blob.name] = catalog.docs_by_blob[blob.name]
+                    generations[blob.name] = catalog.generations[blob.name]
+                else:
+                    del generations[blob.name]
+
+            catalog.failures = failures
+            catalog.rebuild(docs_by_blob, generations)
+            print(f"Loaded {len(catalog.items)} items from {catalog.folder_prefix} (version {catalog.version[:12]})")
+
+    def _refresh_catalog(self, catalog: LevelCatalog):
+        """Bring a catalog up to date with the bucket, preferring the level bundle when one exists."""
+        if not self._refresh_from_bundle(catalog):
+            self._refresh_from_blobs(catalog)
+        catalog.checked_at = time.monotonic()
+
+    def _catalog_for(self, folder_prefix: str, id_key: str) -> LevelCatalog:
+        # Prefixes are "<module>/<level>/"; a catalog made for any other level would be kept and refreshed forever
+        check_level(folder_prefix.rstrip("/").rsplit("/", 1)[-1])
+        with self._catalog_lock:
+            catalog = self._catalogs.get(folder_prefix)
+            if catalog is None:
+                catalog = LevelCatalog(folder_prefix, id_key)
+                self._catalogs[folder_prefix] = catalog
+            return catalog
+
+    def refresh_catalog(self, catalog: LevelCatalog) -> bool:
+        """
+        Rebuild a catalog unless another rebuild of it is already in flight.
+        Returns True if this call performed the refresh.
+        """
+        if not catalog.refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._refresh_catalog(catalog)
+            return True
+        finally:
+            catalog.refresh_lock.release()
+
+    def _refresh_in_background(self, catalog: LevelCatalog):
+        """Start a background rebuild of a stale catalog; concurrent triggers collapse into one."""
+        if not catalog.refresh_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._refresh_catalog(catalog)
+            except Exception as e:
+                print(f"Error refreshing {catalog.folder_prefix}: {str(e)}")
+                traceback.print_exc()
+            finally:
+                catalog.refresh_lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _load_cold(self, catalog: LevelCatalog):
+        with catalog.refresh_lock:
+            if catalog.version is None:  # refresh_all may have loaded it while we waited
+                self._refresh_catalog(catalog)
+
+    def get_catalog(self, folder_prefix: str, id_key: str) -> LevelCatalog:
+        """
+        Return the catalog for a folder prefix.
+        Only the first load waits on GCS, and concurrent requests for a cold catalog share that load (and its
+        error, if it fails). Afterwards a stale snapshot is served while it is rebuilt in the background.
+        """
+        catalog = self._catalog_for(folder_prefix, id_key)
+        if catalog.version is None:
+            record_cache_lookup("media_catalog", "miss")
+            self._cold_loads.do(folder_prefix, self._load_cold, catalog)
+        elif catalog.is_stale(self.catalog_ttl):
+            record_cache_lookup("media_catalog", "stale")
+            self._refresh_in_background(catalog)
+        else:
+            record_cache_lookup("media_catalog", "hit")
+        return catalog
+
+    def refresh_all(self, levels: List[str] = LEVELS):
+        """Refresh the article and transcript catalogs of every level, loading any that are still cold."""
+        for level in levels:
+            self._catalog_for(f"bbc_news/{level}/", "id")
+            self._catalog_for(f"yt_transcripts/{level}/", "video_id")
+
+        for catalog in list(self._catalogs.values()):
+            try:
+                self.refresh_catalog(catalog)
+            except Exception as e:
+                print(f"Error refreshing {catalog.folder_prefix}: {str(e)}")
+                traceback.print_exc()
+
+    def _get_snapshot(self, folder_prefix: str, id_key: str) -> CatalogSnapshot:
+        try:
+            return self.get_catalog(folder_prefix, id_key).snapshot
+        except UnknownLevel:
+            raise
         except Exception as e:
             print(f"Error fetching data from GCP: {str(e)}")
             traceback.print_exc()
-            return []
+            # Serve the last good snapshot if one exists
+            catalog = self._catalogs.get(folder_prefix)
+            return catalog.snapshot if catalog and catalog.snapshot else CatalogSnapshot([], id_key, None)
+
+    def article_snapshot(self, level: str = "B2") -> CatalogSnapshot:
+        """Current snapshot of the articles of a level. Raises UnknownLevel for a level not in LEVELS."""
+        return self._get_snapshot(f"bbc_news/{level}/", "id")
+
+    def transcript_snapshot(self, level: str = "B2") -> CatalogSnapshot:
+        """Current snapshot of the video transcripts of a level, like article_snapshot."""
+        return self._get_snapshot(f"yt_transcripts/{level}/", "video_id")
 
     def get_video_transcripts(self, level: str = "B2") -> List[Dict]:
         """
         Fetch video transcripts from the folder corresponding to the user's level.
         Default level is B2.
         """
-        folder_prefix = f"yt_transcripts/{level}/"
-        return self._fetch_json_files_from_gcp(folder_prefix)
+        return self.transcript_snapshot(level).items
 
     def get_articles(self, level: str = "B2") -> List[Dict]:
         """
         Fetch articles from the folder corresponding to the user's level.
         Default level is B2.
         """
-        folder_prefix = f"bbc_news/{level}/"
-        return self._fetch_json_files_from_gcp(folder_prefix)
+        return self.article_snapshot(level).items
+
+    def list_articles(self, level: str = "B2", fields: Tuple[str, ...] = ARTICLE_LISTING_FIELDS,
+                      offset: int = 0, limit: int = 20) -> Tuple[List[Dict], Optional[int], int]:
+        """List one page of articles for a level, reduced to the given fields."""
+        return self.article_snapshot(level).page(fields, offset, limit)
+
+    def list_video_transcripts(self, level: str = "B2", fields: Tuple[str, ...] = TRANSCRIPT_LISTING_FIELDS,
+                               offset: int = 0, limit: int = 20) -> Tuple[List[Dict], Optional[int], int]:
+        """List one page of video transcripts for a level, reduced to the given fields."""
+        return self.transcript_snapshot(level).page(fields, offset, limit)
+
+    def iter_articles(self, level: str = "B2", fields: Optional[Tuple[str, ...]] = None) -> Iterator[Dict]:
+        """Iterate over every article of a level (full items unless fields are given)."""
+        return self.article_snapshot(level).iter_items(fields)
+
+    def iter_video_transcripts(self, level: str = "B2", fields: Optional[Tuple[str, ...]] = None) -> Iterator[Dict]:
+        """Iterate over every video transcript of a level (full items unless fields are given)."""
+        return self.transcript_snapshot(level).iter_items(fields)
+
+    def _published_cache(self, blob_name: str, check_interval: float, name: str) -> VersionedBlobCache:
+        cache = self._published.get(blob_name)
+        if cache is None:
+            with self._catalog_lock:
+                cache = self._published.setdefault(blob_name, VersionedBlobCache(blob_name, check_interval, name=name))
+        return cache
+
+    def _get_published(self, blob_name: str, check_interval: float, name: str) -> Optional[Tuple[int, Dict]]:
+        """
+        (generation, content) of a JSON file written by the publish step, or None if it is not published.
+        A missing file is only looked for again once `check_interval` has passed.
+        """
+        missing_at = self._missing_at.get(blob_name)
+        if missing_at is not None and time.monotonic() - missing_at < check_interval:
+            return None
+        try:
+            published = self._published_cache(blob_name, check_interval, name).get(
+                self.storage_client.bucket(self.bucket_name))
+        except NotFound:
+            self._missing_at[blob_name] = time.monotonic()
+            return None
+        self._missing_at.pop(blob_name, None)
+        return published
+
+    def _get_id_index(self, module: str) -> Optional[Dict]:
+        """The id index of a module, or None if none is published."""
+        published = self._get_published(f"{BUNDLE_FOLDER}/{module}/{ID_INDEX_FILE}", self.id_index_check_interval,
+                                        "id_index")
+        return published[1] if published is not None else None
+
+    def get_change_log(self, module: str, level: str) -> Optional[Tuple[int, Dict]]:
+        """(generation, content) of a level's change log (see api/utils/change_log.py), or None if none is published."""
+        return self._get_published(f"{BUNDLE_FOLDER}/{module}/{level}/{CHANGES_FILE}",
+                                   self.change_log_check_interval, "change_log")
+
+    def _index_entry(self, module: str, item_id: str) -> Optional[Tuple[str, int, int, Dict]]:
+        """(level, byte offset, byte length, level content) of an item in the module's id index, or None."""
+        id_index = self._get_id_index(module)
+        entry = id_index["ids"].get(item_id) if id_index is not None else None
+        if entry is None:
+            return None
+        level, offset, length = entry
+        return level, offset, length, id_index["levels"][level]
+
+    def _find_indexed(self, module: str, id_key: str, item_id: str) -> Optional[ItemLocation]:
+        """
+        Find an item of any level through the module's id index.
+        The item is taken from its level's snapshot when that holds the indexed content, and is otherwise
+        read from the level bundle with one ranged download. Returns None if the index has no such item.
+        """
+        entry = self._index_entry(module, item_id)
+        if entry is None:
+            return None
+        level, offset, length, content = entry
+        version = f"{content['generation']}"
+
+        catalog = self._catalogs.get(f"{module}/{level}/")
+        snapshot = catalog.snapshot if catalog is not None else None
+        if (snapshot is not None and snapshot.content_generation == content["generation"]
+                and item_id in snapshot.by_id):
+            record_cache_lookup("media_item", "hit")
+            return level, snapshot.by_id[item_id], version
+
+        record_cache_lookup("media_item", "miss")
+        blob = self.storage_client.bucket(self.bucket_name).blob(content["content"])
+        data = blob.download_as_bytes(start=offset, end=offset + length - 1,
+                                      if_generation_match=content["generation"])
+        record_gcs_call("media", "range_download", len(data))
+        item = json.loads(data)
+        if str(item.get(id_key)) != item_id:
+            raise Exception(f"Id index of {module} points {item_id} at another item")
+        return level, item, version
+
+    def _lookup_id_index(self, module: str, id_key: str, item_id: str) -> Optional[ItemLocation]:
+        """_find_indexed, with a missing, outdated or failing index treated as not knowing the item."""
+        try:
+            return self._find_indexed(module, id_key, item_id)
+        except PreconditionFailed:
+            # The bundle was republished since the index was read: check the index again on the next lookup
+            self._published_cache(f"{BUNDLE_FOLDER}/{module}/{ID_INDEX_FILE}", self.id_index_check_interval,
+                                  "id_index").expire()
+        except Exception as e:
+            print(f"Error looking up {item_id} in the id index of {module}: {str(e)}")
+            traceback.print_exc()
+        return None
+
+    @staticmethod
+    def _find_in_snapshot(snapshot: CatalogSnapshot, level: str, item_id: str) -> Optional[ItemLocation]:
+        item = snapshot.by_id.get(item_id)
+        return (level, item, snapshot.version) if item is not None else None
+
+    def _find(self, module: str, id_key: str, snapshot_for, item_id: str,
+              level: Optional[str]) -> Optional[ItemLocation]:
+        found = self._lookup_id_index(module, id_key, item_id)
+        if found is None and level is not None:
+            found = self._find_in_snapshot(snapshot_for(level), level, item_id)
+        return found
+
+    def find_article(self, article_id: str, level: Optional[str] = "B2") -> Optional[ItemLocation]:
+        """
+        Find an article by ID in any level: through the id index when one is published, otherwise (or if
+        the index does not know it) in the catalog of `level`, if one is given.
+        Returns (level of the article, article, content version) or None if it does not exist.
+        Raises UnknownLevel for a level not in LEVELS.
+        """
+        return self._find("bbc_news", "id", self.article_snapshot, str(article_id), level)
+
+    def find_video(self, video_id: str, level: Optional[str] = "B2") -> Optional[ItemLocation]:
+        """Find a video transcript by ID in any level, like find_article."""
+        return self._find("yt_transcripts", "video_id", self.transcript_snapshot, str(video_id), level)
+
+    def _locate(self, module: str, snapshot_for, level: Optional[str], item_id: str) -> Optional[Tuple[str, str]]:
+        try:
+            entry = self._index_entry(module, item_id)
+        except Exception as e:
+            print(f"Error looking up {item_id} in the id index of {module}: {str(e)}")
+            entry = None
+        if entry is not None:
+            return entry[0], f"{entry[3]['generation']}"
+        if level is None:
+            return None
+        snapshot = snapshot_for(level)
+        return (level, snapshot.version) if item_id in snapshot.by_id and snapshot.version else None
+
+    def locate_article(self, article_id: str, level: Optional[str] = "B2") -> Optional[Tuple[str, str]]:
+        """
+        (level, content version) of an article, as find_article would return them, without reading the article:
+        the id index and catalogs are only read from memory, unless their check interval has passed.
+        """
+        return self._locate("bbc_news", self.article_snapshot, level, str(article_id))
+
+    def locate_video(self, video_id: str, level: Optional[str] = "B2") -> Optional[Tuple[str, str]]:
+        """(level, content version) of a video transcript, like locate_article."""
+        return self._locate("yt_transcripts", self.transcript_snapshot, level, str(video_id))
 
     def get_article_by_id(self, article_id: str, level: str = "B2") -> Optional[Dict]:
-        """Fetch a single article by ID."""
+        """Fetch a single article by ID, whatever its level."""
         try:
-            articles = self.get_articles(level)  # Fetch all articles
-            return next((article for article in articles if str(article.get("id")) == article_id), None)
+            found = self.find_article(article_id, level)
+            return found[1] if found else None
         except Exception as e:
             print(f"Error fetching article with ID {article_id}: {str(e)}")
             traceback.print_exc()
             return None
-        
+
     def get_video_by_id(self, video_id: str, level: str = "B2") -> Optional[Dict]:
-        """Fetch a single video by ID."""
+        """Fetch a single video by ID, whatever its level."""
         try:
-            videos = self.get_video_transcripts(level)  # Fetch all videos
-            return next((video for video in videos if str(video.get("video_id")) == video_id), None)
+            found = self.find_video(video_id, level)
+            return found[1] if found else None
         except Exception as e:
             print(f"Error fetching video with ID {video_id}: {str(e)}")
             traceback.print_exc()
@@ -0,0 +1,173 @@
+"""
+Prometheus metrics of the API, kept with prometheus_client in one registry served on /metrics.
+
+GCS calls are also attributed to the request that made them through a context variable; StorageIO
+and the media download pool copy the context into their threads.
+"""
+import contextvars
+import time
+from typing import Callable, Dict, Optional, Sequence
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+BYTES_BUCKETS = (0, 1024, 10240, 102400, 1048576, 10485760, 104857600)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+PROMETHEUS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+registry = CollectorRegistry()
+
+REQUESTS = Counter("api_requests_total", "HTTP requests by route, method and status.",
+                   ("route", "method", "status"), registry=registry)
+REQUEST_LATENCY = Histogram("api_request_duration_seconds", "Time to serve a request.", ("route", "method"),
+                            buckets=LATENCY_BUCKETS, registry=registry)
+REQUESTS_IN_FLIGHT = Gauge("api_requests_in_flight", "Requests being served right now.", registry=registry)
+REQUEST_GCS_CALLS = Histogram("api_request_gcs_calls", "GCS calls made while serving one request.", ("route",),
+                              buckets=COUNT_BUCKETS, registry=registry)
+REQUEST_GCS_BYTES = Histogram("api_request_gcs_bytes", "Bytes downloaded from GCS while serving one request.",
+                              ("route",), buckets=BYTES_BUCKETS, registry=registry)
+GCS_CALLS = Counter("gcs_calls_total", "GCS calls by component and operation.", ("component", "operation"),
+                    registry=registry)
+GCS_BYTES = Counter("gcs_downloaded_bytes_total", "Bytes downloaded from GCS by component.", ("component",),
+                    registry=registry)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result (hit, miss, stale).",
+                        ("cache", "result"), registry=registry)
+SINGLE_FLIGHT_CALLS = Counter("single_flight_calls_total",
+                              "Coalesced loads by name; role is leader (ran the load) or shared (joined it).",
+                              ("name", "role"), registry=registry)
+BATCH_QUEUE_DEPTH = Gauge("batch_queue_depth", "Requests waiting for a micro-batch, by batcher.", ("name",),
+                          registry=registry)
+BATCH_SIZE = Histogram("batch_size", "Requests run together in one micro-batch.", ("name",),
+                       buckets=BATCH_SIZE_BUCKETS, registry=registry)
+BATCH_WAIT = Histogram("batch_wait_seconds", "Time a request waited before its micro-batch started.", ("name",),
+                       buckets=LATENCY_BUCKETS, registry=registry)
+BATCH_DURATION = Histogram("batch_duration_seconds", "Time to run one micro-batch.", ("name",),
+                           buckets=LATENCY_BUCKETS, registry=registry)
+
+
+class StoragePoolCollector:
+    """Reports the connection pool of the shared storage client, read when /metrics is scraped."""
+
+    def __init__(self):
+        self.stats: Optional[Callable[[], Dict]] = None
+
+    def collect(self):
+        if self.stats is None:
+            return
+        stats = self.stats()
+        yield GaugeMetricFamily("gcs_pool_maxsize", "Connections kept open per host by the storage client.",
+                                value=stats["pool_maxsize"])
+        yield GaugeMetricFamily("gcs_pool_hosts", "Hosts the storage client keeps a connection pool for.",
+                                value=stats["pool_connections"])
+        opened = CounterMetricFamily("gcs_pool_connections_opened", "Connections opened by a pool, by host.",
+                                     labels=("host",))
+        requests = CounterMetricFamily("gcs_pool_requests", "Requests sent through a pool, by host.", labels=("host",))
+        idle = GaugeMetricFamily("gcs_pool_idle_connections", "Open connections waiting in a pool, by host.",
+                                 labels=("host",))
+        for pool in stats["pools"]:
+            opened.add_metric((pool["host"],), pool["connections_opened"])
+            requests.add_metric((pool["host"],), pool["requests"])
+            idle.add_metric((pool["host"],), pool["idle"])
+        yield from (opened, requests, idle)
+
+
+STORAGE_POOL = StoragePoolCollector()
+registry.register(STORAGE_POOL)
+
+
+def watch_storage_pool(stats: Callable[[], Dict]):
+    """Report the pool described by `stats()` (see PooledHTTPAdapter.stats) on /metrics from now on."""
+    STORAGE_POOL.stats = stats
+
+
+def render() -> bytes:
+    """All metrics in the Prometheus text format, for PROMETHEUS_CONTENT_TYPE."""
+    return generate_latest(registry)
+
+
+class RequestStats:
+    """GCS usage of the request being served."""
+    __slots__ = ("gcs_calls", "gcs_bytes")
+
+    def __init__(self):
+        self.gcs_calls = 0
+        self.gcs_bytes = 0
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request",
+                                                                                       default=None)
+
+
+def record_gcs_call(component: str, operation: str, nbytes: int = 0):
+    """Count one GCS call, globally and for the current request if there is one."""
+    GCS_CALLS.labels(component=component, operation=operation).inc()
+    if nbytes:
+        GCS_BYTES.labels(component=component).inc(nbytes)
+    stats = current_request.get()
+    if stats is not None:
+        stats.gcs_calls += 1
+        stats.gcs_bytes += nbytes
+
+
+def record_cache_lookup(cache: str, result: str):
+    CACHE_LOOKUPS.labels(cache=cache, result=result).inc()
+
+
+def record_single_flight(name: str, role: str):
+    SINGLE_FLIGHT_CALLS.labels(name=name, role=role).inc()
+
+
+def record_batch_queue(name: str, depth: int):
+    BATCH_QUEUE_DEPTH.labels(name=name).set(depth)
+
+
+def record_batch(name: str, size: int, waits: Sequence[float], seconds: float):
+    """Record one micro-batch: its size, how long each of its requests waited and how long it ran."""
+    BATCH_SIZE.labels(name=name).observe(size)
+    batch_wait = BATCH_WAIT.labels(name=name)
+    for wait in waits:
+        batch_wait.observe(wait)
+    BATCH_DURATION.labels(name=name).observe(seconds)
+
+
+class MetricsMiddleware:
+    """
+    Thin ASGI middleware recording latency, status and GCS usage per route into the registry.
+    Routes are labelled with their path template (e.g. /articles/{id}) so label values stay bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            current_request.reset(token)
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            REQUESTS.labels(route=route_label, method=method, status=status).inc()
+            REQUEST_LATENCY.labels(route=route_label, method=method).observe(elapsed)
+            REQUEST_GCS_CALLS.labels(route=route_label).observe(stats.gcs_calls)
+            REQUEST_GCS_BYTES.labels(route=route_label).observe(stats.gcs_bytes)
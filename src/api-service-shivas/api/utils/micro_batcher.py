@@ -0,0 +1,141 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+from .metrics import record_batch, record_batch_queue
+
+# Most requests run together in one batch
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+
+# How long the first request of a batch waits for others to join it
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+
+# Requests allowed to wait for a batch; beyond that new requests are turned away immediately
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "256"))
+
+
+class BatcherBusy(Exception):
+    """Raised when the batch queue is full; the caller should retry later."""
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into micro-batches and runs each batch with one call of
+    run_batch(items) -> results, on a dedicated thread so the event loop stays free.
+
+    A batch starts once it holds max_batch_size requests or its first request has waited max_wait_ms.
+    Batches run one at a time; the next one fills up while the current one runs, so under load
+    batches grow towards max_batch_size without waiting. If run_batch fails, every request of the batch
+    gets its error.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Sequence[Any]], max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS, max_queue: int = BATCH_MAX_QUEUE, name: str = "batch"):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue = max(1, max_queue)
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"batch-{self.name}")
+        return self._executor
+
+    def _ensure_worker(self, loop: asyncio.AbstractEventLoop):
+        """Start the batching task on the running loop (again after a close, or under a new loop in tests)."""
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and return its result once its batch has run."""
+        loop = asyncio.get_running_loop()
+        self._ensure_worker(loop)
+        if self._queue.qsize() >= self.max_queue:
+            raise BatcherBusy(f"Too many requests waiting for {self.name}")
+        future = loop.create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        record_batch_queue(self.name, self._queue.qsize())
+        return await future
+
+    async def _collect(self, batch: list):
+        """Wait for a first request, then take more until the batch is full or the wait is over."""
+        batch.append(await self._queue.get())
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        record_batch_queue(self.name, self._queue.qsize())
+
+    async def _run_batch(self, batch: list):
+        items = [item for item, _, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = await self._loop.run_in_executor(self.executor, self.run_batch, items)
+            if len(results) != len(batch):
+                raise Exception(f"{self.name} returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        record_batch(self.name, len(batch), [started - queued for _, _, queued in batch],
+                     time.perf_counter() - started)
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = []
+                await self._collect(batch)
+                # Requests whose client went away are dropped before they cost any work
+                batch = [entry for entry in batch if not entry[1].done()]
+                if batch:
+                    await self._run_batch(batch)
+        except asyncio.CancelledError:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(BatcherBusy(f"{self.name} is shutting down"))
+            raise
+
+    async def close(self):
+        """Stop batching; requests still waiting fail. The next submit starts again."""
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(BatcherBusy(f"{self.name} is shutting down"))
+        record_batch_queue(self.name, 0)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+import bcrypt
+
+# bcrypt cost factor for new hashes. Existing hashes with another cost are rehashed on the next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Threads hashing at the same time. bcrypt releases the GIL, so each one can use a full core.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+
+# Hash requests allowed to wait for a worker; beyond that new logins are turned away immediately
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+_BCRYPT_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hash queue is full; the caller should retry later."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool with a bounded queue, so a burst of logins
+    costs at most PASSWORD_HASH_WORKERS cores and excess requests fail fast instead of piling up.
+    Async callers await the pool directly (hash_async, verify_async), so a login waiting for a bcrypt
+    worker holds no thread at all; hash and verify block the calling thread and are meant for scripts.
+    """
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = PASSWORD_HASH_WORKERS,
+                 max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.rounds = rounds
+        self.workers = max(1, workers)
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, max_queue))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _submit(self, func, *args) -> Future:
+        """Start func on the pool; its queue slot is released when the work itself has finished."""
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Too many password checks in progress")
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Not when the caller stops waiting: a cancelled login leaves bcrypt running, which still takes a worker
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, func, *args):
+        return self._submit(func, *args).result()
+
+    async def _run_async(self, func, *args):
+        return await asyncio.wrap_future(self._submit(func, *args))
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured cost."""
+        hashed = self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds))
+        return hashed.decode("utf-8")
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self._run(bcrypt.checkpw, password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+    async def hash_async(self, password: str) -> str:
+        hashed = await self._run_async(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds))
+        return hashed.decode("utf-8")
+
+    async def verify_async(self, password: str, hashed_password: str) -> bool:
+        return await self._run_async(bcrypt.checkpw, password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True when a stored hash was made with a different cost than the configured one."""
+        match = _BCRYPT_COST.match(hashed_password)
+        return match is None or int(match.group(1)) != self.rounds
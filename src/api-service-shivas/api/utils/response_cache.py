@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import Request, Response
+from .http_cache import encoded_etag
+from .metrics import record_cache_lookup
+
+# Optional fast encoder and compressor (both in Pipfile.lock); the standard library is used when they are missing
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+    print("orjson is not installed: responses are encoded with the json module")
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+    print("brotli is not installed: responses are only compressed with gzip")
+
+# Number of encoded response bodies kept in memory (oldest are evicted first)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+
+def encode_json(data: Any) -> bytes:
+    """Serialize a JSON-compatible value to UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class EncodedBody:
+    """A response body serialized once, with every compressed variant built up front."""
+
+    def __init__(self, data: Any):
+        identity = encode_json(data)
+        self.variants: Dict[str, bytes] = {"identity": identity}
+        if len(identity) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = gzip.compress(identity, compresslevel=6)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(identity, quality=5)
+
+    def negotiate(self, accept_encoding: str) -> Tuple[str, bytes]:
+        """Pick the smallest variant the client accepts."""
+        accepted = parse_accept_encoding(accept_encoding)
+        candidates = [(len(body), encoding) for encoding, body in self.variants.items()
+                      if encoding == "identity" or accepted.get(encoding, accepted.get("*", 0)) > 0]
+        _, encoding = min(candidates)
+        return encoding, self.variants[encoding]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class ResponseCache:
+    """Small LRU of encoded response bodies keyed by ETag."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, name: str = "response"):
+        self.max_entries = max_entries
+        self.name = name  # Label of the cache in the metrics
+        self._entries: "OrderedDict[str, EncodedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: str, build: Callable[[], Any]) -> EncodedBody:
+        """Return the cached body for a key, building and encoding it on a miss."""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache_lookup(self.name, "hit")
+                return body
+            self.misses += 1
+        record_cache_lookup(self.name, "miss")
+
+        body = EncodedBody(build())  # Encoded outside the lock; a racing duplicate is harmless
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+
+def encoded_response(request: Request, body: EncodedBody, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Send the variant of a cached body that matches the request's Accept-Encoding."""
+    encoding, content = body.negotiate(request.headers.get("accept-encoding", ""))
+    response_headers = dict(headers or {})
+    response_headers["Vary"] = "Accept-Encoding"
+    if encoding != "identity":
+        response_headers["Content-Encoding"] = encoding
+        if "ETag" in response_headers:
+            # Each encoding is a different representation, so it gets its own strong ETag
+            response_headers["ETag"] = encoded_etag(response_headers["ETag"], encoding)
+    return Response(content=content, media_type="application/json", headers=response_headers)
@@ -0,0 +1,170 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+from .media_manager import BUNDLE_FOLDER
+from .metrics import record_gcs_call
+
+# Local folder the search index files of each level are downloaded to
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", os.path.join(tempfile.gettempdir(), "innit-search"))
+
+# How often (in seconds) a level's index is checked for a newly published version
+SEARCH_INDEX_CHECK_INTERVAL_SECONDS = float(os.getenv("SEARCH_INDEX_CHECK_INTERVAL_SECONDS", "60"))
+
+# Bytes of each index file memory-mapped by SQLite instead of read through its page cache
+SEARCH_INDEX_MMAP_BYTES = int(os.getenv("SEARCH_INDEX_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+# Search index published next to each level bundle by summary_vocab/publish_bundle.py
+SEARCH_FILE = "search.db"
+
+# Content kinds that can be searched and the bucket folder of each
+SEARCH_MODULES = {"articles": "bbc_news", "transcripts": "yt_transcripts"}
+
+# Longer queries are cut to this many words
+MAX_QUERY_TERMS = 16
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query matching documents that contain every word.
+    Words are quoted, so FTS5 operators and punctuation in user input are never interpreted.
+    """
+    terms = re.findall(r"\w+", query.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class LevelSearchIndex:
+    """The downloaded search index of one content kind and level, identified by its blob generation."""
+
+    def __init__(self, blob_name: str, path_prefix: str):
+        self.blob_name = blob_name
+        self.path_prefix = path_prefix
+        self.generation: Optional[int] = None
+        self.path: Optional[str] = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()  # Held while checking for and downloading a new generation
+        # Held to swap in a new file and remove the previous one, and to open a connection on the current file,
+        # so a file is never removed between reading its path and opening it
+        self.swap_lock = threading.Lock()
+
+    def is_fresh(self, check_interval: float) -> bool:
+        return self.checked_at > 0 and time.monotonic() - self.checked_at < check_interval
+
+
+class SearchIndex:
+    """
+    BM25-ranked full-text search over articles and transcripts.
+    The publish step builds one SQLite FTS5 file per content kind and level; each is downloaded
+    once per generation and queried read-only and memory-mapped, with one connection per thread.
+    """
+
+    def __init__(self, bucket_name: str, storage_client: storage.Client = None,
+                 index_dir: str = SEARCH_INDEX_DIR, check_interval: float = SEARCH_INDEX_CHECK_INTERVAL_SECONDS):
+        self.bucket_name = bucket_name
+        self._storage_client = storage_client
+        self.index_dir = index_dir
+        self.check_interval = check_interval
+        self._indexes: Dict[Tuple[str, str], LevelSearchIndex] = {}
+        self._indexes_lock = threading.Lock()
+        self._local = threading.local()  # Per thread: (kind, level) -> (generation, connection)
+
+    @property
+    def storage_client(self):
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    @storage_client.setter
+    def storage_client(self, client):
+        self._storage_client = client
+
+    def _index_for(self, kind: str, level: str) -> LevelSearchIndex:
+        key = (kind, level)
+        index = self._indexes.get(key)
+        if index is None:
+            with self._indexes_lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    blob_name = f"{BUNDLE_FOLDER}/{SEARCH_MODULES[kind]}/{level}/{SEARCH_FILE}"
+                    index = self._indexes[key] = LevelSearchIndex(blob_name, os.path.join(self.index_dir,
+                                                                                          f"{kind}_{level}"))
+        return index
+
+    def _refresh(self, index: LevelSearchIndex):
+        """Download the index again if a new generation was published since the last check."""
+        if index.is_fresh(self.check_interval):
+            return
+        with index.lock:
+            if index.is_fresh(self.check_interval):
+                return  # Refreshed by the caller we waited for
+            blob = self.storage_client.bucket(self.bucket_name).blob(index.blob_name)
+            record_gcs_call("search", "metadata")
+            try:
+                blob.reload()
+                if blob.generation != index.generation:
+                    os.makedirs(self.index_dir, exist_ok=True)
+                    path = f"{index.path_prefix}_{blob.generation}.db"
+                    blob.download_to_filename(path + ".tmp", if_generation_match=blob.generation)
+                    record_gcs_call("search", "download", os.path.getsize(path + ".tmp"))
+                    os.replace(path + ".tmp", path)
+                    with index.swap_lock:
+                        previous, index.path, index.generation = index.path, path, blob.generation
+                        if previous:
+                            os.remove(previous)  # Connections already open on it keep working until replaced
+                    print(f"Loaded search index {index.blob_name} (generation {blob.generation})")
+            except NotFound:
+                if index.generation is None:
+                    print(f"No search index published at {index.blob_name}")
+            except Exception as e:
+                if index.generation is None:
+                    raise
+                print(f"Error checking {index.blob_name}, serving generation {index.generation}: {str(e)}")
+            index.checked_at = time.monotonic()
+
+    def _connection(self, kind: str, level: str) -> Optional[sqlite3.Connection]:
+        """This thread's read-only connection to the current index of a level, or None if none is published."""
+        index = self._index_for(kind, level)
+        self._refresh(index)
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        cached = connections.get((kind, level))
+        if cached is not None and cached[0] == index.generation:
+            return cached[1]
+        with index.swap_lock:
+            generation, path = index.generation, index.path
+            if path is None:
+                return None
+            connection = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+        if cached is not None:
+            cached[1].close()
+        connection.execute(f"PRAGMA mmap_size = {SEARCH_INDEX_MMAP_BYTES}")
+        connections[(kind, level)] = (generation, connection)
+        return connection
+
+    def search(self, kind: str, level: str, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Best matches for `query` among the `kind` ("articles" or "transcripts") of a level.
+        Each result has the item id, title, summary and BM25 score (higher is better).
+        """
+        match = match_expression(query)
+        if match is None:
+            return []
+        connection = self._connection(kind, level)
+        if connection is None:
+            return []
+        # `rank` is the weighted BM25 configured when the index was built
+        rows = connection.execute(
+            "SELECT items.doc_id, items.title, items.summary, documents.rank FROM documents "
+            "JOIN items ON items.rowid = documents.rowid WHERE documents MATCH ? ORDER BY documents.rank LIMIT ?",
+            (match, limit),
+        )
+        return [{"id": doc_id, "title": title, "summary": summary, "score": -rank}
+                for doc_id, title, summary, rank in rows]
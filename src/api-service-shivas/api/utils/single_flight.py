@@ -0,0 +1,96 @@
+"""
+Request coalescing: concurrent callers asking for the same key share one in-flight load.
+
+The first caller for a key (the leader) runs the load; callers arriving before it finishes wait
+for it and get the same result, or the same exception. Nothing is cached: once the load is done,
+the next caller starts a new one. Caching stays the job of the catalogs and caches around it.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from .metrics import record_single_flight
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces blocking calls made from several threads."""
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name  # Label in the metrics
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Return func(*args, **kwargs), sharing the call with any concurrent caller for the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        record_single_flight(self.name, "leader" if leader else "shared")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self.forget(key, call)
+            call.done.set()
+
+    def forget(self, key: Hashable, call: Optional[_Call] = None):
+        """
+        Make the next caller for `key` start a new load instead of joining the one in flight,
+        e.g. after a write that the in-flight load may not see.
+        """
+        with self._lock:
+            if call is None or self._calls.get(key) is call:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces awaitable calls made from one event loop, e.g. run_storage(...) calls of concurrent requests,
+    so a burst of identical requests holds one storage thread instead of one each.
+    A caller that is cancelled stops waiting, but the shared load keeps running for the others.
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name  # Label in the metrics
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Await func(*args, **kwargs), sharing the call with any concurrent caller for the same key."""
+        task = self._tasks.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            record_single_flight(self.name, "leader")
+            task = self._tasks[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            record_single_flight(self.name, "shared")
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved, even if every caller was cancelled before it finished
+
+    def forget(self, key: Hashable):
+        """Make the next caller for `key` start a new load instead of joining the one in flight."""
+        self._tasks.pop(key, None)
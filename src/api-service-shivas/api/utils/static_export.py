@@ -0,0 +1,164 @@
+"""
+Static export of the level catalogs, served by nginx without going through the API.
+
+For each content kind and level the export writes under <root>/content/{kind}/{level}/:
+- {version}/page-{n}.json: the listing pages, with the items /articles and /transcripts return
+- {version}/items/{id}.json: one detail document per item, as returned by /articles/{id} and /videos/{id}
+- current.json: a small pointer to the current version, its first page and the URL pattern of the items
+`version` is a hash of everything under it, so those files never change and can be cached for good;
+only current.json changes between exports. Every file has a gzip twin for nginx's gzip_static.
+With STATIC_EXPORT_DIR set, the API's catalog refresher keeps the export in step through StaticExporter.
+"""
+import gzip
+import hashlib
+import os
+import re
+import shutil
+from typing import Dict, List, Tuple
+from .media_manager import ARTICLE_LISTING_FIELDS, LEVELS, TRANSCRIPT_LISTING_FIELDS, CatalogSnapshot, MediaManager
+from .response_cache import encode_json
+
+# Items per static listing page
+STATIC_PAGE_SIZE = int(os.getenv("STATIC_PAGE_SIZE", "20"))
+
+# Static root the API rewrites whenever a level's catalog changes; empty to leave exports to `api.export_static`
+STATIC_EXPORT_DIR = os.getenv("STATIC_EXPORT_DIR", "")
+
+# Exported versions kept per level, so clients holding an older pointer keep working for a while
+STATIC_VERSIONS_KEPT = 2
+
+POINTER_FILE = "current.json"
+
+# kind -> (id key, listing fields, key of the detail document)
+EXPORT_KINDS = {
+    "articles": ("id", ARTICLE_LISTING_FIELDS, "article"),
+    "transcripts": ("video_id", TRANSCRIPT_LISTING_FIELDS, "video"),
+}
+
+# Item ids that can be used as file names as they are
+SAFE_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+
+def write_static(path: str, body: bytes):
+    """Write a file and its .gz twin, each replaced atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for name, data in ((path, body), (path + ".gz", gzip.compress(body, compresslevel=9, mtime=0))):
+        with open(name + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(name + ".tmp", name)
+
+
+def render_level(kind: str, snapshot: CatalogSnapshot, page_size: int) -> Dict[str, bytes]:
+    """Every file of one version of a level, by path relative to the version folder."""
+    id_key, fields, detail_key = EXPORT_KINDS[kind]
+    files = {}
+    total = len(snapshot.items)
+    offsets = range(0, max(total, 1), page_size)
+    for number, offset in enumerate(offsets):
+        items, next_offset, _ = snapshot.page(fields, offset, page_size)
+        files[f"page-{number}.json"] = encode_json({
+            kind: items,
+            "next": f"page-{number + 1}.json" if next_offset is not None else None,
+            "total": total,
+        })
+    for item_id, item in snapshot.by_id.items():
+        if SAFE_ID.fullmatch(item_id):
+            files[f"items/{item_id}.json"] = encode_json({detail_key: item})
+        else:
+            print(f"Not exporting {kind} item '{item_id}': its id is not a safe file name")
+    return files
+
+
+def content_version(files: Dict[str, bytes]) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode("utf-8"))
+        digest.update(hashlib.sha256(files[name]).digest())
+    return digest.hexdigest()[:16]
+
+
+def export_level(root: str, kind: str, level: str, snapshot: CatalogSnapshot,
+                 page_size: int = STATIC_PAGE_SIZE) -> Dict:
+    """
+    Export one level and point current.json at it. A version that was already exported is not written again.
+    The version folder is written under a temporary name and renamed, so it appears complete or not at all.
+    """
+    files = render_level(kind, snapshot, page_size)
+    version = content_version(files)
+    level_dir = os.path.join(root, "content", kind, level)
+    version_dir = os.path.join(level_dir, version)
+    written = 0
+    if not os.path.isdir(version_dir):
+        staging_dir = os.path.join(level_dir, f".{version}.{os.getpid()}.tmp")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        for name, body in files.items():
+            write_static(os.path.join(staging_dir, name), body)
+        try:
+            os.rename(staging_dir, version_dir)
+            written = len(files)
+        except OSError:
+            if not os.path.isdir(version_dir):
+                raise
+            shutil.rmtree(staging_dir, ignore_errors=True)  # Another exporter wrote the same version first
+
+    pointer = {
+        "version": version,
+        "total": len(snapshot.items),
+        "page_size": page_size,
+        "first_page": f"{version}/page-0.json",
+        "items": f"{version}/items/{{id}}.json",
+    }
+    write_static(os.path.join(level_dir, POINTER_FILE), encode_json(pointer))
+    prune_versions(level_dir, keep=version)
+    return {"kind": kind, "level": level, "version": version, "files": len(files), "written": written}
+
+
+def prune_versions(level_dir: str, keep: str, versions_kept: int = STATIC_VERSIONS_KEPT):
+    """Delete all but the newest exported versions of a level (the current one is always kept)."""
+    versions = [entry for entry in os.scandir(level_dir) if entry.is_dir() and not entry.name.startswith(".")]
+    versions.sort(key=lambda entry: (entry.name == keep, entry.stat().st_mtime), reverse=True)
+    for entry in versions[versions_kept:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def export_catalogs(root: str, media_manager: MediaManager, levels: List[str] = LEVELS,
+                    page_size: int = STATIC_PAGE_SIZE) -> List[Dict]:
+    """Export the articles and transcripts of every level. Returns one summary per level and kind."""
+    summaries = []
+    for level in levels:
+        summaries.append(export_level(root, "articles", level, media_manager.article_snapshot(level), page_size))
+        summaries.append(export_level(root, "transcripts", level, media_manager.transcript_snapshot(level),
+                                      page_size))
+    return summaries
+
+
+class StaticExporter:
+    """
+    Keeps a static export in step with the catalogs of a MediaManager.
+    A level is exported again only when its snapshot version changed since the last export, so a pass over
+    unchanged catalogs renders nothing. Levels whose catalog is not loaded yet are left as they are.
+    """
+
+    def __init__(self, root: str, media_manager: MediaManager, levels: List[str] = LEVELS,
+                 page_size: int = STATIC_PAGE_SIZE):
+        self.root = root
+        self.media_manager = media_manager
+        self.levels = levels
+        self.page_size = page_size
+        self._exported: Dict[Tuple[str, str], str] = {}  # (kind, level) -> snapshot version exported
+
+    def export_changed(self) -> List[Dict]:
+        """Export the levels whose catalog changed. Returns one summary per level and kind exported."""
+        summaries = []
+        for level in self.levels:
+            for kind, get_snapshot in (("articles", self.media_manager.article_snapshot),
+                                       ("transcripts", self.media_manager.transcript_snapshot)):
+                snapshot = get_snapshot(level)
+                if snapshot.version is None or self._exported.get((kind, level)) == snapshot.version:
+                    continue
+                summary = export_level(self.root, kind, level, snapshot, self.page_size)
+                self._exported[kind, level] = snapshot.version
+                print(f"Exported static {kind}/{level}: version {summary['version']}, "
+                      f"{summary['written']} files written")
+                summaries.append(summary)
+        return summaries
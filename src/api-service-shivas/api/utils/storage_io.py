@@ -0,0 +1,55 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Maximum number of blocking storage calls (GCS requests, cold catalog loads) in flight per worker.
+# Calls beyond this wait in the executor queue instead of tying up the event loop.
+STORAGE_IO_CONCURRENCY = int(os.getenv("STORAGE_IO_CONCURRENCY", "32"))
+
+
+class StorageIO:
+    """
+    Runs blocking storage calls on a dedicated, bounded thread pool so async routes never
+    block the event loop. A separate pool from Starlette's keeps slow GCS calls from
+    starving everything else that runs in threads.
+    """
+
+    def __init__(self, max_workers: int = STORAGE_IO_CONCURRENCY):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Create the thread pool lazily (and again after a shutdown)."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="storage-io")
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await a blocking call without holding the event loop. The call sees the caller's context variables."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, func, *args, **kwargs))
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# Shared by every router of the process
+storage_io = StorageIO()
+
+
+async def run_storage(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking storage call on the shared storage pool."""
+    return await storage_io.run(func, *args, **kwargs)
@@ -1,19 +1,92 @@
-import bcrypt
-import json
+import asyncio
+import itertools
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from google.cloud import storage
 from datetime import datetime, timedelta
 import jwt
 import logging
+from .feed_store import RECENTLY_READ_KEY, RECENTLY_READ_LIMIT
+from .metrics import record_cache_lookup
+from .password_hasher import PasswordHasher, PasswordHasherBusy
+from .single_flight import SingleFlight
+from .storage_io import run_storage
+from .user_store import UserExists, UserNotFound, UserStore, create_user_store
+from .write_behind import MetadataWriteBehind
 
 logging.basicConfig(level=logging.INFO)
 
+# Number of user records kept in memory and how long (in seconds) one is trusted without asking the store
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+# With several workers, a record cached by one worker can be changed by another until its TTL runs out.
+# When enabled, every cache hit is revalidated with a cheap version check (for GCS a metadata-only
+# request comparing the blob generation), and the record is only read again if it changed.
+USER_CACHE_VALIDATE = os.getenv("USER_CACHE_VALIDATE", "false").lower() in ("1", "true", "yes")
+
+
+class UserRecordCache:
+    """LRU of user records with a time-to-live. Entries are (record, store version)."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[dict, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[Tuple[dict, int]]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            record, version, stored_at = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return record, version
+
+    def put(self, username: str, record: dict, version: int):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (record, version, time.monotonic())
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
 class UserManager:
-    def __init__(self, bucket_name: str):
+    def __init__(self, bucket_name: str, storage_client: storage.Client = None,
+                 cache_size: int = USER_CACHE_SIZE, cache_ttl: float = USER_CACHE_TTL_SECONDS,
+                 validate_cache: bool = USER_CACHE_VALIDATE, password_hasher: Optional[PasswordHasher] = None,
+                 store: Optional[UserStore] = None, write_behind_window: float = 0,
+                 read_history_window: float = 0):
         self.bucket_name = bucket_name
-        self._storage_client = None  # Lazy initialization for storage.Client
+        self._storage_client = storage_client  # Lazy initialization for storage.Client unless a shared one is passed in
         self.jwt_secret = os.getenv("JWT_SECRET", "your_jwt_secret")
         self.jwt_algorithm = "HS256"
+        self._user_cache = UserRecordCache(cache_size, cache_ttl)
+        self._loads = SingleFlight("user_record")  # Store reads in flight, by username
+        self.validate_cache = validate_cache
+        self.password_hasher = password_hasher or PasswordHasher()
+        # The GCS backend asks for the client on every call, so a client bound later (see api.dependencies) is used
+        self.store = store or create_user_store(bucket_name, lambda: self.storage_client)
+        # With a window, metadata updates are queued and each user's changes are written once per window
+        self.write_behind = (MetadataWriteBehind(self._write_metadata, write_behind_window)
+                             if write_behind_window > 0 else None)
+        # With a window, the items a user opens are collected and added to `recently_read` once per window
+        self.read_history = (MetadataWriteBehind(self._write_reads, read_history_window)
+                             if read_history_window > 0 else None)
+        self._read_order = itertools.count()  # Orders reads collected in the same window
 
     @property
     def storage_client(self):
@@ -22,89 +95,217 @@ class UserManager:
             self._storage_client = storage.Client()
         return self._storage_client
 
-    def _get_bucket(self):
-        try:
-            return self.storage_client.bucket(self.bucket_name)
-        except Exception as e:
-            raise Exception(f"Error accessing bucket: {str(e)}")
+    @storage_client.setter
+    def storage_client(self, client):
+        self._storage_client = client
 
-    def _get_user_blob(self, username):
-        """Get the GCP blob for a user."""
-        bucket = self._get_bucket()
-        return bucket.blob(f"users/{username}.json")
+    def _is_current(self, username: str, version: int) -> bool:
+        """Cheap check (a metadata-only request for GCS) that a cached record is still the latest version."""
+        return self.store.is_current(username, version)
 
-    def register_user(self, username: str, password: str, metadata: dict):
-        """Register a new user."""
+    def _load_user(self, username: str) -> Optional[dict]:
+        """
+        Return the stored user record, or None if the user does not exist.
+        Served from the cache when possible; a miss is a single read where "missing" means "not found".
+        The returned record is shared with the cache and must not be modified.
+        """
+        cached = self._user_cache.get(username)
+        if cached is not None:
+            record, version = cached
+            if not self.validate_cache or self._is_current(username, version):
+                record_cache_lookup("user_record", "hit")
+                return record
+            record_cache_lookup("user_record", "stale")
+        else:
+            record_cache_lookup("user_record", "miss")
+
+        loaded = self._loads.do(username, self.store.get, username)  # Concurrent misses share one read
+        if loaded is None:
+            self._user_cache.invalidate(username)
+            return None
+        user_data, version = loaded
+        self._user_cache.put(username, user_data, version)
+        return user_data
+
+    @staticmethod
+    def _check_new_credentials(username: str, password: str):
         if not username or not password:
             raise Exception("Username and password are required")
         if len(password) < 8:
             raise Exception("Password must be at least 8 characters long")
 
-        blob = self._get_user_blob(username)
-        if blob.exists():
-            raise Exception(f"Username '{username}' already exists")
-
-        hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=12))
+    def _create_user(self, username: str, hashed_password: str, metadata: dict):
         valid_metadata = {key: str(value) for key, value in metadata.items()}
 
         user_data = {
             "username": username,
-            "password": hashed_password.decode("utf-8"),
+            "password": hashed_password,
             "metadata": valid_metadata,
             "created_at": datetime.utcnow().isoformat(),
         }
 
         try:
-            blob.upload_from_string(json.dumps(user_data), content_type="application/json")
+            version = self.store.create(user_data)
             logging.info(f"User '{username}' registered successfully")
+        except UserExists as e:
+            raise Exception(str(e))
         except Exception as e:
             logging.error(f"Error saving user data for '{username}': {str(e)}")
             raise Exception("Error saving user data")
+        self._loads.forget(username)
+        self._user_cache.put(username, user_data, version)
 
-    def authenticate_user(self, username: str, password: str):
-        """Authenticate a user."""
+    def register_user(self, username: str, password: str, metadata: dict):
+        """Register a new user from sync code (scripts, benchmarks) by running `register` to completion."""
+        asyncio.run(self.register(username, password, metadata))
+
+    async def register(self, username: str, password: str, metadata: dict):
+        """
+        Register a new user.
+        bcrypt runs on the password hasher's pool and the write on the storage pool,
+        so the request holds no thread while it waits for a bcrypt worker.
+        """
+        self._check_new_credentials(username, password)
+        hashed_password = await self.password_hasher.hash_async(password)
+        await run_storage(self._create_user, username, hashed_password, metadata)
+
+    def authenticate_user(self, username: str, password: str) -> str:
+        """Authenticate a user from sync code (scripts, benchmarks) by running `authenticate` to completion."""
+        return asyncio.run(self.authenticate(username, password))
+
+    async def authenticate(self, username: str, password: str) -> str:
+        """
+        Authenticate a user and return a token for them.
+        The user is read on the storage pool and the password checked on the password hasher's pool,
+        so a burst of logins queues for bcrypt without holding storage threads.
+        """
         try:
-            # Fetch user data
             print(f"Attempting login for username: {username}")
-            blob = self._get_user_blob(username)
-            if not blob.exists():
+            user_data = await run_storage(self._load_user, username)
+            if user_data is None:
                 print(f"Authentication failed for '{username}': User not found")
                 raise Exception("Invalid username or password")
 
-            user_data = json.loads(blob.download_as_text())
             hashed_password = user_data.get("password")
-
-            # Verify password
-            if not bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8")):
+            if not await self.password_hasher.verify_async(password, hashed_password):
                 logging.warning(f"Authentication failed for '{username}': Incorrect password")
                 raise Exception("Invalid username or password")
+            if self.password_hasher.needs_rehash(hashed_password):
+                try:
+                    password_hash = await self.password_hasher.hash_async(password)
+                except PasswordHasherBusy:
+                    pass  # The password is checked; the rehash waits for a quieter login
+                else:
+                    await run_storage(self._save_password_hash, username, password_hash)
 
-            # Generate JWT token
-            token_payload = {
-                "username": username,
-                "exp": datetime.utcnow() + timedelta(hours=1)  # Set token expiration
-            }
-            token = jwt.encode(token_payload, self.jwt_secret, algorithm=self.jwt_algorithm)
-
+            token = self.issue_token(username, self._metadata_view(username, user_data))
             print(f"User '{username}' authenticated successfully")
             return token
+        except PasswordHasherBusy:
+            raise
         except Exception as e:
             print(f"Authentication error for '{username}': {str(e)}")
             raise Exception("Authentication failed")
 
-    def update_metadata(self, username: str, metadata: dict):
-        blob = self._get_user_blob(username)
-        if not blob.exists():
-            raise Exception(f"User '{username}' not found")
+    def issue_token(self, username: str, metadata: dict) -> str:
+        """
+        Issue a signed token for a user.
+        The token carries the user's level, so content routes can pick the level without reading the user blob.
+        """
+        token_payload = {
+            "username": username,
+            "level": metadata.get("level"),
+            "exp": datetime.utcnow() + timedelta(hours=1)  # Set token expiration
+        }
+        return jwt.encode(token_payload, self.jwt_secret, algorithm=self.jwt_algorithm)
+
+    def decode_token(self, token: str) -> dict:
+        """Verify a token issued by issue_token and return its claims. Raises jwt.InvalidTokenError."""
+        return jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
 
-        user_data = json.loads(blob.download_as_text())
-        user_data["metadata"].update(metadata)  # Merge new metadata
+    def _save_password_hash(self, username: str, password_hash: str):
+        """Store a password hashed again with the current cost. Best effort: a failure does not fail the login."""
+        try:
+            user_data, version = self.store.set_password(username, password_hash, self._user_cache.get(username))
+        except Exception as e:
+            logging.warning(f"Could not rehash password for '{username}': {str(e)}")
+            return
+        self._loads.forget(username)
+        self._user_cache.put(username, user_data, version)
+        logging.info(f"Rehashed password for '{username}' with cost {self.password_hasher.rounds}")
+
+    def _metadata_view(self, username: str, user_data: dict) -> dict:
+        """The user's metadata including queued updates that have not been written yet."""
+        metadata = dict(user_data.get("metadata", {}))
+        if self.write_behind is not None:
+            metadata.update(self.write_behind.overlay(username))
+        return metadata
+
+    def _write_metadata(self, username: str, metadata: dict) -> dict:
+        """Merge `metadata` into the stored user and update the cache with the result."""
+        try:
+            # The cached copy saves a read; the store rereads it if someone else wrote the user since
+            user_data, version = self.store.update_metadata(username, metadata, self._user_cache.get(username))
+        except Exception:
+            self._user_cache.invalidate(username)
+            raise
+        self._loads.forget(username)  # Reads from before the write must not be joined
+        self._user_cache.put(username, user_data, version)  # Write-through
+        return user_data["metadata"]
+
+    def update_metadata(self, username: str, metadata: dict) -> dict:
+        """
+        Merge `metadata` into the user's metadata and return the result.
+        With write-behind enabled the change is queued and returned right away; reads through this
+        manager see it immediately, and it reaches the store within the write-behind window.
+        """
+        if self.write_behind is not None:
+            user_data = self._load_user(username)
+            if user_data is None:
+                raise Exception(f"User '{username}' not found")
+            self.write_behind.submit(username, metadata)
+            return self._metadata_view(username, user_data)
 
         try:
-            blob.upload_from_string(json.dumps(user_data), content_type="application/json")
+            return dict(self._write_metadata(username, metadata))
+        except UserNotFound as e:
+            raise Exception(str(e))
         except Exception as e:
             raise Exception(f"Error updating metadata for '{username}': {str(e)}")
-        
+
+    def record_read(self, username: str, key: str):
+        """
+        Put an item first in the user's recently read list, which the feed builder ranks from.
+        Runs after the response is sent, so failures are only logged.
+        With a read history window, the read is only noted in memory and written with the user's other reads.
+        """
+        try:
+            if self.read_history is not None:
+                self.read_history.submit(username, {key: next(self._read_order)})
+                return
+            self._write_reads(username, {key: 0})
+        except Exception as e:
+            logging.error(f"Error recording read of {key} by '{username}': {str(e)}")
+
+    def _write_reads(self, username: str, reads: dict):
+        """Move the read items (key -> order of the read) to the front of `recently_read`, latest first."""
+        user_data = self._load_user(username)
+        if user_data is None:
+            return
+        recently_read = self._metadata_view(username, user_data).get(RECENTLY_READ_KEY, [])
+        latest = sorted(reads, key=reads.get, reverse=True)
+        updated = (latest + [other for other in recently_read if other not in reads])[:RECENTLY_READ_LIMIT]
+        if updated == recently_read:
+            return  # Opened again: nothing changes
+        self.update_metadata(username, {RECENTLY_READ_KEY: updated})
+
+    def flush_pending(self):
+        """Write all queued metadata updates now (called on shutdown)."""
+        if self.read_history is not None:
+            self.read_history.flush_all()  # Queues their metadata updates, which are flushed next
+        if self.write_behind is not None:
+            self.write_behind.flush_all()
+
     def get_metadata(self, username: str) -> dict:
         """
         Retrieve the metadata for a user.
@@ -115,11 +316,7 @@ class UserManager:
         Returns:
             dict: The metadata for the user or an empty dictionary if not found.
         """
-        blob = self._get_user_blob(username)
-        if not blob.exists():
+        user_data = self._load_user(username)
+        if user_data is None:
             raise Exception(f"User '{username}' not found")
-
-        user_data = json.loads(blob.download_as_text())
-        return user_data.get("metadata", {})
-
-
+        return self._metadata_view(username, user_data)
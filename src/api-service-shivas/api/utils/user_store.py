@@ -0,0 +1,306 @@
+import abc
+import copy
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
+from .metrics import record_gcs_call
+
+# Which UserStore backs UserManager: "gcs" (one JSON blob per user) or "sqlite"
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "gcs")
+
+# Database file of the SQLite backend
+USER_DB_PATH = os.getenv("USER_DB_PATH", "users.db")
+
+USER_FOLDER = "users/"
+
+# Attempts of a read-modify-write on a user blob that other writers keep changing
+MAX_WRITE_ATTEMPTS = 3
+
+# A stored user and its version: the blob generation for GCS, a row counter for SQLite
+Versioned = Tuple[dict, int]
+
+
+class UserExists(Exception):
+    pass
+
+
+class UserNotFound(Exception):
+    pass
+
+
+class UserStore(abc.ABC):
+    """
+    Where UserManager keeps user records.
+    A record is {"username", "password", "metadata", "created_at"}. Every write returns the new
+    version of the record, which callers use to keep caches coherent.
+    """
+
+    @abc.abstractmethod
+    def get(self, username: str) -> Optional[Versioned]:
+        """Return (record, version), or None if the user does not exist."""
+
+    @abc.abstractmethod
+    def is_current(self, username: str, version: int) -> bool:
+        """Cheap check that `version` is still the latest version of the user."""
+
+    @abc.abstractmethod
+    def create(self, record: dict) -> int:
+        """Store a new user. Raises UserExists if the username is taken."""
+
+    @abc.abstractmethod
+    def update_metadata(self, username: str, metadata: dict, current: Optional[Versioned] = None) -> Versioned:
+        """
+        Merge `metadata` into the user's metadata as one atomic change. Raises UserNotFound.
+        `current` is the caller's copy of the record, which saves a read when it is still the latest version.
+        """
+
+    @abc.abstractmethod
+    def set_password(self, username: str, password_hash: str, current: Optional[Versioned] = None) -> Versioned:
+        """Replace the user's password hash, like update_metadata. Raises UserNotFound."""
+
+    @abc.abstractmethod
+    def list_usernames(self, level: Optional[str] = None) -> List[str]:
+        """All usernames, optionally only those whose metadata level is `level`."""
+
+    @abc.abstractmethod
+    def iter_records(self) -> Iterator[dict]:
+        """Every user record, in no particular order."""
+
+
+class GCSUserStore(UserStore):
+    """One JSON blob per user under users/. Writes are guarded by generation preconditions."""
+
+    def __init__(self, bucket_name: str, client_getter: Callable[[], storage.Client], fetch_concurrency: int = 16):
+        self.bucket_name = bucket_name
+        self._client_getter = client_getter  # The client is resolved on use so it can be created lazily or rebound
+        self.fetch_concurrency = fetch_concurrency
+
+    def _get_bucket(self):
+        try:
+            return self._client_getter().bucket(self.bucket_name)
+        except Exception as e:
+            raise Exception(f"Error accessing bucket: {str(e)}")
+
+    def _blob(self, username: str):
+        return self._get_bucket().blob(f"{USER_FOLDER}{username}.json")
+
+    def get(self, username: str) -> Optional[Versioned]:
+        blob = self._blob(username)
+        try:
+            text = blob.download_as_text()  # A single GET; 404 means the user does not exist
+        except NotFound:
+            record_gcs_call("users", "download")
+            return None
+        record_gcs_call("users", "download", len(text))
+        return json.loads(text), blob.generation
+
+    def is_current(self, username: str, version: int) -> bool:
+        blob = self._blob(username)
+        record_gcs_call("users", "metadata")
+        try:
+            blob.reload()  # Metadata only
+        except NotFound:
+            return False
+        return blob.generation == version
+
+    def create(self, record: dict) -> int:
+        blob = self._blob(record["username"])
+        record_gcs_call("users", "upload")
+        try:
+            # Generation 0 means "only if the object does not exist", so the existence check is part of the write
+            blob.upload_from_string(json.dumps(record), content_type="application/json", if_generation_match=0)
+        except PreconditionFailed:
+            raise UserExists(f"Username '{record['username']}' already exists")
+        return blob.generation
+
+    def _modify(self, username: str, change: Callable[[dict], None], current: Optional[Versioned]) -> Versioned:
+        """Read-modify-write that only succeeds if nobody wrote the blob since it was read."""
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            if current is None:
+                current = self.get(username)
+                if current is None:
+                    raise UserNotFound(f"User '{username}' not found")
+            record, generation = copy.deepcopy(current[0]), current[1]
+            change(record)
+            blob = self._blob(username)
+            record_gcs_call("users", "upload")
+            try:
+                blob.upload_from_string(json.dumps(record), content_type="application/json",
+                                        if_generation_match=generation)
+            except PreconditionFailed:
+                current = None  # Changed by another writer: read it again and reapply the change
+                continue
+            return record, blob.generation
+        raise Exception(f"User '{username}' is being modified concurrently, giving up")
+
+    def update_metadata(self, username: str, metadata: dict, current: Optional[Versioned] = None) -> Versioned:
+        return self._modify(username, lambda record: record.setdefault("metadata", {}).update(metadata), current)
+
+    def set_password(self, username: str, password_hash: str, current: Optional[Versioned] = None) -> Versioned:
+        return self._modify(username, lambda record: record.update(password=password_hash), current)
+
+    def iter_records(self) -> Iterator[dict]:
+        """Download every user blob, a bounded number at a time."""
+        blobs = [blob for blob in self._get_bucket().list_blobs(prefix=USER_FOLDER) if blob.name.endswith(".json")]
+        with ThreadPoolExecutor(max_workers=self.fetch_concurrency) as pool:
+            for text in pool.map(lambda blob: blob.download_as_text(), blobs):
+                yield json.loads(text)
+
+    def list_usernames(self, level: Optional[str] = None) -> List[str]:
+        if level is None:
+            return [blob.name[len(USER_FOLDER):-len(".json")]
+                    for blob in self._get_bucket().list_blobs(prefix=USER_FOLDER) if blob.name.endswith(".json")]
+        # No index: every user blob has to be read
+        return [record["username"] for record in self.iter_records()
+                if record.get("metadata", {}).get("level") == level]
+
+
+class SQLiteUserStore(UserStore):
+    """
+    Users in an embedded SQLite database in WAL mode: reads never wait for writers, lookups go
+    through the primary key (and an index on the level), and metadata merges are transactions.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            metadata TEXT NOT NULL DEFAULT '{}',
+            created_at TEXT,
+            version INTEGER NOT NULL DEFAULT 1
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS users_level ON users (json_extract(metadata, '$.level'));
+    """
+
+    def __init__(self, path: str = USER_DB_PATH):
+        self.path = path
+        self._local = threading.local()  # One connection per thread
+        with self._connect() as connection:
+            connection.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints, which is enough for WAL
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _record(row) -> Versioned:
+        username, password, metadata, created_at, version = row
+        return {"username": username, "password": password, "metadata": json.loads(metadata),
+                "created_at": created_at}, version
+
+    def get(self, username: str) -> Optional[Versioned]:
+        row = self._connect().execute(
+            "SELECT username, password, metadata, created_at, version FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return self._record(row) if row else None
+
+    def is_current(self, username: str, version: int) -> bool:
+        row = self._connect().execute("SELECT version FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and row[0] == version
+
+    def create(self, record: dict) -> int:
+        try:
+            self._connect().execute(
+                "INSERT INTO users (username, password, metadata, created_at) VALUES (?, ?, ?, ?)",
+                (record["username"], record["password"], json.dumps(record.get("metadata", {})),
+                 record.get("created_at")),
+            )
+        except sqlite3.IntegrityError:
+            raise UserExists(f"Username '{record['username']}' already exists")
+        return 1
+
+    def _modify(self, username: str, change: Callable[[dict], None]) -> Versioned:
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")  # Take the write lock before reading, so merges never interleave
+        try:
+            row = connection.execute(
+                "SELECT username, password, metadata, created_at, version FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            if row is None:
+                raise UserNotFound(f"User '{username}' not found")
+            record, version = self._record(row)
+            change(record)
+            connection.execute(
+                "UPDATE users SET password = ?, metadata = ?, version = ? WHERE username = ?",
+                (record["password"], json.dumps(record["metadata"]), version + 1, username),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return record, version + 1
+
+    def update_metadata(self, username: str, metadata: dict, current: Optional[Versioned] = None) -> Versioned:
+        return self._modify(username, lambda record: record["metadata"].update(metadata))
+
+    def set_password(self, username: str, password_hash: str, current: Optional[Versioned] = None) -> Versioned:
+        return self._modify(username, lambda record: record.update(password=password_hash))
+
+    def list_usernames(self, level: Optional[str] = None) -> List[str]:
+        if level is None:
+            rows = self._connect().execute("SELECT username FROM users ORDER BY username")
+        else:
+            rows = self._connect().execute(
+                "SELECT username FROM users WHERE json_extract(metadata, '$.level') = ? ORDER BY username", (level,)
+            )
+        return [row[0] for row in rows]
+
+    def iter_records(self) -> Iterator[dict]:
+        rows = self._connect().execute("SELECT username, password, metadata, created_at, version FROM users")
+        for row in rows:
+            yield self._record(row)[0]
+
+    def import_records(self, records: Iterable[dict]) -> int:
+        """Insert or replace many users in one transaction. Returns the number of records written."""
+        connection = self._connect()
+        count = 0
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for record in records:
+                connection.execute(
+                    "INSERT INTO users (username, password, metadata, created_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (username) DO UPDATE SET password = excluded.password, "
+                    "metadata = excluded.metadata, created_at = excluded.created_at, version = users.version + 1",
+                    (record["username"], record["password"], json.dumps(record.get("metadata", {})),
+                     record.get("created_at")),
+                )
+                count += 1
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return count
+
+
+def create_user_store(bucket_name: str, client_getter: Callable[[], storage.Client],
+                      backend: str = USER_STORE_BACKEND) -> UserStore:
+    """Build the UserStore selected by USER_STORE_BACKEND."""
+    if backend == "sqlite":
+        return SQLiteUserStore(USER_DB_PATH)
+    if backend == "gcs":
+        return GCSUserStore(bucket_name, client_getter)
+    raise Exception(f"Unknown user store backend '{backend}'")
+
+
+def migrate_users(source: UserStore, target: SQLiteUserStore, batch_size: int = 500) -> int:
+    """Copy every user of `source` into `target` in batches. Returns the number of users copied."""
+    copied = 0
+    batch = []
+    for record in source.iter_records():
+        batch.append(record)
+        if len(batch) >= batch_size:
+            copied += target.import_records(batch)
+            batch = []
+    if batch:
+        copied += target.import_records(batch)
+    return copied
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional
+from .user_store import UserNotFound
+
+# Delay before the first retry of a failed write; it doubles with every failure, up to the maximum.
+# Updates were already acknowledged to the client, so they are retried until they are written.
+RETRY_DELAY_SECONDS = 1.0
+MAX_RETRY_DELAY_SECONDS = float(os.getenv("USER_WRITE_BEHIND_MAX_RETRY_SECONDS", "60"))
+
+# Flusher threads; each user always goes to the same one, so their writes stay in order
+WRITE_BEHIND_SHARDS = int(os.getenv("USER_WRITE_BEHIND_SHARDS", "4"))
+
+
+class MetadataWriteBehind:
+    """
+    Queues metadata updates per user and writes each user's accumulated changes once per window.
+    Updates are merged in arrival order, so later values win exactly as with one write per update.
+    Changes stay visible through `overlay` from the moment they are queued until the write has
+    landed, which is what gives callers read-your-writes.
+    Users are sharded by a hash of their username over `shards` flusher threads, each with its own flush
+    lock, so a slow write only holds back the users of its shard.
+    """
+
+    def __init__(self, write: Callable[[str, dict], object], window: float, shards: int = WRITE_BEHIND_SHARDS):
+        self.write = write  # Persists one user's merged changes; runs on the user's flusher thread
+        self.window = window
+        self.shards = max(shards, 1)
+        self.updates = 0  # Updates queued
+        self.writes = 0  # Writes made for them
+        self._pending: Dict[str, dict] = {}  # username -> changes not written yet
+        self._inflight: Dict[str, dict] = {}  # username -> changes being written right now
+        # Per shard: username -> when its changes are due
+        self._deadlines: List[Dict[str, float]] = [{} for _ in range(self.shards)]
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()  # Guards the state above
+        self._conditions = [threading.Condition(self._lock) for _ in range(self.shards)]  # Wake a shard's flusher
+        # One write at a time per shard keeps each user's writes in order
+        self._flush_locks = [threading.Lock() for _ in range(self.shards)]
+        self._threads: Optional[List[threading.Thread]] = None
+
+    def _shard(self, username: str) -> int:
+        return zlib.crc32(username.encode("utf-8")) % self.shards
+
+    def submit(self, username: str, metadata: dict):
+        """Queue changes for a user; they are written at most `window` seconds later."""
+        shard = self._shard(username)
+        with self._lock:
+            self._pending.setdefault(username, {}).update(metadata)
+            self._deadlines[shard].setdefault(username, time.monotonic() + self.window)
+            self.updates += 1
+            if self._threads is None:
+                self._threads = [threading.Thread(target=self._run, args=(index,),
+                                                  name=f"metadata-write-behind-{index}", daemon=True)
+                                 for index in range(self.shards)]
+                for thread in self._threads:
+                    thread.start()
+            self._conditions[shard].notify()
+
+    def overlay(self, username: str) -> dict:
+        """Changes of a user that the store may not have yet, to apply on top of what it returns."""
+        with self._lock:
+            if username not in self._inflight and username not in self._pending:
+                return {}
+            merged = dict(self._inflight.get(username, {}))
+            merged.update(self._pending.get(username, {}))
+            return merged
+
+    def pending_users(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self, shard: int):
+        deadlines, condition = self._deadlines[shard], self._conditions[shard]
+        while True:
+            with self._lock:
+                while not deadlines:
+                    condition.wait()
+                now = time.monotonic()
+                due = [username for username, deadline in deadlines.items() if deadline <= now]
+                if not due:
+                    condition.wait(min(deadlines.values()) - now)
+                    continue
+            for username in due:
+                self.flush(username)
+
+    def flush(self, username: str):
+        """Write a user's queued changes now."""
+        shard = self._shard(username)
+        with self._flush_locks[shard]:
+            with self._lock:
+                metadata = self._pending.pop(username, None)
+                self._deadlines[shard].pop(username, None)
+                if metadata is None:
+                    return
+                self._inflight[username] = metadata
+            written, failed = False, None
+            try:
+                self.write(username, metadata)
+                written = True
+            except UserNotFound as e:
+                logging.error(f"Dropping queued metadata for '{username}': {str(e)}")
+            except Exception as e:
+                failed = e
+            with self._lock:
+                del self._inflight[username]
+                self.writes += written  # Flushers of other shards count too
+                if failed is None:
+                    self._attempts.pop(username, None)
+                    return
+                attempts = self._attempts.get(username, 0) + 1
+                delay = min(RETRY_DELAY_SECONDS * 2 ** (attempts - 1), MAX_RETRY_DELAY_SECONDS)
+                logging.warning(f"Error writing queued metadata for '{username}' (attempt {attempts}), "
+                                f"retrying in {delay:.0f}s: {str(failed)}")
+                # Put the changes back under any that arrived meanwhile, so newer values still win
+                merged = dict(metadata)
+                merged.update(self._pending.get(username, {}))
+                self._pending[username] = merged
+                self._deadlines[shard][username] = time.monotonic() + delay
+                self._attempts[username] = attempts
+                self._conditions[shard].notify()
+
+    def flush_all(self):
+        """Write every queued change now, e.g. before the process exits."""
+        with self._lock:
+            usernames = list(self._pending)
+        for username in usernames:
+            self.flush(username)
+        with self._lock:
+            unwritten = dict(self._pending)
+        for username, metadata in unwritten.items():
+            # Last resort for acknowledged updates: the log keeps them for replay by hand
+            logging.error(f"Could not write queued metadata for '{username}': {json.dumps(metadata)}")
@@ -0,0 +1,67 @@
+"""
+Benchmark logins per second for different bcrypt cost factors.
+
+Logins run through UserManager.authenticate_user against a local fake bucket (no simulated
+latency by default), from a number of concurrent clients, like a burst of users signing in.
+Run from the api-service-shivas folder:
+
+    python -m benchmarks.bench_bcrypt --rounds 10 11 12 13 --logins 40 --clients 16
+"""
+import argparse
+import contextlib
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from api.utils.password_hasher import PasswordHasher, PasswordHasherBusy, PASSWORD_HASH_WORKERS
+from api.utils.user_manager import UserManager
+from benchmarks.fake_gcs import FakeClient
+
+BUCKET_NAME = "innit_articles_bucket"
+PASSWORD = "correct horse battery staple"
+
+
+def time_logins(rounds, n_logins, n_clients, workers, max_queue, latency):
+    client = FakeClient(latency=latency)
+    hasher = PasswordHasher(rounds=rounds, workers=workers, max_queue=max_queue)
+    user_manager = UserManager(bucket_name=BUCKET_NAME, storage_client=client, password_hasher=hasher)
+    usernames = [f"bench_user_{i}" for i in range(n_clients)]
+    for username in usernames:
+        user_manager.register_user(username, PASSWORD, {"level": "B1"})
+
+    def login(i):
+        try:
+            user_manager.authenticate_user(usernames[i % n_clients], PASSWORD)
+            return True
+        except PasswordHasherBusy:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_clients) as pool:
+        results = list(pool.map(login, range(n_logins)))
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(results), len(results) - sum(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent login requests")
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS, help="Password hash threads")
+    parser.add_argument("--max-queue", type=int, default=1000, help="Hash queue limit (rejections count as busy)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per GCS call")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    print(f"{args.clients} concurrent clients, {args.workers} hash workers")
+    print(f"{'rounds':>7} {'ok':>5} {'busy':>5} {'seconds':>9} {'logins/s':>9} {'ms/login':>9}")
+    for rounds in args.rounds:
+        with contextlib.redirect_stdout(io.StringIO()):  # UserManager prints every login attempt
+            elapsed, ok, busy = time_logins(rounds, args.logins, args.clients, args.workers, args.max_queue,
+                                            args.latency_ms / 1000)
+        print(f"{rounds:>7} {ok:>5} {busy:>5} {elapsed:>9.3f} {ok / elapsed:>9.1f} {1000 * elapsed / max(ok, 1):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark /classify throughput with and without micro-batching.
+
+Concurrent clients submit texts through MicroBatcher, once with --batch-sizes 1 (one forward pass per text)
+and then with larger batches. By default the model is simulated: a forward pass costs a fixed overhead plus
+a smaller cost per text, the shape of a transformer forward pass on CPU. With --real, the DeBERTa classifier
+is loaded (PyTorch and transformers must be installed, and the weights reachable). Run from the
+api-service-shivas folder:
+
+    python -m benchmarks.bench_classify --clients 32 --requests 512 --batch-sizes 1 4 16 32
+"""
+import argparse
+import asyncio
+import time
+from api.utils.micro_batcher import MicroBatcher
+
+TEXT = ("The city council met on Tuesday to discuss plans for a new park near the river. "
+        "Residents said they wanted more trees, a playground and a safe path for bicycles. ")
+
+
+def simulated_model(overhead_ms, per_item_ms):
+    def run_batch(texts):
+        time.sleep((overhead_ms + per_item_ms * len(texts)) / 1000)
+        return [{"level": "B1"} for _ in texts]
+    return run_batch
+
+
+async def drive(batcher, n_requests, n_clients, text):
+    latencies = []
+
+    async def client(requests):
+        for _ in range(requests):
+            start = time.perf_counter()
+            await batcher.submit(text)
+            latencies.append(time.perf_counter() - start)
+
+    share, extra = divmod(n_requests, n_clients)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(share + (i < extra)) for i in range(n_clients)))
+    elapsed = time.perf_counter() - start
+    await batcher.close()
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent requests")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--overhead-ms", type=float, default=40.0, help="Simulated cost of a forward pass")
+    parser.add_argument("--per-item-ms", type=float, default=5.0, help="Simulated cost of each text in it")
+    parser.add_argument("--text-repeat", type=int, default=2, help="Length of the text, in copies of a sample")
+    parser.add_argument("--real", action="store_true", help="Run the DeBERTa classifier instead")
+    args = parser.parse_args()
+
+    if args.real:
+        from api.dependencies import GCP_BUCKET_NAME
+        from api.utils.cefr_classifier import CefrClassifier
+        classifier = CefrClassifier(bucket_name=GCP_BUCKET_NAME)
+        classifier.load()
+        run_batch = classifier.predict
+    else:
+        run_batch = simulated_model(args.overhead_ms, args.per_item_ms)
+
+    text = TEXT * args.text_repeat
+    print(f"{args.clients} concurrent clients, {args.requests} requests, max wait {args.max_wait_ms} ms")
+    print(f"{'batch':>6} {'seconds':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for batch_size in args.batch_sizes:
+        batcher = MicroBatcher(run_batch, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms,
+                               max_queue=args.requests, name="bench_classify")
+        elapsed, p50, p99 = asyncio.run(drive(batcher, args.requests, args.clients, text))
+        print(f"{batch_size:>6} {elapsed:>9.3f} {args.requests / elapsed:>8.1f} {1000 * p50:>8.1f} {1000 * p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
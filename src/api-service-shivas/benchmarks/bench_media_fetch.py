@@ -0,0 +1,57 @@
+"""
+Benchmark MediaManager._fetch_json_files_from_gcp against a local fake bucket.
+
+Shows how listing latency scales with item count for different download concurrency limits.
+Run from the api-service-shivas folder:
+
+    python -m benchmarks.bench_media_fetch --items 10 100 500 --concurrency 1 4 16 32
+"""
+import argparse
+import time
+from api.utils.media_manager import MediaManager
+from benchmarks.fake_gcs import FakeClient
+
+BUCKET_NAME = "innit_articles_bucket"
+FOLDER_PREFIX = "bbc_news/B1/"
+
+
+def seed_bucket(client, n_items):
+    bucket = client.bucket(BUCKET_NAME)
+    for i in range(n_items):
+        bucket.put_json(f"{FOLDER_PREFIX}article_{i:06d}.json", {
+            "id": i,
+            "Title": f"Article {i}",
+            "Text": "Lorem ipsum dolor sit amet. " * 100,
+            "summary": "Short summary.",
+        })
+
+
+def time_fetch(n_items, concurrency, latency):
+    client = FakeClient(latency=latency)
+    seed_bucket(client, n_items)
+    media_manager = MediaManager(bucket_name=BUCKET_NAME, fetch_concurrency=concurrency, storage_client=client)
+
+    start = time.perf_counter()
+    data = media_manager._fetch_json_files_from_gcp(FOLDER_PREFIX)
+    elapsed = time.perf_counter() - start
+    assert len(data) == n_items
+    return elapsed, client.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated latency per GCS call")
+    args = parser.parse_args()
+
+    print(f"Simulated GCS latency: {args.latency_ms:.0f} ms per call")
+    print(f"{'items':>7} {'concurrency':>12} {'calls':>7} {'seconds':>9} {'items/s':>9}")
+    for n_items in args.items:
+        for concurrency in args.concurrency:
+            elapsed, calls = time_fetch(n_items, concurrency, args.latency_ms / 1000)
+            print(f"{n_items:>7} {concurrency:>12} {calls:>7} {elapsed:>9.3f} {n_items / elapsed:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+In-memory stand-in for the parts of google.cloud.storage used by the API service.
+
+Every network operation sleeps for a configurable latency so benchmarks can show how
+request cost scales with the number of GCS round trips, without touching a real bucket.
+"""
+import json
+import threading
+import time
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, generation=None):
+        self.bucket = bucket
+        self.name = name
+        self.generation = generation
+
+    def _stored(self):
+        self.bucket.client.round_trip()
+        with self.bucket.lock:
+            stored = self.bucket.objects.get(self.name)
+        if stored is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        return stored
+
+    def exists(self):
+        self.bucket.client.round_trip()
+        return self.name in self.bucket.objects
+
+    def reload(self):
+        self.generation = self._stored()[1]
+
+    def download_as_bytes(self, start=None, end=None, if_generation_match=None):
+        data, generation = self._stored()
+        if if_generation_match is not None and if_generation_match != generation:
+            raise PreconditionFailed(f"Generation mismatch for {self.name}")
+        self.generation = generation
+        self.bucket.client.bytes_downloaded += len(data)
+        if start is not None or end is not None:
+            # Like GCS, `end` is inclusive
+            data = data[start or 0:None if end is None else end + 1]
+        return data
+
+    def download_as_text(self, **kwargs):
+        return self.download_as_bytes(**kwargs).decode("utf-8")
+
+    def download_to_filename(self, filename, **kwargs):
+        data = self.download_as_bytes(**kwargs)
+        with open(filename, "wb") as f:
+            f.write(data)
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self.bucket.client.round_trip()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self.bucket.lock:
+            current = self.bucket.objects.get(self.name)
+            current_generation = current[1] if current else 0
+            if if_generation_match is not None and if_generation_match != current_generation:
+                raise PreconditionFailed(f"Generation mismatch for {self.name}")
+            self.generation = self.bucket.next_generation()
+            self.bucket.objects[self.name] = (data, self.generation)
+
+    def delete(self):
+        self._stored()
+        with self.bucket.lock:
+            self.bucket.objects.pop(self.name, None)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.objects = {}  # name -> (bytes, generation)
+        self.lock = threading.Lock()
+        self._generation = 0
+
+    def next_generation(self):
+        self._generation += 1
+        return self._generation
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        self.client.round_trip()
+        with self.lock:
+            stored = self.objects.get(name)
+        return FakeBlob(self, name, stored[1]) if stored else None
+
+    def list_blobs(self, prefix=""):
+        self.client.round_trip()
+        with self.lock:
+            names = sorted(name for name in self.objects if name.startswith(prefix))
+            return [FakeBlob(self, name, self.objects[name][1]) for name in names]
+
+    def put_bytes(self, name, data):
+        """Seed an object without paying the simulated latency. Returns its generation."""
+        with self.lock:
+            generation = self.next_generation()
+            self.objects[name] = (data, generation)
+            return generation
+
+    def put_json(self, name, data):
+        return self.put_bytes(name, json.dumps(data).encode("utf-8"))
+
+
+class FakeClient:
+    """Drop-in replacement for storage.Client; buckets are created on first use."""
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.calls = 0
+        self.bytes_downloaded = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def round_trip(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def bucket(self, name):
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = FakeBucket(self, name)
+            return self._buckets[name]
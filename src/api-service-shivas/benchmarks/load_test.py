@@ -0,0 +1,249 @@
+"""
+Load test of the API service against a local fake bucket.
+
+Seeds users, articles and transcripts into benchmarks/fake_gcs.py, then drives the real FastAPI
+app in-process (httpx over ASGI, no network) with a weighted mix of requests from concurrent
+virtual users, and reports throughput and p50/p95/p99 latency per route.
+Run from the api-service-shivas folder:
+
+    python -m benchmarks.load_test --items 1000 --users 200 --clients 32 --requests 5000
+
+Service settings are read from the environment as in production, e.g.
+BCRYPT_ROUNDS=10 USER_STORE_BACKEND=sqlite python -m benchmarks.load_test
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import datetime
+import bcrypt
+import httpx
+from api import dependencies
+from api.routers.diagnostic import DIAGNOSTIC_TEST_PATH
+from api.service import app
+from api.utils.media_manager import BUNDLE_FOLDER, LEVELS
+from api.utils.storage_io import storage_io
+from benchmarks.fake_gcs import FakeClient
+
+PASSWORD = "correct horse battery staple"
+
+# Relative weight of each kind of request in the traffic mix
+DEFAULT_MIX = {
+    "login": 1,
+    "articles": 6,
+    "article": 8,
+    "transcripts": 4,
+    "diagnostic": 1,
+    "update_metadata": 2,
+}
+
+
+LOREM = "Lorem ipsum dolor sit amet. "
+
+
+def filler(n_chars):
+    return (LOREM * (n_chars // len(LOREM) + 1))[:n_chars]
+
+
+def make_article(level, i, text_chars):
+    return {
+        "id": f"{level}-{i}",
+        "Title": f"Article {i} ({level})",
+        "Text": filler(text_chars),
+        "summary": "Short summary.",
+        "vocab": [{"word": "lorem", "definition": "placeholder"}] * 5,
+    }
+
+
+def make_transcript(level, i, text_chars):
+    return {
+        "video_id": f"{level}-video-{i}",
+        "video_name": f"Video {i} ({level})",
+        "transcript": filler(text_chars),
+        "summary": "Short summary.",
+    }
+
+
+def seed_level(bucket, module, level, items, id_key, layout):
+    """Seed one level either as a published bundle (manifest + JSONL content) or as one blob per item."""
+    if layout == "blobs":
+        for item in items:
+            bucket.put_json(f"{module}/{level}/{item[id_key]}.json", item)
+        return
+    content = b"".join((json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8") for item in items)
+    content_generation = bucket.put_bytes(f"{BUNDLE_FOLDER}/{module}/{level}/content.jsonl", content)
+    bucket.put_json(f"{BUNDLE_FOLDER}/{module}/{level}/manifest.json", {
+        "count": len(items),
+        "id_key": id_key,
+        "content_bytes": len(content),
+        "content_sha256": hashlib.sha256(content).hexdigest(),
+        "content_generation": content_generation,
+    })
+
+
+def seed_bucket(client, n_items, n_users, layout, text_chars):
+    """Seed the bucket and return the users (username, level) and the article ids of each level."""
+    bucket = client.bucket(dependencies.GCP_BUCKET_NAME)
+    article_ids = {}
+    for level in LEVELS:
+        articles = [make_article(level, i, text_chars) for i in range(n_items)]
+        seed_level(bucket, "bbc_news", level, articles, "id", layout)
+        seed_level(bucket, "yt_transcripts", level, [make_transcript(level, i, text_chars) for i in range(n_items)],
+                   "video_id", layout)
+        article_ids[level] = [article["id"] for article in articles]
+
+    bucket.put_json(DIAGNOSTIC_TEST_PATH, {"questions": [
+        {"question": f"Question {i}", "options": ["a", "b", "c", "d"], "answer": "a"} for i in range(30)
+    ]})
+
+    # One hash at the service's cost, so logins cost what they do in production and never trigger a rehash
+    rounds = dependencies.user_manager.password_hasher.rounds
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+    users = [(f"load_user_{i}", LEVELS[i % len(LEVELS)]) for i in range(n_users)]
+    created_at = datetime.utcnow().isoformat()
+    for username, level in users:
+        dependencies.user_manager.store.create({"username": username, "password": password_hash,
+                                                "metadata": {"level": level, "xp": 0}, "created_at": created_at})
+    return users, article_ids
+
+
+def parse_mix(value):
+    """Parse a traffic mix like "login=1,articles=6"; routes left out get no traffic."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown request kind '{name}', "
+                                             f"expected one of {', '.join(DEFAULT_MIX)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+class LoadTest:
+    def __init__(self, users, article_ids, mix, n_requests, seed):
+        self.users = users
+        self.article_ids = article_ids
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.remaining = n_requests
+        self.random = random.Random(seed)
+        self.latencies = defaultdict(list)  # route -> seconds
+        self.errors = defaultdict(int)  # route -> responses with an unexpected status
+
+    async def timed(self, route, send):
+        start = time.perf_counter()
+        response = await send()
+        self.latencies[route].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    async def login(self, http, username):
+        response = await self.timed("POST /login", lambda: http.post(
+            "/login", json={"username": username, "password": PASSWORD}))
+        return response.json().get("token") if response.status_code == 200 else None
+
+    async def virtual_user(self, http):
+        username, level = self.random.choice(self.users)
+        token = await self.login(http, username)
+        xp = 0
+        while self.remaining > 0:
+            self.remaining -= 1
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            headers = {"Authorization": f"Bearer {token}"} if token else {"X-Username": username}
+            if kind == "login":
+                token = await self.login(http, username) or token
+            elif kind == "articles":
+                await self.timed("GET /articles", lambda: http.get("/articles", headers=headers))
+            elif kind == "article":
+                article_id = self.random.choice(self.article_ids[level]) if self.article_ids[level] else "missing"
+                await self.timed("GET /articles/{id}", lambda: http.get(f"/articles/{article_id}", headers=headers))
+            elif kind == "transcripts":
+                await self.timed("GET /transcripts", lambda: http.get("/transcripts", headers=headers))
+            elif kind == "diagnostic":
+                await self.timed("GET /diagnostic", lambda: http.get("/diagnostic"))
+            elif kind == "update_metadata":
+                xp += 1
+                await self.timed("PATCH /update-metadata", lambda: http.patch(
+                    "/update-metadata", json={"username": username, "metadata": {"xp": xp}}))
+
+    async def run(self, n_clients):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as http:
+            start = time.perf_counter()
+            await asyncio.gather(*(self.virtual_user(http) for _ in range(n_clients)))
+            return time.perf_counter() - start
+
+
+def report(load_test, elapsed, client):
+    print(f"{'route':<24} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    everything = []
+    for route in sorted(load_test.latencies):
+        latencies = sorted(load_test.latencies[route])
+        everything.extend(latencies)
+        print(f"{route:<24} {len(latencies):>9} {load_test.errors[route]:>7} {len(latencies) / elapsed:>9.1f} "
+              f"{1000 * percentile(latencies, 50):>8.1f} {1000 * percentile(latencies, 95):>8.1f} "
+              f"{1000 * percentile(latencies, 99):>8.1f}")
+    everything.sort()
+    print(f"{'total':<24} {len(everything):>9} {sum(load_test.errors.values()):>7} {len(everything) / elapsed:>9.1f} "
+          f"{1000 * percentile(everything, 50):>8.1f} {1000 * percentile(everything, 95):>8.1f} "
+          f"{1000 * percentile(everything, 99):>8.1f}")
+    print(f"{elapsed:.2f} s, {client.calls} GCS calls, {client.bytes_downloaded / 1e6:.1f} MB downloaded")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000, help="Articles and transcripts per level")
+    parser.add_argument("--text-chars", type=int, default=3000,
+                        help="Length of each article and transcript text; lower it for 100k items per level")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests to send after each client's first login")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Traffic mix, e.g. login=1,articles=6,article=8,transcripts=4,diagnostic=1,"
+                             "update_metadata=2")
+    parser.add_argument("--layout", choices=["bundle", "blobs"], default="bundle",
+                        help="Seed each level as a published bundle or as one blob per item")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated latency per GCS call")
+    parser.add_argument("--cold", action="store_true", help="Do not load the catalogs before sending traffic")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the traffic")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    client = FakeClient(latency=0)
+    dependencies.bind_storage_client(client)
+    seed_start = time.perf_counter()
+    users, article_ids = seed_bucket(client, args.items, args.users, args.layout, args.text_chars)
+    print(f"Seeded {args.items} articles and transcripts per level and {args.users} users "
+          f"in {time.perf_counter() - seed_start:.1f} s ({args.layout} layout)")
+
+    with contextlib.redirect_stdout(io.StringIO()):  # The service prints every catalog load
+        if not args.cold:
+            dependencies.media_manager.refresh_all()
+        client.latency = args.latency_ms / 1000
+        client.calls = client.bytes_downloaded = 0
+        load_test = LoadTest(users, article_ids, args.mix, args.requests, args.seed)
+        elapsed = asyncio.run(load_test.run(args.clients))
+        dependencies.user_manager.flush_pending()
+    storage_io.shutdown()
+
+    print(f"{args.clients} clients, simulated GCS latency {args.latency_ms:.0f} ms per call")
+    report(load_test, elapsed, client)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import { useRouter } from "next/navigation"
 import QuestionCard from "@/components/diagnostic/QuestionCard"
 import styles from "./styles.module.css"
 import DataService from "@/services/DataService"
+import { authFetch } from "@/services/AuthFetch"
 
 export default function DiagnosticTestPage() {
   const [questions, setQuestions] = useState([])
@@ -111,20 +112,21 @@ export default function DiagnosticTestPage() {
 
     try {
       const username = localStorage.getItem("username")
-      const response = await fetch(
-        `${process.env.NEXT_PUBLIC_BASE_API_URL}/update-metadata`,
-        {
-          method: "PATCH",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            username,
-            metadata: { level: userLevel, xp: 0 },
-          }),
-        }
-      )
+      // A new token for the new level is only issued to the holder of the current one
+      const response = await authFetch("/update-metadata", {
+        method: "PATCH",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          username,
+          metadata: { level: userLevel, xp: 0 },
+        }),
+      })
 
       if (response.ok) {
         console.log("User level updated successfully!")
+        // The token carries the level, so replace it with the one issued for the new level
+        const data = await response.json()
+        if (data.token) localStorage.setItem("token", data.token)
       } else {
         const data = await response.json()
         console.error("Error updating user level:", data.detail)
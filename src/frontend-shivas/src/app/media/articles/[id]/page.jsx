@@ -6,6 +6,7 @@ import ArticleText from "@/components/media/ArticleText"
 import ArticleSummary from "@/components/media/MediaSummary"
 import ArticleKeyWords from "@/components/media/MediaKeyWords"
 import ArticleQA from "@/components/media/MediaQA"
+import { authFetch } from "@/services/AuthFetch"
 import styles from "./styles.module.css"
 
 export default function ArticleDetailPage({ params }) {
@@ -21,7 +22,7 @@ export default function ArticleDetailPage({ params }) {
     setLoading(true)
     const username = localStorage.getItem("username") // Get username from localStorage
 
-    fetch(`${process.env.NEXT_PUBLIC_BASE_API_URL}/articles/${id}`, {
+    authFetch(`/articles/${id}`, {
       headers: {
         "Content-Type": "application/json",
         "X-Username": username, // Include the username in the request headers
@@ -2,6 +2,7 @@
 
 import React, { useEffect, useState } from "react"
 import MediaList from "@/components/media/MediaList"
+import { authFetch } from "@/services/AuthFetch"
 import styles from "./styles.module.css"
 
 export default function MediaPage() {
@@ -25,19 +26,22 @@ export default function MediaPage() {
       return
     }
 
+    // The login token carries the user's level, so the API can skip the user lookup
+    const fetchListing = (path) =>
+      authFetch(path).then((response) => {
+        if (!response.ok) {
+          throw new Error(`Request failed with status ${response.status}`)
+        }
+        return response.json()
+      })
+
     // Fetch articles
-    fetch(
-      `${process.env.NEXT_PUBLIC_BASE_API_URL}/articles?username=${storedUsername}`
-    )
-      .then((response) => response.json())
+    fetchListing(`/articles?username=${storedUsername}&limit=5`)
       .then((data) => setArticles(data.articles.slice(0, 5)))
       .catch((error) => console.error("Error fetching articles:", error))
 
     // Fetch videos
-    fetch(
-      `${process.env.NEXT_PUBLIC_BASE_API_URL}/transcripts?username=${storedUsername}`
-    )
-      .then((response) => response.json())
+    fetchListing(`/transcripts?username=${storedUsername}&limit=5`)
       .then((data) => setVideos(data.transcripts.slice(0, 5)))
       .catch((error) =>
         console.error("Error fetching video transcripts:", error)
@@ -6,6 +6,7 @@ import VideoTranscript from "@/components/media/VideoTranscript"
 import KeyWords from "@/components/media/MediaKeyWords"
 import Summary from "@/components/media/MediaSummary"
 import QASection from "@/components/media/MediaQA"
+import { authFetch } from "@/services/AuthFetch"
 import styles from "./styles.module.css"
 
 export default function VideoDetailPage({ params }) {
@@ -17,7 +18,7 @@ export default function VideoDetailPage({ params }) {
   useEffect(() => {
     const username = localStorage.getItem("username") // Get username from localStorage
 
-    fetch(`${process.env.NEXT_PUBLIC_BASE_API_URL}/videos/${id}`, {
+    authFetch(`/videos/${id}`, {
       headers: {
         "Content-Type": "application/json",
         "X-Username": username, // Include username in the headers
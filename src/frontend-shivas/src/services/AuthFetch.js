@@ -0,0 +1,22 @@
+import { BASE_API_URL } from "./Common"
+
+// fetch() against the API with the stored login token.
+// Tokens expire, and the API answers 401 to an expired one: the session is then cleared and the
+// user sent back to the login page, instead of every page failing on the error body.
+export async function authFetch(path, options = {}) {
+  const token = localStorage.getItem("token")
+  const response = await fetch(`${BASE_API_URL}${path}`, {
+    ...options,
+    headers: {
+      ...(options.headers || {}),
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+  })
+  if (response.status === 401) {
+    localStorage.removeItem("token")
+    localStorage.removeItem("username")
+    window.location.assign("/login")
+    throw new Error("Your session has expired, please log in again")
+  }
+  return response
+}
@@ -2,6 +2,7 @@
 import json
 from google.cloud import storage
 import re
+from publish_bundle import upload_bundle
 
 
 BUCKET_NAME = "innit_articles_bucket"
@@ -169,6 +170,17 @@ def main():
         except Exception as e:
             print(f"Failed to upload item with ID {item.get('id')}: {e}")
 
+    # Publish one consolidated bundle per level so the API can load a level in a single read
+    items_by_level = {}
+    for item in data_with_ids:
+        items_by_level.setdefault(item.get('predictions', 'unknown'), []).append(item)
+
+    for level, items in items_by_level.items():
+        try:
+            upload_bundle(BUCKET_NAME, "bbc_news", level, items, "id")
+        except Exception as e:
+            print(f"Failed to upload bundle for level {level}: {e}")
+
 
 if __name__ == "__main__":
     main() # pragma: no cover
\ No newline at end of file
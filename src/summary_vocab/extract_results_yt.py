@@ -3,6 +3,7 @@ import json
 from google.cloud import storage
 import re
 import os
+from publish_bundle import upload_bundle
 
 
 BUCKET_NAME = "innit_articles_bucket"
@@ -186,6 +187,28 @@ def upload_and_sync_selected_folders(bucket_name, local_base_folder, folders_to_
                 bucket.blob(blob_name).delete()
 
 
+def publish_level_bundles(bucket_name, local_base_folder, folders_to_publish):
+    """
+    Pack the transcripts of each level folder into a single bundle in the GCP bucket.
+    Files without a video_id (e.g. id_mapping.json) are not transcripts and are skipped.
+    """
+    for folder in folders_to_publish:
+        local_folder = os.path.join(local_base_folder, folder)
+        if not os.path.isdir(local_folder):
+            print(f"Skipping bundle for '{folder}': folder not found")
+            continue
+
+        items = []
+        for file_name in sorted(os.listdir(local_folder)):
+            if not file_name.endswith(".json"):
+                continue
+            with open(os.path.join(local_folder, file_name), 'r') as f:
+                item = json.load(f)
+            if isinstance(item, dict) and "video_id" in item:
+                items.append(item)
+
+        upload_bundle(bucket_name, MODULE_BLOB_NAME, folder, items, "video_id")
+
 # %%
 
 def main(): # pragma: no cover
@@ -205,6 +228,7 @@ def main(): # pragma: no cover
             print(f"Skipping level '{level}': Missing file(s).")
 
     upload_and_sync_selected_folders(BUCKET_NAME, MODULE_BLOB_NAME, LEVELS, MODULE_BLOB_NAME)
+    publish_level_bundles(BUCKET_NAME, MODULE_BLOB_NAME, LEVELS)
 
 if __name__ == "__main__":
     main() # pragma: no cover
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from datetime import datetime
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+
+
+BUNDLE_FOLDER = "bundles"
+CONTENT_FILE = "content.jsonl"
+INDEX_FILE = "index.json"
+ID_INDEX_FILE = "ids.json"
+CHANGES_FILE = "changes.json"
+MANIFEST_FILE = "manifest.json"
+SEARCH_FILE = "search.db"
+
+# Attempts at updating the id index or a change log when another publish updates it at the same time
+UPDATE_RETRIES = 5
+
+# Publishes kept in each level's change log; clients that synced before the oldest one get the whole level again
+CHANGE_LOG_MAX_ENTRIES = 200
+
+# Ranking of search results: BM25 with weights for the title, body, summary and vocab columns
+SEARCH_RANK = "bm25(5.0, 1.0, 2.0, 2.0)"
+
+
+def build_bundle(items, id_key):
+    """
+    Packs a list of items into a single JSONL payload with an offset index.
+
+    :param items: List of dictionaries to pack, in the order they should be listed.
+    :param id_key: Key holding each item's unique identifier (e.g. "id" or "video_id").
+    :return: Tuple of (content bytes, index dict, manifest dict).
+             The index maps str(item[id_key]) to [byte offset, byte length] in the content.
+    """
+    lines = []
+    index = {}
+    offset = 0
+    for item in items:
+        line = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+        index[str(item.get(id_key))] = [offset, len(line)]
+        offset += len(line)
+        lines.append(line)
+
+    content = b"".join(lines)
+    manifest = {
+        "count": len(items),
+        "id_key": id_key,
+        "content_bytes": len(content),
+        "content_sha256": hashlib.sha256(content).hexdigest(),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    return content, index, manifest
+
+
+def plain_text(value):
+    """
+    Flattens a field into searchable text.
+    Transcripts are lists of {"text", "start", "duration"} segments and vocab may be a string, list or dict.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        if "text" in value:
+            return plain_text(value["text"])
+        return " ".join(plain_text(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return " ".join(plain_text(v) for v in value)
+    return str(value)
+
+
+def build_search_index(items, id_key, path):
+    """
+    Writes a SQLite FTS5 full-text index of the items to `path`.
+    The full-text table is contentless (it only holds the postings), and an `items` table keeps the
+    id, title and summary returned with each match, which makes the file a fraction of the content size.
+    The API downloads the file and queries it read-only, ranked by SEARCH_RANK.
+
+    :param items: List of dictionaries to index (articles or transcripts).
+    :param id_key: Key holding each item's unique identifier (e.g. "id" or "video_id").
+    :param path: File to write; replaced if it exists.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("CREATE TABLE items (rowid INTEGER PRIMARY KEY, doc_id TEXT, title TEXT, summary TEXT)")
+        connection.execute(
+            "CREATE VIRTUAL TABLE documents USING fts5("
+            "title, body, summary, vocab, content = '', tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+        for rowid, item in enumerate(items, start=1):
+            title = plain_text(item.get("Title", item.get("video_name")))
+            summary = plain_text(item.get("summary"))
+            connection.execute("INSERT INTO items (rowid, doc_id, title, summary) VALUES (?, ?, ?, ?)",
+                               (rowid, str(item.get(id_key)), title, summary))
+            connection.execute(
+                "INSERT INTO documents (rowid, title, body, summary, vocab) VALUES (?, ?, ?, ?, ?)",
+                (rowid, title, plain_text(item.get("Text", item.get("transcript"))), summary,
+                 # Vocab strings look like "A1: word, word\nB1: ..."; the level labels are not words to match
+                 re.sub(r"\b[ABC][12]\b", " ", plain_text(item.get("vocab")))),
+            )
+        connection.execute("INSERT INTO documents (documents, rank) VALUES ('rank', ?)", (SEARCH_RANK,))
+        connection.execute("INSERT INTO documents (documents) VALUES ('optimize')")  # One segment: fastest reads
+        connection.commit()
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+
+def merge_id_index(id_index, level, content_path, content_generation, index):
+    """
+    Replaces the entries of one level in a module's id index.
+
+    The id index covers every level of a module: "levels" maps each level to the path and generation of
+    its content, and "ids" maps each item ID to [level, byte offset, byte length] in that content,
+    so the API can fetch any item with one ranged read without knowing its level.
+
+    :param id_index: Current id index of the module (or None if there is none yet).
+    :param level: CEFR level whose entries are replaced.
+    :param content_path: Blob path of the level's content.
+    :param content_generation: Generation of that content.
+    :param index: Offset index of the level, as returned by build_bundle.
+    :return: The new id index.
+    """
+    id_index = id_index or {"levels": {}, "ids": {}}
+    ids = {item_id: entry for item_id, entry in id_index["ids"].items() if entry[0] != level}
+    for item_id, (offset, length) in index.items():
+        ids[item_id] = [level, offset, length]
+    levels = dict(id_index["levels"])
+    levels[level] = {"content": content_path, "generation": content_generation}
+    return {"levels": levels, "ids": ids, "updated_at": datetime.utcnow().isoformat()}
+
+
+def update_json_blob(bucket, blob_name, update):
+    """
+    Rewrites a JSON blob with update(current content or None), conditionally on the generation that was read,
+    so concurrent publishes never drop each other's changes; on a conflict the blob is read and updated again.
+    update() may return None to leave the blob as it is. Returns the content that is stored.
+    """
+    for _ in range(UPDATE_RETRIES):
+        current_blob = bucket.get_blob(blob_name)
+        current = json.loads(current_blob.download_as_text()) if current_blob is not None else None
+        updated = update(current)
+        if updated is None:
+            return current
+        try:
+            bucket.blob(blob_name).upload_from_string(
+                json.dumps(updated, separators=(",", ":")), content_type="application/json",
+                if_generation_match=current_blob.generation if current_blob is not None else 0,
+            )
+            return updated
+        except PreconditionFailed:
+            print(f"{blob_name} changed while it was updated, retrying")
+    raise Exception(f"Could not update {blob_name} after {UPDATE_RETRIES} attempts")
+
+
+def update_id_index(bucket, module, level, content_path, content_generation, index):
+    """Updates bundles/{module}/ids.json with the entries of one level."""
+    return update_json_blob(
+        bucket, f"{BUNDLE_FOLDER}/{module}/{ID_INDEX_FILE}",
+        lambda current: merge_id_index(current, level, content_path, content_generation, index),
+    )
+
+
+def item_hashes(content, index):
+    """Short hash of each item's line in the bundle content, by item ID."""
+    return {item_id: hashlib.sha256(content[offset:offset + length]).hexdigest()[:16]
+            for item_id, (offset, length) in index.items()}
+
+
+def append_change(change_log, hashes, max_entries=CHANGE_LOG_MAX_ENTRIES):
+    """
+    Adds one entry to a level's change log for a publish whose items have the given hashes.
+
+    The change log holds the current "version" of the level (a counter of publishes that changed something),
+    the hash of every item, and one entry per version listing the IDs "added", "updated" and "removed"
+    since the version before it. Only the last `max_entries` entries are kept.
+
+    :param change_log: Current change log of the level (or None if there is none yet).
+    :param hashes: Item hashes of the new publish, as returned by item_hashes.
+    :return: The new change log, or None if nothing changed.
+    """
+    previous = change_log["items"] if change_log else {}
+    added = sorted(item_id for item_id in hashes if item_id not in previous)
+    updated = sorted(item_id for item_id in hashes if item_id in previous and previous[item_id] != hashes[item_id])
+    removed = sorted(item_id for item_id in previous if item_id not in hashes)
+    if change_log and not (added or updated or removed):
+        return None
+
+    version = (change_log["version"] if change_log else 0) + 1
+    entry = {"version": version, "created_at": datetime.utcnow().isoformat(),
+             "added": added, "updated": updated, "removed": removed}
+    entries = (change_log["entries"] if change_log else []) + [entry]
+    return {"version": version, "items": hashes, "entries": entries[-max_entries:]}
+
+
+def upload_bundle(bucket_name, module, level, items, id_key):
+    """
+    Uploads the bundle for one level to bundles/{module}/{level}/ in a GCP bucket.
+    The manifest is written after the content and records the content and index generations,
+    so readers that see a new manifest always find the matching content. It also records the
+    version of the level's change log, which gets an entry whenever the publish changes any item.
+    The module's id index is updated last, once the content it points to is in place.
+
+    :param bucket_name: Name of the GCP bucket.
+    :param module: Content folder the items belong to (e.g. "bbc_news" or "yt_transcripts").
+    :param level: CEFR level of the items.
+    :param items: List of dictionaries to pack.
+    :param id_key: Key holding each item's unique identifier.
+    :return: The manifest that was uploaded.
+    """
+    storage_client = storage.Client()
+    bucket = storage_client.bucket(bucket_name)
+    prefix = f"{BUNDLE_FOLDER}/{module}/{level}"
+
+    content, index, manifest = build_bundle(items, id_key)
+
+    content_path = f"{prefix}/{CONTENT_FILE}"
+    content_blob = bucket.blob(content_path)
+    content_blob.upload_from_string(content, content_type="application/x-ndjson")
+
+    index_blob = bucket.blob(f"{prefix}/{INDEX_FILE}")
+    index_blob.upload_from_string(json.dumps(index), content_type="application/json")
+
+    search_blob = bucket.blob(f"{prefix}/{SEARCH_FILE}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        search_path = os.path.join(tmp_dir, SEARCH_FILE)
+        build_search_index(items, id_key, search_path)
+        search_blob.upload_from_filename(search_path, content_type="application/vnd.sqlite3")
+
+    change_log = update_json_blob(bucket, f"{prefix}/{CHANGES_FILE}",
+                                  lambda current: append_change(current, item_hashes(content, index)))
+
+    manifest["content_generation"] = content_blob.generation
+    manifest["index_generation"] = index_blob.generation
+    manifest["search_generation"] = search_blob.generation
+    manifest["change_version"] = change_log["version"]
+    manifest_blob = bucket.blob(f"{prefix}/{MANIFEST_FILE}")
+    manifest_blob.upload_from_string(json.dumps(manifest, indent=4), content_type="application/json")
+    update_id_index(bucket, module, level, content_path, content_blob.generation, index)
+    print(f"Uploaded bundle {prefix} ({manifest['count']} items)")
+    return manifest
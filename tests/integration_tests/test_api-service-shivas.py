@@ -1,34 +1,79 @@
+import asyncio
+import gzip
+import threading
+import time
 import unittest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 import sys
 import json
+import hashlib
+import os
+import sqlite3
+import tempfile
 from unittest.mock import patch, MagicMock, mock_open
 from datetime import datetime, timedelta
 import bcrypt
 import jwt
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
 import json
 
 # Ensure /app is in the Python path
 sys.path.insert(0, '/app')
 
+import api.dependencies as dependencies
+from api.routers.classify import router as router_classify
 from api.routers.diagnostic import router as router_diagnostic
-from api.utils.media_manager import MediaManager
+import api.routers.diagnostic as diagnostic_router_module
+from api.routers.media import router as router_media
+import api.routers.media as media_router_module
+from api.routers.search import router as router_search
+from api.routers.users import router as router_users
+from api.utils.blob_cache import VersionedBlobCache
+from api.utils.cefr_classifier import ClassifierUnavailable, classification
+from api.utils.change_log import changes_between
+import api.utils.feed_builder as feed_builder_module
+from api.utils.feed_builder import build_feeds
+from api.utils.feed_store import FeedIndex, pack_feeds
+from api.utils.gcs import create_storage_client
+from api.utils.media_manager import CatalogSnapshot, MediaManager, UnknownLevel
+from api.utils.metrics import MetricsMiddleware, record_gcs_call
+import api.utils.metrics as metrics
+from api.utils.micro_batcher import BatcherBusy, MicroBatcher
+from api.utils.password_hasher import PasswordHasher, PasswordHasherBusy
+from api.utils.response_cache import ResponseCache
+from api.utils.search_index import SearchIndex, match_expression
+from api.utils.single_flight import AsyncSingleFlight, SingleFlight
+from api.utils.static_export import StaticExporter, export_level
+from api.utils.storage_io import StorageIO, run_storage
 from api.utils.user_manager import UserManager
+from api.utils.user_store import GCSUserStore, SQLiteUserStore, UserExists, UserStore, migrate_users
+from api.utils.write_behind import MetadataWriteBehind
+from benchmarks.fake_gcs import FakeClient
 
 
 class TestDiagnosticAPI(unittest.TestCase):
     
     def setUp(self):
-        """Set up the test client for the FastAPI router."""
-        self.client = TestClient(router_diagnostic)
+        """Set up the test client for the FastAPI router with a mocked shared storage client."""
+        app = FastAPI()
+        app.include_router(router_diagnostic)
+        self.mock_storage_client = MagicMock()  # Mock the GCP Storage Client
+        app.dependency_overrides[dependencies.get_storage_client] = lambda: self.mock_storage_client
+        self.client = TestClient(app)
+        for name, cache in [("diagnostic_cache", VersionedBlobCache(diagnostic_router_module.DIAGNOSTIC_TEST_PATH, 30)),
+                            ("response_cache", ResponseCache())]:
+            patcher = patch.object(diagnostic_router_module, name, cache)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
-    @patch('api.routers.diagnostic.storage.Client')  # Mock the GCP Storage Client
-    def test_get_diagnostic_test_success(self, mock_storage_client):
+    def test_get_diagnostic_test_success(self):
         """Test fetching the diagnostic test successfully."""
         # Mock the GCP client, bucket, and blob
         mock_bucket = MagicMock()
         mock_blob = MagicMock()
-        mock_storage_client.return_value.bucket.return_value = mock_bucket
+        self.mock_storage_client.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
 
         # Mock blob behavior
@@ -46,29 +91,104 @@ class TestDiagnosticAPI(unittest.TestCase):
         self.assertIn("questions", response.json())
         self.assertEqual(len(response.json()["questions"]), 2)
 
+    def test_get_diagnostic_test_not_modified(self):
+        """Test that a matching If-None-Match is answered with 304 without downloading the test."""
+        mock_blob = self.mock_storage_client.bucket.return_value.blob.return_value
+        mock_blob.generation = 42
+        mock_blob.download_as_text.return_value = json.dumps([{"question": "Q?"}])
+
+        first = self.client.get("/diagnostic")
+        second = self.client.get("/diagnostic", headers={"If-None-Match": first.headers["etag"]})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("max-age", first.headers["cache-control"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers["etag"], first.headers["etag"])
+        mock_blob.download_as_text.assert_called_once()
+
+    def test_get_diagnostic_test_served_from_cache(self):
+        """Test that repeated requests within the check interval touch the bucket once."""
+        mock_blob = self.mock_storage_client.bucket.return_value.blob.return_value
+        mock_blob.generation = 7
+        mock_blob.download_as_text.return_value = json.dumps([{"question": "Q?"}])
+
+        responses = [self.client.get("/diagnostic") for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        mock_blob.reload.assert_called_once()
+        mock_blob.download_as_text.assert_called_once()
+
+
+class TestVersionedBlobCache(unittest.TestCase):
+
+    def _make_bucket(self, generation, content):
+        bucket = MagicMock()
+        blob = bucket.blob.return_value
+        blob.generation = generation
+        blob.download_as_text.return_value = json.dumps(content)
+        return bucket, blob
+
+    def test_reload_only_when_generation_changes(self):
+        """Test that an expired check downloads the body again only for a new generation."""
+        cache = VersionedBlobCache("generated_questions/diagnostic_test.json", check_interval=0)
+        bucket, blob = self._make_bucket(1, ["v1"])
+
+        self.assertEqual(cache.get(bucket), (1, ["v1"]))
+        self.assertEqual(cache.get(bucket), (1, ["v1"]))
+        blob.generation = 2
+        blob.download_as_text.return_value = json.dumps(["v2"])
+        self.assertEqual(cache.get(bucket), (2, ["v2"]))
+
+        self.assertEqual(blob.reload.call_count, 3)
+        self.assertEqual(cache.reloads, 2)
+
+    def test_concurrent_misses_reload_once(self):
+        """Test that callers arriving during a refresh wait for it instead of downloading again."""
+        cache = VersionedBlobCache("generated_questions/diagnostic_test.json", check_interval=30)
+        bucket, blob = self._make_bucket(1, ["v1"])
+        blob.reload.side_effect = lambda: time.sleep(0.05)
+
+        threads = [threading.Thread(target=cache.get, args=(bucket,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        blob.reload.assert_called_once()
+        self.assertEqual(cache.reloads, 1)
+
+    def test_check_failure_serves_cached_copy(self):
+        """Test that a failing metadata check keeps serving the last good copy."""
+        cache = VersionedBlobCache("generated_questions/diagnostic_test.json", check_interval=0)
+        bucket, blob = self._make_bucket(1, ["v1"])
+        cache.get(bucket)
+        blob.reload.side_effect = Exception("GCS unavailable")
+
+        self.assertEqual(cache.get(bucket), (1, ["v1"]))
+
+
 class TestMediaManager(unittest.TestCase):
 
     def setUp(self):
         """Set up the MediaManager instance for testing."""
         self.media_manager = MediaManager(bucket_name="test_bucket")
+        # No level bundles are published unless a test says otherwise
+        bundle_patcher = patch("api.utils.media_manager.MediaManager._get_bundle_manifest_blob", return_value=None)
+        self.mock_bundle_manifest = bundle_patcher.start()
+        self.addCleanup(bundle_patcher.stop)
+        id_index_patcher = patch("api.utils.media_manager.MediaManager._get_id_index", return_value=None)
+        self.mock_id_index = id_index_patcher.start()
+        self.addCleanup(id_index_patcher.stop)
 
     @patch("api.utils.media_manager.storage.Client")
     def test_fetch_json_files_from_gcp_success(self, mock_storage_client):
         """Test fetching JSON files successfully from GCP."""
         mock_bucket = MagicMock()
-        mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.list_blobs.return_value = [
-            MagicMock(name="folder/file1.json"),
-            MagicMock(name="folder/file2.json"),
-        ]
-
-        # Mock blob content
-        mock_blob.download_as_text.side_effect = [
-            '{"id": 1, "content": "Test content 1"}',
-            '{"id": 2, "content": "Test content 2"}'
+            self._make_blob("folder/file1.json", 1, {"id": 1, "content": "Test content 1"}),
+            self._make_blob("folder/file2.json", 1, {"id": 2, "content": "Test content 2"}),
         ]
-        mock_bucket.list_blobs.return_value = [mock_blob, mock_blob]
 
         data = self.media_manager._fetch_json_files_from_gcp("folder")
 
@@ -76,6 +196,27 @@ class TestMediaManager(unittest.TestCase):
         self.assertEqual(data[0]["id"], 1)
         self.assertEqual(data[1]["id"], 2)
 
+    @patch("api.utils.media_manager.storage.Client")
+    def test_fetch_json_files_from_gcp_partial_failure(self, mock_storage_client):
+        """Test that one bad blob is reported without emptying the listing."""
+        mock_bucket = MagicMock()
+        mock_storage_client.return_value.bucket.return_value = mock_bucket
+        bad_blob = self._make_blob("folder/file2.json", 1, {})
+        bad_blob.download_as_text.return_value = "{not json"
+        mock_bucket.list_blobs.return_value = [
+            self._make_blob("folder/file1.json", 1, {"id": 1}),
+            bad_blob,
+            self._make_blob("folder/file3.json", 1, {"id": 3}),
+        ]
+
+        blobs = self.media_manager._list_json_blobs("folder")
+        docs, failures = self.media_manager._download_json_blobs(blobs)
+        data = self.media_manager._fetch_json_files_from_gcp("folder")
+
+        self.assertEqual([doc["id"] if doc else None for doc in docs], [1, None, 3])
+        self.assertEqual(list(failures), ["folder/file2.json"])
+        self.assertEqual([item["id"] for item in data], [1, 3])
+
     @patch("api.utils.media_manager.storage.Client")
     def test_fetch_json_files_from_gcp_no_json(self, mock_storage_client):
         """Test fetching JSON files with no JSON files in the folder."""
@@ -87,87 +228,518 @@ class TestMediaManager(unittest.TestCase):
 
         self.assertEqual(len(data), 0)
 
-    @patch("api.utils.media_manager.MediaManager._fetch_json_files_from_gcp")
-    def test_get_video_transcripts(self, mock_fetch_json):
+    def _make_blob(self, name, generation, content):
+        """Build a mock blob with a name, generation and JSON payload."""
+        blob = MagicMock()
+        blob.name = name
+        blob.generation = generation
+        blob.download_as_text.return_value = json.dumps(content)
+        return blob
+
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_video_transcripts(self, mock_list_blobs):
         """Test fetching video transcripts by level."""
-        mock_fetch_json.return_value = [
-            {"video_id": "1", "content": "Video 1 content"},
-            {"video_id": "2", "content": "Video 2 content"}
+        mock_list_blobs.return_value = [
+            self._make_blob("yt_transcripts/A1/1.json", 1, {"video_id": "1", "content": "Video 1 content"}),
+            self._make_blob("yt_transcripts/A1/2.json", 1, {"video_id": "2", "content": "Video 2 content"}),
         ]
 
         transcripts = self.media_manager.get_video_transcripts(level='A1')
 
-        mock_fetch_json.assert_called_once_with("yt_transcripts/A1/")
+        mock_list_blobs.assert_called_once_with("yt_transcripts/A1/")
         self.assertEqual(len(transcripts), 2)
         self.assertEqual(transcripts[0]["video_id"], "1")
 
-    @patch("api.utils.media_manager.MediaManager._fetch_json_files_from_gcp")
-    def test_get_articles(self, mock_fetch_json):
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_articles(self, mock_list_blobs):
         """Test fetching articles by level."""
-        mock_fetch_json.return_value = [
-            {"id": "1", "content": "Article 1 content"},
-            {"id": "2", "content": "Article 2 content"}
+        mock_list_blobs.return_value = [
+            self._make_blob("bbc_news/B1/1.json", 1, {"id": "1", "content": "Article 1 content"}),
+            self._make_blob("bbc_news/B1/2.json", 1, {"id": "2", "content": "Article 2 content"}),
         ]
 
         articles = self.media_manager.get_articles(level="B1")
 
-        mock_fetch_json.assert_called_once_with("bbc_news/B1/")
+        mock_list_blobs.assert_called_once_with("bbc_news/B1/")
         self.assertEqual(len(articles), 2)
         self.assertEqual(articles[0]["id"], "1")
 
-    @patch("api.utils.media_manager.MediaManager.get_articles")
-    def test_get_article_by_id_found(self, mock_get_articles):
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_articles_served_from_catalog(self, mock_list_blobs):
+        """Test that repeated listings within the TTL do not touch the bucket."""
+        blob = self._make_blob("bbc_news/B1/1.json", 1, {"id": "1"})
+        mock_list_blobs.return_value = [blob]
+
+        self.media_manager.get_articles(level="B1")
+        self.media_manager.get_articles(level="B1")
+        self.media_manager.get_article_by_id(article_id="1", level="B1")
+
+        mock_list_blobs.assert_called_once_with("bbc_news/B1/")
+        blob.download_as_text.assert_called_once()
+
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_unknown_level_gets_no_catalog(self, mock_list_blobs):
+        """Test that a level outside LEVELS is rejected without listing the bucket or caching a catalog."""
+        with self.assertRaises(UnknownLevel):
+            self.media_manager.get_articles(level="NA")
+        with self.assertRaises(UnknownLevel):
+            self.media_manager.refresh_all(levels=["Z9"])
+
+        mock_list_blobs.assert_not_called()
+        self.assertEqual(self.media_manager._catalogs, {})
+
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_catalog_refresh_downloads_only_changed_blobs(self, mock_list_blobs):
+        """Test that an expired catalog only re-downloads blobs whose generation changed."""
+        media_manager = MediaManager(bucket_name="test_bucket", catalog_ttl=0)
+        unchanged = self._make_blob("bbc_news/B1/1.json", 1, {"id": "1", "content": "old"})
+        changed = self._make_blob("bbc_news/B1/2.json", 1, {"id": "2", "content": "old"})
+        mock_list_blobs.return_value = [unchanged, changed]
+        first_version = media_manager.get_catalog("bbc_news/B1/", "id").version
+
+        updated = self._make_blob("bbc_news/B1/2.json", 2, {"id": "2", "content": "new"})
+        mock_list_blobs.return_value = [unchanged, updated]
+        catalog = media_manager._catalog_for("bbc_news/B1/", "id")
+        self.assertTrue(media_manager.refresh_catalog(catalog))
+
+        self.assertNotEqual(catalog.version, first_version)
+        self.assertEqual(catalog.by_id["2"]["content"], "new")
+        unchanged.download_as_text.assert_called_once()
+        updated.download_as_text.assert_called_once()
+
+    @patch("api.utils.media_manager.MediaManager._refresh_in_background")
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_stale_catalog_served_while_refreshing(self, mock_list_blobs, mock_refresh_in_background):
+        """Test that a stale snapshot is returned immediately and rebuilt in the background."""
+        media_manager = MediaManager(bucket_name="test_bucket", catalog_ttl=0)
+        mock_list_blobs.return_value = [self._make_blob("bbc_news/B1/1.json", 1, {"id": "1"})]
+        media_manager.get_articles(level="B1")
+
+        mock_list_blobs.return_value = []
+        articles = media_manager.get_articles(level="B1")
+
+        self.assertEqual(len(articles), 1)
+        mock_list_blobs.assert_called_once()
+        mock_refresh_in_background.assert_called_once()
+
+    @patch("api.utils.media_manager.storage.Client")
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_articles_from_bundle(self, mock_list_blobs, mock_storage_client):
+        """Test that a published level bundle is loaded in one read instead of listing blobs."""
+        content = b'{"id": 1, "Title": "One"}\n{"id": 2, "Title": "Two"}\n'
+        manifest_blob = MagicMock()
+        manifest_blob.name = "bundles/bbc_news/B1/manifest.json"
+        manifest_blob.generation = 7
+        manifest_blob.download_as_text.return_value = json.dumps({
+            "count": 2,
+            "content_generation": 3,
+            "content_sha256": hashlib.sha256(content).hexdigest(),
+        })
+        self.mock_bundle_manifest.return_value = manifest_blob
+        content_blob = mock_storage_client.return_value.bucket.return_value.blob.return_value
+        content_blob.download_as_bytes.return_value = content
+
+        articles = self.media_manager.get_articles(level="B1")
+
+        mock_list_blobs.assert_not_called()
+        content_blob.download_as_bytes.assert_called_once_with(if_generation_match=3)
+        self.assertEqual([article["Title"] for article in articles], ["One", "Two"])
+        self.assertEqual(self.media_manager.get_article_by_id(article_id="2", level="B1")["Title"], "Two")
+
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_list_articles_pagination_and_projection(self, mock_list_blobs):
+        """Test that listings are paged and reduced to the summary fields by default."""
+        mock_list_blobs.return_value = [
+            self._make_blob(f"bbc_news/B1/{i}.json", 1,
+                            {"id": i, "Title": f"Title {i}", "summary": "Sum", "Text": "Long text", "questions": "[]"})
+            for i in range(5)
+        ]
+
+        first_page, next_offset, total = self.media_manager.list_articles(level="B1", limit=2)
+        last_page, last_next_offset, _ = self.media_manager.list_articles(level="B1", offset=4, limit=2)
+        titles, _, _ = self.media_manager.list_articles(level="B1", fields=("Title",), limit=5)
+
+        self.assertEqual(first_page, [{"id": 0, "Title": "Title 0", "summary": "Sum"},
+                                      {"id": 1, "Title": "Title 1", "summary": "Sum"}])
+        self.assertEqual((next_offset, total), (2, 5))
+        self.assertEqual([article["id"] for article in last_page], [4])
+        self.assertIsNone(last_next_offset)
+        self.assertEqual(titles[3], {"Title": "Title 3"})
+
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_article_by_id_found(self, mock_list_blobs):
         """Test fetching a specific article by ID successfully."""
-        mock_get_articles.return_value = [
-            {"id": "1", "content": "Article 1 content"},
-            {"id": "2", "content": "Article 2 content"}
+        mock_list_blobs.return_value = [
+            self._make_blob("bbc_news/B2/1.json", 1, {"id": 1, "content": "Article 1 content"}),
+            self._make_blob("bbc_news/B2/2.json", 1, {"id": 2, "content": "Article 2 content"}),
         ]
 
         article = self.media_manager.get_article_by_id(article_id="2", level="B2")
 
-        mock_get_articles.assert_called_once_with("B2")
+        mock_list_blobs.assert_called_once_with("bbc_news/B2/")
         self.assertIsNotNone(article)
-        self.assertEqual(article["id"], "2")
+        self.assertEqual(article["id"], 2)
 
-    @patch("api.utils.media_manager.MediaManager.get_articles")
-    def test_get_article_by_id_not_found(self, mock_get_articles):
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_article_by_id_not_found(self, mock_list_blobs):
         """Test fetching a specific article by ID that does not exist."""
-        mock_get_articles.return_value = [
-            {"id": "1", "content": "Article 1 content"}
+        mock_list_blobs.return_value = [
+            self._make_blob("bbc_news/B2/1.json", 1, {"id": "1", "content": "Article 1 content"}),
         ]
 
         article = self.media_manager.get_article_by_id(article_id="3", level="B2")
 
-        mock_get_articles.assert_called_once_with("B2")
+        mock_list_blobs.assert_called_once_with("bbc_news/B2/")
         self.assertIsNone(article)
 
-    @patch("api.utils.media_manager.MediaManager.get_video_transcripts")
-    def test_get_video_by_id_found(self, mock_get_transcripts):
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_video_by_id_found(self, mock_list_blobs):
         """Test fetching a specific video by ID successfully."""
-        mock_get_transcripts.return_value = [
-            {"video_id": "1", "content": "Video 1 content"},
-            {"video_id": "2", "content": "Video 2 content"}
+        mock_list_blobs.return_value = [
+            self._make_blob("yt_transcripts/A1/1.json", 1, {"video_id": "1", "content": "Video 1 content"}),
+            self._make_blob("yt_transcripts/A1/2.json", 1, {"video_id": "2", "content": "Video 2 content"}),
         ]
 
         video = self.media_manager.get_video_by_id(video_id="2", level="A1")
 
-        mock_get_transcripts.assert_called_once_with("A1")
+        mock_list_blobs.assert_called_once_with("yt_transcripts/A1/")
         self.assertIsNotNone(video)
         self.assertEqual(video["video_id"], "2")
 
-    @patch("api.utils.media_manager.MediaManager.get_video_transcripts")
-    def test_get_video_by_id_not_found(self, mock_get_transcripts):
+    @patch("api.utils.media_manager.MediaManager._list_json_blobs")
+    def test_get_video_by_id_not_found(self, mock_list_blobs):
         """Test fetching a specific video by ID that does not exist."""
-        mock_get_transcripts.return_value = [
-            {"video_id": "1", "content": "Video 1 content"}
+        mock_list_blobs.return_value = [
+            self._make_blob("yt_transcripts/A1/1.json", 1, {"video_id": "1", "content": "Video 1 content"}),
         ]
 
         video = self.media_manager.get_video_by_id(video_id="3", level="A1")
 
-        mock_get_transcripts.assert_called_once_with("A1")
+        mock_list_blobs.assert_called_once_with("yt_transcripts/A1/")
         self.assertIsNone(video)
 
 
+class TestMediaAPI(unittest.TestCase):
+
+    def setUp(self):
+        """Set up the test client for the media router with a fixed user level."""
+        app = FastAPI()
+        app.include_router(router_media)
+        self.client = TestClient(app)
+        metadata_patcher = patch.object(dependencies.user_manager, "get_metadata", return_value={"level": "B1"})
+        self.mock_get_metadata = metadata_patcher.start()
+        self.addCleanup(metadata_patcher.stop)
+        record_read_patcher = patch.object(dependencies.user_manager, "record_read")
+        self.mock_record_read = record_read_patcher.start()
+        self.addCleanup(record_read_patcher.stop)
+        id_index_patcher = patch.object(dependencies.media_manager, "_get_id_index", return_value=None)
+        id_index_patcher.start()
+        self.addCleanup(id_index_patcher.stop)
+
+    def _patch_snapshot(self, items):
+        patcher = patch.object(dependencies.media_manager, "article_snapshot",
+                               return_value=CatalogSnapshot(items, "id", "v1"))
+        mock_snapshot = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mock_snapshot
+
+    def test_list_articles_page(self):
+        """Test that /articles applies paging and projection and returns a next cursor."""
+        mock_snapshot = self._patch_snapshot([{"id": i, "Title": str(i), "Text": "Body"} for i in range(10)])
+
+        response = self.client.get("/articles?username=test_user&limit=1&cursor=2&fields=id,Title")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"articles": [{"id": 2, "Title": "2"}], "next_cursor": "3", "total": 10})
+        mock_snapshot.assert_called_once_with("B1")
+
+    def test_list_articles_ndjson_stream(self):
+        """Test that ?format=ndjson streams every full article as one JSON object per line."""
+        self._patch_snapshot([{"id": 1, "Text": "One"}, {"id": 2, "Text": "Two"}])
+
+        response = self.client.get("/articles?username=test_user&format=ndjson")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(lines, [{"id": 1, "Text": "One"}, {"id": 2, "Text": "Two"}])
+
+    def test_list_articles_etag(self):
+        """Test that listings carry an ETag and answer a matching If-None-Match with 304."""
+        self._patch_snapshot([{"id": 1, "Title": "One"}])
+
+        first = self.client.get("/articles?username=test_user")
+        second = self.client.get("/articles?username=test_user", headers={"If-None-Match": first.headers["etag"]})
+        other_page = self.client.get("/articles?username=test_user&limit=5",
+                                     headers={"If-None-Match": first.headers["etag"]})
+
+        self.assertEqual(first.headers["cache-control"], "private, no-cache")
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(other_page.status_code, 200)
+
+    def test_list_articles_compressed_once(self):
+        """Test that a page is serialized once per ETag and served gzip-encoded when accepted."""
+        self._patch_snapshot([{"id": i, "Title": "Title " * 20} for i in range(20)])
+        patcher = patch.object(media_router_module, "response_cache", ResponseCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        first = self.client.get("/articles?username=test_user", headers={"Accept-Encoding": "gzip"})
+        second = self.client.get("/articles?username=test_user", headers={"Accept-Encoding": "gzip"})
+        revalidated = self.client.get("/articles?username=test_user", headers={"If-None-Match": first.headers["etag"]})
+
+        self.assertEqual(first.headers["content-encoding"], "gzip")
+        self.assertTrue(first.headers["etag"].endswith('-gzip"'))
+        self.assertEqual(len(second.json()["articles"]), 20)
+        self.assertEqual((media_router_module.response_cache.misses, media_router_module.response_cache.hits), (1, 1))
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_list_articles_with_token_skips_user_lookup(self):
+        """Test that the level claim of a bearer token picks the catalog without reading the user."""
+        mock_snapshot = self._patch_snapshot([{"id": 1, "Title": "One"}])
+        token = dependencies.user_manager.issue_token("test_user", {"level": "C1"})
+
+        response = self.client.get("/articles", headers={"Authorization": f"Bearer {token}"})
+
+        self.assertEqual(response.status_code, 200)
+        mock_snapshot.assert_called_once_with("C1")
+        self.mock_get_metadata.assert_not_called()
+
+    def test_list_articles_invalid_token(self):
+        """Test that a bad token is rejected, even with a username header to fall back on."""
+        self._patch_snapshot([])
+
+        response = self.client.get("/articles", headers={"Authorization": "Bearer not-a-token"})
+        with_header = self.client.get("/articles", headers={"Authorization": "Bearer not-a-token",
+                                                             "X-Username": "test_user"})
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(with_header.status_code, 401)
+        self.mock_get_metadata.assert_not_called()
+
+    def test_unknown_level_is_rejected(self):
+        """Test that a user level with no content answers 400 on listings and lookups by ID."""
+        self.mock_get_metadata.return_value = {"level": "NA"}
+        mock_snapshot = self._patch_snapshot([{"id": 1, "Title": "One"}])
+
+        listing = self.client.get("/articles?username=test_user")
+        detail = self.client.get("/articles/1", headers={"X-Username": "test_user"})
+
+        self.assertEqual((listing.status_code, detail.status_code), (400, 400))
+        mock_snapshot.assert_not_called()
+
+    def test_get_article_not_found(self):
+        """Test that an unknown article ID returns 404."""
+        self._patch_snapshot([{"id": 1, "Title": "One"}])
+
+        response = self.client.get("/articles/2", headers={"X-Username": "test_user"})
+
+        self.assertEqual(response.status_code, 404)
+        self.mock_record_read.assert_not_called()
+
+    def test_get_article_records_read(self):
+        """Test that opening an article adds it to the user's reading history after the response."""
+        self._patch_snapshot([{"id": 1, "Title": "One"}])
+
+        response = self.client.get("/articles/1", headers={"X-Username": "test_user"})
+
+        self.assertEqual(response.status_code, 200)
+        self.mock_record_read.assert_called_once_with("test_user", "article:1")
+
+    def test_get_article_revalidation_skips_fetch_and_read(self):
+        """Test that a matching If-None-Match gets 304 without fetching the article or recording a read."""
+        self._patch_snapshot([{"id": 1, "Title": "One"}])
+        first = self.client.get("/articles/1", headers={"X-Username": "test_user"})
+        self.mock_record_read.reset_mock()
+
+        with patch.object(dependencies.media_manager, "find_article") as mock_find:
+            response = self.client.get("/articles/1", headers={"X-Username": "test_user",
+                                                               "If-None-Match": first.headers["etag"]})
+
+        self.assertEqual(response.status_code, 304)
+        mock_find.assert_not_called()
+        self.mock_record_read.assert_not_called()
+
+    def _patch_feeds(self, users, rows):
+        """Serve packed feeds over two B1 articles and one B1 video from a fake bucket."""
+        client = FakeClient(latency=0)
+        client.bucket(dependencies.GCP_BUCKET_NAME).put_bytes("feeds/feeds.bin", pack_feeds(
+            {"feed_size": 3, "items": [["article", "B1", "1"], ["article", "B1", "2"], ["video", "B1", "v"]],
+             "users": users},
+            b"".join(index.to_bytes(4, "little", signed=True) for row in rows for index in row),
+        ))
+        self.client.app.dependency_overrides[dependencies.get_storage_client] = lambda: client
+        patcher = patch.object(media_router_module, "feed_cache",
+                               VersionedBlobCache("feeds/feeds.bin", 60, parse=FeedIndex, name="feed"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_feed(self):
+        """Test that /feed serves the precomputed order, skipping items that no longer exist."""
+        self._patch_feeds(["other_user", "test_user"], [[0, 1, -1], [2, 1, 0]])
+        self._patch_snapshot([{"id": 1, "Title": "One", "Text": "Body"}])
+        patcher = patch.object(dependencies.media_manager, "transcript_snapshot",
+                               return_value=CatalogSnapshot([{"video_id": "v", "video_name": "Video"}], "video_id", "v1"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        response = self.client.get("/feed?username=test_user")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"personalized": True, "feed": [
+            {"type": "video", "video_id": "v", "video_name": "Video"},
+            {"type": "article", "id": 1, "Title": "One"},
+        ]})
+
+    def test_get_feed_falls_back_to_level_listing(self):
+        """Test that users without a precomputed feed get the first articles of their level."""
+        self._patch_feeds(["other_user"], [[0, 1, -1]])
+        mock_snapshot = self._patch_snapshot([{"id": i, "Title": str(i)} for i in range(5)])
+
+        response = self.client.get("/feed?username=test_user&limit=2")
+
+        self.assertEqual(response.json(), {"personalized": False, "feed": [
+            {"type": "article", "id": 0, "Title": "0"}, {"type": "article", "id": 1, "Title": "1"},
+        ]})
+        mock_snapshot.assert_called_once_with("B1")
+
+    def test_list_articles_invalid_cursor(self):
+        """Test that a malformed cursor is rejected."""
+        response = self.client.get("/articles?username=test_user&cursor=abc")
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestStorageIO(unittest.TestCase):
+
+    def test_calls_run_off_the_event_loop_with_a_concurrency_cap(self):
+        """Test that blocking calls run on the storage pool and never more than max_workers at a time."""
+        storage = StorageIO(max_workers=2)
+        self.addCleanup(storage.shutdown)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_call():
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.pop()
+            return threading.get_ident()
+
+        async def run_all():
+            return await asyncio.gather(*(storage.run(slow_call) for _ in range(6)))
+
+        thread_ids = asyncio.run(run_all())
+
+        self.assertNotIn(threading.get_ident(), thread_ids)
+        self.assertEqual(max(peak), 2)
+
+
+class TestStorageClient(unittest.TestCase):
+
+    def test_create_storage_client_sizes_connection_pool(self):
+        """Test that the shared client's HTTP session gets the configured pool size and reports it on /metrics."""
+        anonymous_client = storage.Client.create_anonymous_client()
+        with patch("api.utils.gcs.storage.Client", return_value=anonymous_client):
+            create_storage_client(pool_maxsize=48, pool_connections=2)
+        exported = metrics.render().decode("utf-8")
+
+        self.assertIn("gcs_pool_maxsize 48.0", exported)
+        self.assertIn("gcs_pool_hosts 2.0", exported)
+        self.assertNotIn("gcs_pool_requests_total{", exported)  # No request made yet
+
+    def test_bind_storage_client_shares_one_client(self):
+        """Test that binding a client hands the same instance to both managers and the dependency."""
+        client = MagicMock()
+        previous = (dependencies._storage_client, dependencies.media_manager._storage_client,
+                    dependencies.user_manager._storage_client)
+        self.addCleanup(self._restore, previous)
+
+        dependencies.bind_storage_client(client)
+
+        self.assertIs(dependencies.get_storage_client(), client)
+        self.assertIs(dependencies.media_manager.storage_client, client)
+        self.assertIs(dependencies.user_manager.storage_client, client)
+
+    @staticmethod
+    def _restore(previous):
+        (dependencies._storage_client, dependencies.media_manager._storage_client,
+         dependencies.user_manager._storage_client) = previous
+
+
+class TestPasswordHasher(unittest.TestCase):
+
+    def test_hash_and_verify_with_configured_cost(self):
+        """Test that hashes use the configured cost and only other costs need a rehash."""
+        hasher = PasswordHasher(rounds=4, workers=1)
+        hashed = hasher.hash("securepassword")
+
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertTrue(hasher.verify("securepassword", hashed))
+        self.assertFalse(hasher.verify("wrongpassword", hashed))
+        self.assertFalse(hasher.needs_rehash(hashed))
+        self.assertTrue(PasswordHasher(rounds=5).needs_rehash(hashed))
+
+    def test_full_queue_is_rejected(self):
+        """Test that requests beyond workers + queue fail fast instead of waiting."""
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash(*args):
+            started.set()
+            release.wait(5)
+            return b"hash"
+
+        worker = threading.Thread(target=hasher._run, args=(slow_hash,))
+        worker.start()
+        started.wait(5)
+        with self.assertRaises(PasswordHasherBusy):
+            hasher.hash("securepassword")
+        release.set()
+        worker.join()
+
+    def test_async_checks_beyond_the_queue_are_rejected(self):
+        """Test that async checks wait on the hasher's own pool and fail fast once workers + queue are taken."""
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=1)
+        hashed = hasher.hash("securepassword")
+
+        async def run_all():
+            return await asyncio.gather(*(hasher.verify_async("securepassword", hashed) for _ in range(3)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run_all())
+
+        self.assertEqual(results[:2], [True, True])
+        self.assertIsInstance(results[2], PasswordHasherBusy)
+
+    def test_cancelled_check_holds_its_slot_until_bcrypt_finishes(self):
+        """Test that cancelling an async check does not free its slot while the hash is still running."""
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash(*args):
+            started.set()
+            release.wait(5)
+            return b"hash"
+
+        async def cancel_then_check():
+            task = asyncio.ensure_future(hasher._run_async(slow_hash))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            with self.assertRaises(PasswordHasherBusy):
+                await hasher.hash_async("securepassword")
+            release.set()
+            await asyncio.get_running_loop().run_in_executor(None, hasher.executor.submit(lambda: None).result)
+            return await hasher.hash_async("securepassword")
+
+        self.assertTrue(asyncio.run(cancel_then_check()).startswith("$2b$04$"))
+
+
 class TestUserManager(unittest.TestCase):
     def setUp(self):
         """Set up UserManager instance and test data."""
@@ -186,11 +758,11 @@ class TestUserManager(unittest.TestCase):
         mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
-        mock_blob.exists.return_value = False
 
         self.user_manager.register_user(self.username, self.password, self.metadata)
 
         mock_blob.upload_from_string.assert_called_once()
+        self.assertEqual(mock_blob.upload_from_string.call_args.kwargs["if_generation_match"], 0)
         uploaded_data = json.loads(mock_blob.upload_from_string.call_args[0][0])
         self.assertEqual(uploaded_data["username"], self.username)
         self.assertIn("password", uploaded_data)
@@ -203,7 +775,7 @@ class TestUserManager(unittest.TestCase):
         mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
-        mock_blob.exists.return_value = True
+        mock_blob.upload_from_string.side_effect = PreconditionFailed("users/test_user.json exists")
 
         with self.assertRaises(Exception) as context:
             self.user_manager.register_user(self.username, self.password, self.metadata)
@@ -217,7 +789,6 @@ class TestUserManager(unittest.TestCase):
         mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
-        mock_blob.exists.return_value = True
         mock_blob.download_as_text.return_value = json.dumps({
             "username": self.username,
             "password": self.hashed_password,
@@ -228,6 +799,24 @@ class TestUserManager(unittest.TestCase):
 
         decoded_token = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
         self.assertEqual(decoded_token["username"], self.username)
+        self.assertEqual(decoded_token["level"], self.metadata["level"])
+
+    @patch("api.utils.user_manager.storage.Client")
+    def test_authenticate_user_rehashes_on_cost_change(self, mock_storage_client):
+        """Test that a login with a hash of another cost stores a new hash with the configured cost."""
+        user_manager = UserManager(bucket_name="test_bucket", password_hasher=PasswordHasher(rounds=4))
+        mock_blob = mock_storage_client.return_value.bucket.return_value.blob.return_value
+        mock_blob.download_as_text.return_value = json.dumps({
+            "username": self.username,
+            "password": self.hashed_password,
+            "metadata": self.metadata,
+        })
+
+        user_manager.authenticate_user(self.username, self.password)
+
+        stored = json.loads(mock_blob.upload_from_string.call_args[0][0])
+        self.assertTrue(stored["password"].startswith("$2b$04$"))
+        self.assertEqual(stored["metadata"], self.metadata)
 
     @patch("api.utils.user_manager.storage.Client")
     def test_authenticate_user_invalid_credentials(self, mock_storage_client):
@@ -236,7 +825,6 @@ class TestUserManager(unittest.TestCase):
         mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
-        mock_blob.exists.return_value = True
         mock_blob.download_as_text.return_value = json.dumps({
             "username": self.username,
             "password": self.hashed_password,
@@ -255,7 +843,6 @@ class TestUserManager(unittest.TestCase):
         mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
-        mock_blob.exists.return_value = True
         mock_blob.download_as_text.return_value = json.dumps({
             "username": self.username,
             "password": self.hashed_password,
@@ -276,7 +863,6 @@ class TestUserManager(unittest.TestCase):
         mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
-        mock_blob.exists.return_value = True
         mock_blob.download_as_text.return_value = json.dumps({
             "username": self.username,
             "password": self.hashed_password,
@@ -293,13 +879,897 @@ class TestUserManager(unittest.TestCase):
         mock_blob = MagicMock()
         mock_storage_client.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
-        mock_blob.exists.return_value = False
+        mock_blob.download_as_text.side_effect = NotFound("users/test_user.json")
 
         with self.assertRaises(Exception) as context:
             self.user_manager.get_metadata(self.username)
 
         self.assertEqual(str(context.exception), f"User '{self.username}' not found")
 
+    @patch("api.utils.user_manager.storage.Client")
+    def test_get_metadata_served_from_cache(self, mock_storage_client):
+        """Test that repeated reads cost one GET and updates are written through to the cache."""
+        mock_blob = mock_storage_client.return_value.bucket.return_value.blob.return_value
+        mock_blob.download_as_text.return_value = json.dumps({
+            "username": self.username,
+            "password": self.hashed_password,
+            "metadata": self.metadata,
+        })
+
+        self.assertEqual(self.user_manager.get_metadata(self.username), self.metadata)
+        self.user_manager.update_metadata(self.username, {"level": "C1"})
+        self.assertEqual(self.user_manager.get_metadata(self.username), {"level": "C1"})
+
+        mock_blob.download_as_text.assert_called_once()
+        mock_blob.exists.assert_not_called()
+
+    @patch("api.utils.user_manager.storage.Client")
+    def test_validated_cache_redownloads_changed_record(self, mock_storage_client):
+        """Test that with validation on, a write from another worker (new generation) is picked up."""
+        user_manager = UserManager(bucket_name="test_bucket", validate_cache=True)
+        mock_blob = mock_storage_client.return_value.bucket.return_value.blob.return_value
+        mock_blob.generation = 1
+        mock_blob.download_as_text.return_value = json.dumps({"username": self.username, "metadata": {"level": "A1"}})
+
+        user_manager.get_metadata(self.username)
+        user_manager.get_metadata(self.username)  # Same generation: served from the cache
+        mock_blob.generation = 2
+        mock_blob.download_as_text.return_value = json.dumps({"username": self.username, "metadata": {"level": "B2"}})
+
+        self.assertEqual(user_manager.get_metadata(self.username), {"level": "B2"})
+        self.assertEqual(mock_blob.download_as_text.call_count, 2)
+
+
+
+class TestSQLiteUserStore(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a store in a fresh database file."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = SQLiteUserStore(os.path.join(tmp.name, "users.db"))
+        self.record = {"username": "test_user", "password": "hash", "metadata": {"level": "B1"},
+                       "created_at": "2024-01-01T00:00:00"}
+
+    def test_backends_must_implement_every_method(self):
+        """Test that a store missing part of the UserStore interface cannot be created."""
+        class PartialStore(UserStore):
+            def get(self, username):
+                return None
+
+        with self.assertRaises(TypeError):
+            PartialStore()
+
+    def test_create_get_and_merge_metadata(self):
+        """Test that metadata updates merge into the stored record and bump its version."""
+        version = self.store.create(self.record)
+        with self.assertRaises(UserExists):
+            self.store.create(self.record)
+
+        record, new_version = self.store.update_metadata("test_user", {"xp": 2})
+
+        self.assertEqual(record["metadata"], {"level": "B1", "xp": 2})
+        self.assertEqual(self.store.get("test_user"), (record, new_version))
+        self.assertFalse(self.store.is_current("test_user", version))
+        self.assertTrue(self.store.is_current("test_user", new_version))
+        self.assertIsNone(self.store.get("missing_user"))
+
+    def test_concurrent_merges_are_not_lost(self):
+        """Test that merges from several threads all land, since each one is a transaction."""
+        self.store.create(self.record)
+        threads = [threading.Thread(target=self.store.update_metadata, args=("test_user", {f"key_{i}": i}))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        record, version = self.store.get("test_user")
+        self.assertEqual(len(record["metadata"]), 9)
+        self.assertEqual(version, 9)
+
+    def test_migrate_users_from_bucket(self):
+        """Test that every blob under users/ is imported and can be queried by level."""
+        client = FakeClient(latency=0)
+        bucket = client.bucket("test_bucket")
+        for i, level in enumerate(["A1", "B1", "B1"]):
+            bucket.put_json(f"users/user_{i}.json", dict(self.record, username=f"user_{i}", metadata={"level": level}))
+
+        copied = migrate_users(GCSUserStore("test_bucket", lambda: client), self.store, batch_size=2)
+
+        self.assertEqual(copied, 3)
+        self.assertEqual(self.store.list_usernames(level="B1"), ["user_1", "user_2"])
+
+    def test_user_manager_on_sqlite(self):
+        """Test registering, logging in and updating metadata through the SQLite backend."""
+        user_manager = UserManager(bucket_name="test_bucket", store=self.store,
+                                   password_hasher=PasswordHasher(rounds=4))
+
+        user_manager.register_user("new_user", "securepassword", {"level": "A2"})
+        token = user_manager.authenticate_user("new_user", "securepassword")
+        user_manager.update_metadata("new_user", {"level": "B2"})
+
+        self.assertEqual(user_manager.decode_token(token)["level"], "A2")
+        self.assertEqual(self.store.get("new_user")[0]["metadata"], {"level": "B2"})
+
+    def test_async_register_and_login_rehash_old_cost(self):
+        """Test the async sign-up and login used by the router, including the rehash of an old cost."""
+        user_manager = UserManager(bucket_name="test_bucket", store=self.store,
+                                   password_hasher=PasswordHasher(rounds=4))
+        asyncio.run(user_manager.register("new_user", "securepassword", {"level": "A2"}))
+        user_manager.password_hasher = PasswordHasher(rounds=5)
+
+        token = asyncio.run(user_manager.authenticate("new_user", "securepassword"))
+
+        self.assertEqual(user_manager.decode_token(token)["level"], "A2")
+        self.assertTrue(self.store.get("new_user")[0]["password"].startswith("$2b$05$"))
+        with self.assertRaises(Exception):
+            asyncio.run(user_manager.authenticate("new_user", "wrongpassword"))
+
+
+class TestUsersAPI(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.include_router(router_users)
+        self.client = TestClient(app)
+        update_patcher = patch.object(dependencies.user_manager, "update_metadata", return_value={"level": "C1"})
+        self.mock_update = update_patcher.start()
+        self.addCleanup(update_patcher.stop)
+
+    def test_level_change_reissues_token_only_to_its_holder(self):
+        """Test that only a caller holding a token for the same user gets a new token after a level change."""
+        body = {"username": "victim", "metadata": {"level": "C1"}}
+        own_token = dependencies.user_manager.issue_token("victim", {"level": "A1"})
+        other_token = dependencies.user_manager.issue_token("attacker", {"level": "A1"})
+
+        anonymous = self.client.patch("/update-metadata", json=body)
+        other = self.client.patch("/update-metadata", json=body, headers={"Authorization": f"Bearer {other_token}"})
+        own = self.client.patch("/update-metadata", json=body, headers={"Authorization": f"Bearer {own_token}"})
+
+        self.assertEqual(anonymous.status_code, 200)
+        self.assertNotIn("token", anonymous.json())
+        self.assertNotIn("token", other.json())
+        claims = dependencies.user_manager.decode_token(own.json()["token"])
+        self.assertEqual((claims["username"], claims["level"]), ("victim", "C1"))
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.patch("/update-metadata", json={"username": "victim", "metadata": {"level": "C1"}},
+                                     headers={"Authorization": "Bearer not-a-token"})
+
+        self.assertEqual(response.status_code, 401)
+        self.mock_update.assert_not_called()
+
+
+class TestMetadataWriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a user in a fake bucket and a manager that queues metadata updates."""
+        self.client = FakeClient(latency=0)
+        self.bucket = self.client.bucket("test_bucket")
+        self.bucket.put_json("users/test_user.json", {"username": "test_user", "password": "hash",
+                                                      "metadata": {"level": "A1", "xp": 0}})
+        self.user_manager = UserManager(bucket_name="test_bucket",
+                                        store=GCSUserStore("test_bucket", lambda: self.client),
+                                        write_behind_window=60)
+
+    def _stored_metadata(self):
+        return json.loads(self.bucket.objects["users/test_user.json"][0])["metadata"]
+
+    def test_updates_coalesce_into_one_write(self):
+        """Test that queued updates are visible immediately and written once, last value winning."""
+        for xp in range(1, 6):
+            self.user_manager.update_metadata("test_user", {"xp": xp})
+        self.user_manager.update_metadata("test_user", {"level": "B1"})
+
+        self.assertEqual(self.user_manager.get_metadata("test_user"), {"level": "B1", "xp": 5})
+        self.assertEqual(self._stored_metadata(), {"level": "A1", "xp": 0})
+
+        generation = self.bucket.objects["users/test_user.json"][1]
+        self.user_manager.flush_pending()
+
+        self.assertEqual(self._stored_metadata(), {"level": "B1", "xp": 5})
+        self.assertEqual(self.bucket.objects["users/test_user.json"][1], generation + 1)
+        self.assertEqual((self.user_manager.write_behind.updates, self.user_manager.write_behind.writes), (6, 1))
+
+    def test_flush_rereads_after_concurrent_write(self):
+        """Test that a write from elsewhere fails the generation precondition and is merged, not overwritten."""
+        self.user_manager.update_metadata("test_user", {"xp": 3})
+        self.bucket.put_json("users/test_user.json", {"username": "test_user", "password": "hash",
+                                                      "metadata": {"level": "C1", "xp": 0}})
+
+        self.user_manager.flush_pending()
+
+        self.assertEqual(self._stored_metadata(), {"level": "C1", "xp": 3})
+        self.assertEqual(self.user_manager.get_metadata("test_user"), {"level": "C1", "xp": 3})
+
+    def test_record_read_keeps_recent_items_first(self):
+        """Test that reads are queued like any metadata update, most recent first and without duplicates."""
+        for key in ["article:1", "article:2", "article:1", "article:1"]:
+            self.user_manager.record_read("test_user", key)
+
+        self.assertEqual(self.user_manager.get_metadata("test_user")["recently_read"], ["article:1", "article:2"])
+        self.assertEqual(self.user_manager.write_behind.updates, 3)
+
+    def test_reads_in_a_window_become_one_update(self):
+        """Test that reads collected over a window are added with one metadata update, latest first."""
+        user_manager = UserManager(bucket_name="test_bucket", store=GCSUserStore("test_bucket", lambda: self.client),
+                                   write_behind_window=60, read_history_window=60)
+        for key in ["article:1", "video:2", "article:1", "article:3"]:
+            user_manager.record_read("test_user", key)
+        self.assertNotIn("recently_read", user_manager.get_metadata("test_user"))
+
+        user_manager.flush_pending()
+
+        self.assertEqual(self._stored_metadata()["recently_read"], ["article:3", "article:1", "video:2"])
+        self.assertEqual(user_manager.write_behind.updates, 1)
+        user_manager.record_read("test_user", "article:3")
+        user_manager.flush_pending()
+        self.assertEqual(user_manager.write_behind.updates, 1)  # Opened again: nothing to write
+
+    def test_slow_write_only_holds_back_its_shard(self):
+        """Test that users on other flusher shards are written while one user's write is stuck."""
+        release = threading.Event()
+        written = []
+
+        def write(username, metadata):
+            if username == "slow":
+                release.wait(5)
+            written.append(username)
+
+        write_behind = MetadataWriteBehind(write, window=0, shards=2)
+        fast = next(name for name in (f"user{i}" for i in range(100))
+                    if write_behind._shard(name) != write_behind._shard("slow"))
+        write_behind.submit("slow", {"xp": 1})
+        time.sleep(0.05)
+        write_behind.submit(fast, {"xp": 1})
+
+        deadline = time.monotonic() + 2
+        while fast not in written and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(written, [fast])
+        release.set()
+        while write_behind.writes < 2 and time.monotonic() < deadline + 2:
+            time.sleep(0.01)
+        self.assertEqual(written, [fast, "slow"])
+        self.assertEqual(write_behind.writes, 2)
+
+    def test_failed_writes_are_retried_not_dropped(self):
+        """Test that an acknowledged update survives repeated write failures and keeps newer values on top."""
+        failures = [Exception("unavailable")] * 4
+        written = []
+
+        def write(username, metadata):
+            if failures:
+                raise failures.pop()
+            written.append(dict(metadata))
+
+        write_behind = MetadataWriteBehind(write, window=60)
+        write_behind.submit("test_user", {"level": "B1", "xp": 1})
+        for _ in range(4):
+            write_behind.flush("test_user")
+        write_behind.submit("test_user", {"xp": 2})
+        self.assertEqual(write_behind.overlay("test_user"), {"level": "B1", "xp": 2})
+
+        write_behind.flush("test_user")
+
+        self.assertEqual(written, [{"level": "B1", "xp": 2}])
+        self.assertEqual(write_behind.pending_users(), 0)
+
+    def test_update_unknown_user(self):
+        """Test that updates for users that do not exist are rejected, not queued."""
+        with self.assertRaises(Exception) as context:
+            self.user_manager.update_metadata("missing_user", {"xp": 1})
+
+        self.assertEqual(str(context.exception), "User 'missing_user' not found")
+        self.assertEqual(self.user_manager.write_behind.pending_users(), 0)
+
+
+def build_search_db(documents):
+    """Bytes of an FTS5 index laid out like the ones summary_vocab publishes."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "search.db")
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE items (rowid INTEGER PRIMARY KEY, doc_id TEXT, title TEXT, summary TEXT)")
+        connection.execute("CREATE VIRTUAL TABLE documents USING fts5("
+                           "title, body, summary, vocab, content = '', tokenize = 'porter unicode61')")
+        for rowid, (doc_id, title, body, summary, vocab) in enumerate(documents, start=1):
+            connection.execute("INSERT INTO items VALUES (?, ?, ?, ?)", (rowid, doc_id, title, summary))
+            connection.execute("INSERT INTO documents (rowid, title, body, summary, vocab) VALUES (?, ?, ?, ?, ?)",
+                               (rowid, title, body, summary, vocab))
+        connection.execute("INSERT INTO documents (documents, rank) VALUES ('rank', 'bm25(5.0, 1.0, 2.0, 2.0)')")
+        connection.commit()
+        connection.close()
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class TestFeedBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = {
+            "article": {
+                "A1": [{"id": 1, "vocab": "A1: cat, dog, house, tree, sun"},
+                       {"id": 2, "vocab": "A1: cat, dog, house, car, road"},
+                       {"id": 3, "vocab": "A1: planet, orbit, galaxy, comet, star"}],
+                "B1": [{"id": 4, "vocab": "B1: cat, dog"}],
+            },
+            "video": {"A1": [{"video_id": "v", "vocab": "A1: cat, dog, house, boat, river"}]},
+        }
+
+    def _user(self, username, level, recently_read=()):
+        return {"username": username, "metadata": {"level": level, "recently_read": list(recently_read)}}
+
+    def test_ranks_unread_items_of_the_level_by_vocab_fit(self):
+        """Test that read items are left out and items sharing most of the studied vocab come first."""
+        users = [self._user("reader", "A1", ["article:1"]), self._user("new", "A1"), {"username": "nolevel"}]
+
+        feeds = FeedIndex(build_feeds(self.catalog, users, feed_size=5)[0])
+
+        self.assertEqual(feeds.users, ["reader", "new"])
+        reader_feed = feeds.feed_for("reader")
+        self.assertEqual([item_id for _, _, item_id in reader_feed[:2]], ["2", "v"])
+        self.assertEqual(reader_feed[-1], ("article", "A1", "3"))  # No familiar words
+        self.assertNotIn(("article", "A1", "1"), reader_feed)
+        self.assertEqual({level for _, level, _ in feeds.feed_for("new")}, {"A1"})
+        self.assertEqual(len(feeds.feed_for("new")), 4)
+
+    def test_only_changed_users_are_scored_again(self):
+        """Test that an incremental build reuses the rows of users whose history did not change."""
+        users = [self._user("a", "A1"), self._user("b", "A1")]
+        first, counts = build_feeds(self.catalog, users, feed_size=5)
+        self.assertEqual(counts, {"users": 2, "scored": 2, "reused": 0})
+
+        users[1] = self._user("b", "A1", ["video:v"])
+        second, counts = build_feeds(self.catalog, users + [self._user("c", "B1")], FeedIndex(first), feed_size=5)
+
+        self.assertEqual(counts, {"users": 3, "scored": 2, "reused": 1})
+        feeds = FeedIndex(second)
+        self.assertEqual(feeds.feed_for("a"), FeedIndex(first).feed_for("a"))
+        self.assertNotIn(("video", "A1", "v"), feeds.feed_for("b"))
+        self.assertEqual(feeds.feed_for("c"), [("article", "B1", "4")])
+
+    def test_chunked_scoring_keeps_the_same_top_items(self):
+        """Test that scoring a level a few items at a time gives the same feeds as scoring it at once."""
+        users = [self._user("reader", "A1", ["article:1"]), self._user("new", "A1")]
+        whole = FeedIndex(build_feeds(self.catalog, users, feed_size=3)[0])
+
+        with patch.object(feed_builder_module, "SCORE_CHUNK_CELLS", 1):
+            chunked = FeedIndex(build_feeds(self.catalog, users, feed_size=3)[0])
+
+        self.assertEqual(chunked.feed_for("reader"), whole.feed_for("reader"))
+        self.assertEqual(chunked.feed_for("new"), whole.feed_for("new"))
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient(latency=0)
+        self.bucket = self.client.bucket("test_bucket")
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.index_dir.cleanup)
+        self.search_index = SearchIndex("test_bucket", storage_client=self.client, index_dir=self.index_dir.name,
+                                        check_interval=60)
+
+    def test_match_expression_quotes_words(self):
+        """Test that user input is reduced to quoted words, so FTS5 syntax in it is never interpreted."""
+        self.assertEqual(match_expression('gold "price" OR NEAR(x'), '"gold" "price" "or" "near" "x"')
+        self.assertIsNone(match_expression("  ?! "))
+
+    def test_search_ranks_and_reloads_new_generations(self):
+        """Test that results are ranked by BM25 and the index is only downloaded again when republished."""
+        self.bucket.put_bytes("bundles/bbc_news/B1/search.db", build_search_db([
+            ("1", "Markets", "Investors bought gold today.", "Gold rises.", ""),
+            ("2", "Gold medal", "She won gold.", "A race.", ""),
+            ("3", "Weather", "Rain all week.", "Rain.", ""),
+            ("4", "Elections", "Votes were counted.", "Results.", ""),
+            ("5", "Cooking", "Boil the pasta.", "Dinner.", ""),
+        ]))
+
+        results = self.search_index.search("articles", "B1", "gold")
+        calls = self.client.calls
+        self.search_index.search("articles", "B1", "gold")
+
+        self.assertEqual([result["id"] for result in results], ["2", "1"])
+        self.assertEqual(results[0]["title"], "Gold medal")
+        self.assertGreater(results[0]["score"], results[1]["score"])
+        self.assertEqual(self.client.calls, calls)  # Checked at most once per interval
+
+        self.bucket.put_bytes("bundles/bbc_news/B1/search.db", build_search_db([
+            ("6", "Golden age", "Gold everywhere.", "", ""),
+        ]))
+        self.search_index.check_interval = 0
+        self.assertEqual([result["id"] for result in self.search_index.search("articles", "B1", "gold")], ["6"])
+        self.assertEqual(len(os.listdir(self.index_dir.name)), 1)  # The previous generation was removed
+
+    def test_new_generation_waits_for_connections_being_opened(self):
+        """Test that a republished index does not remove the previous file while a thread is opening it."""
+        self.bucket.put_bytes("bundles/bbc_news/B1/search.db", build_search_db([("1", "Gold", "Gold.", "", "")]))
+        self.search_index.search("articles", "B1", "gold")
+        generation = self.bucket.put_bytes("bundles/bbc_news/B1/search.db",
+                                           build_search_db([("2", "Gold", "Gold.", "", "")]))
+        index = self.search_index._index_for("articles", "B1")
+        refresher = threading.Thread(target=self.search_index._refresh, args=(index,))
+        connect = sqlite3.connect
+
+        def slow_connect(*args, **kwargs):
+            index.checked_at = 0
+            refresher.start()  # Publishes the new generation while this thread opens the previous one
+            time.sleep(0.2)
+            return connect(*args, **kwargs)
+
+        results = []
+        searcher = threading.Thread(target=lambda: results.extend(self.search_index.search("articles", "B1", "gold")))
+        with patch("api.utils.search_index.sqlite3.connect", side_effect=slow_connect):
+            searcher.start()  # A thread without a connection yet
+            searcher.join()
+        refresher.join()
+
+        self.assertEqual([result["id"] for result in results], ["1"])
+        self.assertEqual(index.generation, generation)
+
+    def test_search_without_published_index(self):
+        """Test that a level without a search index returns no results instead of failing."""
+        self.assertEqual(self.search_index.search("transcripts", "A1", "pasta"), [])
+
+
+class TestSearchAPI(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.include_router(router_search)
+        self.client = TestClient(app)
+        metadata_patcher = patch.object(dependencies.user_manager, "get_metadata", return_value={"level": "B1"})
+        metadata_patcher.start()
+        self.addCleanup(metadata_patcher.stop)
+        search_patcher = patch.object(dependencies.search_index, "search",
+                                      side_effect=lambda kind, level, q, limit: [{"id": f"{kind}-{level}"}])
+        self.mock_search = search_patcher.start()
+        self.addCleanup(search_patcher.stop)
+
+    def test_search_defaults_to_user_level(self):
+        """Test that /search searches articles and transcripts of the user's level."""
+        response = self.client.get("/search?username=test_user&q=gold&limit=5")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"query": "gold", "level": "B1", "articles": [{"id": "articles-B1"}],
+                                           "transcripts": [{"id": "transcripts-B1"}]})
+        self.mock_search.assert_any_call("articles", "B1", "gold", 5)
+
+    def test_search_rejects_unknown_level(self):
+        response = self.client.get("/search?username=test_user&q=gold&level=Z9")
+
+        self.assertEqual(response.status_code, 400)
+        self.mock_search.assert_not_called()
+
+
+def metric_value(name, labels):
+    """Current value of one sample of the API's metrics registry, 0 if it was never recorded."""
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render_prometheus_text(self):
+        """Test that /metrics renders the registry in the Prometheus text format with cumulative buckets."""
+        metrics.record_batch("render_batch", 3, [0.05, 0.5, 5], 0.1)
+
+        text = metrics.render().decode("utf-8")
+
+        self.assertIn("# TYPE batch_size histogram\n", text)
+        self.assertIn('batch_wait_seconds_bucket{le="0.05",name="render_batch"} 1.0\n', text)
+        self.assertIn('batch_wait_seconds_bucket{le="1.0",name="render_batch"} 2.0\n', text)
+        self.assertIn('batch_wait_seconds_bucket{le="+Inf",name="render_batch"} 3.0\n', text)
+        self.assertIn('batch_wait_seconds_count{name="render_batch"} 3.0\n', text)
+
+    def test_middleware_labels_route_template_and_attributes_gcs_calls(self):
+        """Test that requests are labelled by path template and GCS calls made on the storage pool count for them."""
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/things/{thing_id}")
+        async def get_thing(thing_id: str):
+            await run_storage(record_gcs_call, "test", "download", 100)
+            await run_storage(record_gcs_call, "test", "download", 50)
+            return {"id": thing_id}
+
+        client = TestClient(app)
+        route = "/things/{thing_id}"
+        ok = {"route": route, "method": "GET", "status": "200"}
+        before = metric_value("api_requests_total", ok)
+        calls_before = metric_value("api_request_gcs_calls_sum", {"route": route})
+        bytes_before = metric_value("api_request_gcs_bytes_sum", {"route": route})
+
+        client.get("/things/1")
+        client.get("/things/2")
+        client.get("/missing")
+
+        self.assertEqual(metric_value("api_requests_total", ok) - before, 2)
+        self.assertEqual(metric_value("api_request_gcs_calls_sum", {"route": route}) - calls_before, 4)
+        self.assertEqual(metric_value("api_request_gcs_bytes_sum", {"route": route}) - bytes_before, 300)
+        self.assertGreaterEqual(metric_value("api_requests_total",
+                                             {"route": "unmatched", "method": "GET", "status": "404"}), 1)
+
+
+class TestStaticExport(unittest.TestCase):
+
+    def setUp(self):
+        self.out = tempfile.TemporaryDirectory()
+        self.addCleanup(self.out.cleanup)
+        self.level_dir = os.path.join(self.out.name, "content", "articles", "B1")
+
+    def read(self, path):
+        with open(os.path.join(self.level_dir, path), "rb") as f:
+            return f.read()
+
+    def test_export_writes_pages_items_and_pointer(self):
+        """Test that a level is exported as versioned pages and items with gzip twins and a pointer to them."""
+        articles = [{"id": i, "Title": f"Article {i}", "summary": "S", "Text": "Body"} for i in range(3)]
+        summary = export_level(self.out.name, "articles", "B1", CatalogSnapshot(articles, "id", None), page_size=2)
+
+        pointer = json.loads(self.read("current.json"))
+        self.assertEqual(pointer["version"], summary["version"])
+        self.assertEqual(pointer["total"], 3)
+        first_page = json.loads(self.read(pointer["first_page"]))
+        self.assertEqual(first_page["articles"], [{"id": 0, "Title": "Article 0", "summary": "S"},
+                                                  {"id": 1, "Title": "Article 1", "summary": "S"}])
+        self.assertEqual(first_page["next"], "page-1.json")
+        self.assertIsNone(json.loads(self.read(f"{pointer['version']}/page-1.json"))["next"])
+        item = self.read(pointer["items"].format(id=2))
+        self.assertEqual(json.loads(item), {"article": articles[2]})
+        self.assertEqual(gzip.decompress(self.read(pointer["items"].format(id=2) + ".gz")), item)
+
+    def test_unchanged_level_keeps_its_version(self):
+        """Test that re-exporting unchanged content writes nothing and that old versions are pruned."""
+        versions = []
+        for title in ["First", "First", "Second", "Third"]:
+            snapshot = CatalogSnapshot([{"id": 1, "Title": title}], "id", None)
+            summary = export_level(self.out.name, "articles", "B1", snapshot)
+            versions.append(summary["version"])
+            if len(versions) == 2:
+                self.assertEqual(summary["written"], 0)
+
+        self.assertEqual(versions[0], versions[1])
+        self.assertNotEqual(versions[1], versions[2])
+        remaining = {entry for entry in os.listdir(self.level_dir) if not entry.startswith("current.json")}
+        self.assertEqual(remaining, {versions[2], versions[3]})
+
+    def test_exporter_rewrites_levels_whose_catalog_changed(self):
+        """Test that the refresher's exporter only exports a level again when its snapshot version changes."""
+        snapshots = {"B1": CatalogSnapshot([{"id": 1, "Title": "First"}], "id", "v1")}
+        media_manager = MagicMock()
+        media_manager.article_snapshot.side_effect = lambda level: snapshots[level]
+        media_manager.transcript_snapshot.return_value = CatalogSnapshot([], "video_id", None)  # Not loaded yet
+        exporter = StaticExporter(self.out.name, media_manager, levels=["B1"])
+
+        first = exporter.export_changed()
+        unchanged = exporter.export_changed()
+        snapshots["B1"] = CatalogSnapshot([{"id": 1, "Title": "Second"}], "id", "v2")
+        changed = exporter.export_changed()
+
+        self.assertEqual([(summary["kind"], summary["level"]) for summary in first], [("articles", "B1")])
+        self.assertEqual(unchanged, [])
+        self.assertEqual(json.loads(self.read("current.json"))["version"], changed[0]["version"])
+        self.assertNotEqual(changed[0]["version"], first[0]["version"])
+        self.assertFalse(os.path.exists(os.path.join(self.out.name, "content", "transcripts")))
+
+
+class TestIdIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient(latency=0)
+        self.bucket = self.client.bucket("test_bucket")
+        self.media_manager = MediaManager(bucket_name="test_bucket", storage_client=self.client)
+        id_index = {"levels": {}, "ids": {}}
+        for level, articles in {"A1": [{"id": 1, "Title": "One"}], "B1": [{"id": 2, "Title": "Two"},
+                                                                           {"id": 3, "Title": "Three"}]}.items():
+            lines = [(json.dumps(article) + "\n").encode("utf-8") for article in articles]
+            content = b"".join(lines)
+            path = f"bundles/bbc_news/{level}/content.jsonl"
+            generation = self.bucket.put_bytes(path, content)
+            self.bucket.put_json(f"bundles/bbc_news/{level}/manifest.json", {
+                "count": len(articles), "content_generation": generation,
+                "content_sha256": hashlib.sha256(content).hexdigest(),
+            })
+            id_index["levels"][level] = {"content": path, "generation": generation}
+            offset = 0
+            for article, line in zip(articles, lines):
+                id_index["ids"][str(article["id"])] = [level, offset, len(line)]
+                offset += len(line)
+        self.bucket.put_json("bundles/bbc_news/ids.json", id_index)
+
+    def test_find_reads_one_slice_of_any_level(self):
+        """Test that an article of another level is found with one ranged read, without loading any level."""
+        level, article, _ = self.media_manager.find_article("3", level="A1")
+        calls = self.client.calls
+        self.assertEqual(self.media_manager.find_article("2", level="A1")[:2], ("B1", {"id": 2, "Title": "Two"}))
+
+        self.assertEqual((level, article), ("B1", {"id": 3, "Title": "Three"}))
+        self.assertEqual(self.client.calls - calls, 1)  # The index is fresh: only the slice is read
+        self.assertEqual(self.media_manager._catalogs, {})
+        self.assertIsNone(self.media_manager.find_article("4", level="A1"))
+
+    def test_find_uses_loaded_snapshot(self):
+        """Test that an item of a level whose snapshot holds the indexed content is served from memory."""
+        self.media_manager.article_snapshot("B1")
+        self.media_manager.find_article("2")
+        calls = self.client.calls
+
+        self.assertEqual(self.media_manager.find_article("3")[:2], ("B1", {"id": 3, "Title": "Three"}))
+        self.assertEqual(self.client.calls, calls)
+
+    def test_own_level_policy_forbids_other_levels(self):
+        """Test that the detail route answers 403 for another level's article only under the own_level policy."""
+        app = FastAPI()
+        app.include_router(router_media)
+        app.dependency_overrides[dependencies.get_media_manager] = lambda: self.media_manager
+        client = TestClient(app)
+        for name, value in [("get_metadata", {"level": "A1"}), ("record_read", None)]:
+            patcher = patch.object(dependencies.user_manager, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.assertEqual(client.get("/articles/2?username=test_user").json(), {"article": {"id": 2, "Title": "Two"}})
+        with patch.object(media_router_module, "DETAIL_LEVEL_POLICY", "own_level"):
+            self.assertEqual(client.get("/articles/2?username=test_user").status_code, 403)
+            self.assertEqual(client.get("/articles/1?username=test_user").status_code, 200)
+
+
+class TestChangesAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient(latency=0)
+        self.bucket = self.client.bucket("test_bucket")
+        self.media_manager = MediaManager(bucket_name="test_bucket", storage_client=self.client)
+        app = FastAPI()
+        app.include_router(router_media)
+        app.dependency_overrides[dependencies.get_media_manager] = lambda: self.media_manager
+        self.http = TestClient(app)
+        patcher = patch.object(dependencies.user_manager, "get_metadata", return_value={"level": "B1"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _publish(self, articles, change_version, entries):
+        content = b"".join((json.dumps(article) + "\n").encode("utf-8") for article in articles)
+        generation = self.bucket.put_bytes("bundles/bbc_news/B1/content.jsonl", content)
+        self.bucket.put_json("bundles/bbc_news/B1/manifest.json", {
+            "count": len(articles), "content_generation": generation, "change_version": change_version,
+            "content_sha256": hashlib.sha256(content).hexdigest(),
+        })
+        self.bucket.put_json("bundles/bbc_news/B1/changes.json", {
+            "version": entries[-1]["version"], "items": {}, "entries": entries,
+        })
+
+    def test_changes_between_versions(self):
+        """Test that changes across several publishes collapse to each item's net change."""
+        log = {"version": 4, "entries": [
+            {"version": 2, "added": ["a", "b"], "updated": [], "removed": []},
+            {"version": 3, "added": ["c"], "updated": ["a"], "removed": ["b"]},
+            {"version": 4, "added": [], "updated": [], "removed": ["c", "a"]},
+        ]}
+
+        self.assertEqual(changes_between(log, 1, 3), {"added": ["a", "c"], "updated": [], "removed": []})
+        self.assertEqual(changes_between(log, 2, 4), {"added": [], "updated": [], "removed": ["a", "b"]})
+        self.assertEqual(changes_between(log, 3, 3), {"added": [], "updated": [], "removed": []})
+        self.assertIsNone(changes_between(log, 0, 4))  # Older than the log
+        self.assertIsNone(changes_between(log, 5, 4))  # Never published
+
+    def test_article_changes_since_version(self):
+        """Test that /articles/changes returns the projected items changed since a version and the version reached."""
+        self._publish([{"id": 1, "Title": "One", "Text": "Body"}, {"id": 3, "Title": "Three*", "Text": "Body"}], 2, [
+            {"version": 1, "added": ["1", "2", "3"], "updated": [], "removed": []},
+            {"version": 2, "added": [], "updated": ["3"], "removed": ["2"]},
+        ])
+
+        response = self.http.get("/articles/changes?since=1&username=test_user")
+        everything = self.http.get("/articles/changes?since=0&username=test_user&fields=id").json()
+        up_to_date = self.http.get("/articles/changes?since=2&username=test_user").json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"version": 2, "reset": False, "added": [],
+                                           "updated": [{"id": 3, "Title": "Three*"}], "removed": ["2"]})
+        self.assertEqual((everything["added"], everything["removed"]), ([{"id": 1}, {"id": 3}], []))
+        self.assertEqual((up_to_date["added"], up_to_date["updated"], up_to_date["removed"]), ([], [], []))
+        etag = response.headers["ETag"]
+        self.assertEqual(self.http.get("/articles/changes?since=1&username=test_user",
+                                       headers={"If-None-Match": etag}).status_code, 304)
+
+    def test_article_changes_reset_and_missing_log(self):
+        """Test that a version older than the log resyncs the whole level and a level without a log is a 404."""
+        self._publish([{"id": 5, "Title": "Five"}], 9, [{"version": 9, "added": ["5"], "updated": [], "removed": []}])
+
+        reset = self.http.get("/articles/changes?since=3&username=test_user").json()
+        missing = self.http.get("/transcripts/changes?since=0&username=test_user")
+
+        self.assertEqual(reset, {"version": 9, "reset": True, "added": [{"id": 5, "Title": "Five"}], "updated": [],
+                                 "removed": []})
+        self.assertEqual(missing.status_code, 404)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_threads_share_one_call(self):
+        """Test that threads asking for the same key while a call is in flight get its result without calling again."""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def load(key):
+            calls.append(key)
+            release.wait(5)
+            return {"key": key}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("B1", load, "B1"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, ["B1"])
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result is results[0] for result in results))
+        flight.do("B1", load, "B1")
+        self.assertEqual(len(calls), 2)  # Nothing is cached once the call is done
+
+    def test_error_is_shared_by_waiting_threads(self):
+        """Test that every caller joined to a failing call gets its exception."""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def load():
+            started.set()
+            release.wait(5)
+            raise ValueError("bucket unavailable")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("diagnostic", load)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=call) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+        self.assertEqual([str(e) for e in errors], ["bucket unavailable"] * 4)
+
+    def test_async_callers_share_one_load(self):
+        """Test that concurrent coroutines share one load and that a cancelled caller does not cancel it."""
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def load(level):
+            calls.append(level)
+            await asyncio.sleep(0.05)
+            return f"snapshot {level}"
+
+        async def scenario():
+            cancelled = asyncio.ensure_future(flight.do("B1", load, "B1"))
+            waiting = [asyncio.ensure_future(flight.do("B1", load, "B1")) for _ in range(20)]
+            other = asyncio.ensure_future(flight.do("A2", load, "A2"))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            return await asyncio.gather(*waiting), await other
+
+        results, other = asyncio.run(scenario())
+        self.assertEqual(sorted(calls), ["A2", "B1"])
+        self.assertEqual(results, ["snapshot B1"] * 20)
+        self.assertEqual(other, "snapshot A2")
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_concurrent_requests_share_batches_up_to_max_size(self):
+        """Test that concurrent submits run together, in batches of at most max_batch_size, in order."""
+        batches = []
+
+        def run_batch(texts):
+            batches.append(list(texts))
+            time.sleep(0.02)
+            return [text.upper() for text in texts]
+
+        batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=50, name="test_batch")
+
+        async def run_all():
+            try:
+                return await asyncio.gather(*(batcher.submit(f"text {i}") for i in range(10)))
+            finally:
+                await batcher.close()
+
+        results = asyncio.run(run_all())
+
+        self.assertEqual(results, [f"TEXT {i}" for i in range(10)])
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+        self.assertEqual(metric_value("batch_size_count", {"name": "test_batch"}), 3)
+        self.assertEqual(metric_value("batch_wait_seconds_count", {"name": "test_batch"}), 10)
+
+    def test_single_request_runs_after_max_wait(self):
+        """Test that a lone request does not wait for a full batch, only for max_wait_ms."""
+        batcher = MicroBatcher(lambda texts: [len(text) for text in texts], max_batch_size=32, max_wait_ms=20)
+
+        async def run_one():
+            start = time.perf_counter()
+            try:
+                return await batcher.submit("hello"), time.perf_counter() - start
+            finally:
+                await batcher.close()
+
+        result, elapsed = asyncio.run(run_one())
+
+        self.assertEqual(result, 5)
+        self.assertGreaterEqual(elapsed, 0.015)
+        self.assertLess(elapsed, 1)
+
+    def test_batch_error_reaches_every_request(self):
+        """Test that a failing batch fails each of its requests, and a full queue turns new ones away."""
+        def run_batch(texts):
+            raise ClassifierUnavailable("no model")
+
+        batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=20, max_queue=2)
+
+        async def run_all():
+            try:
+                return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+            finally:
+                await batcher.close()
+
+        results = asyncio.run(run_all())
+
+        self.assertIsInstance(results[0], ClassifierUnavailable)
+        self.assertIsInstance(results[1], ClassifierUnavailable)
+        self.assertIsInstance(results[2], BatcherBusy)
+
+
+class TestClassifyAPI(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.include_router(router_classify)
+        self.client = TestClient(app)
+        metadata_patcher = patch.object(dependencies.user_manager, "get_metadata", return_value={"level": "B1"})
+        metadata_patcher.start()
+        self.addCleanup(metadata_patcher.stop)
+        self.texts = []
+
+        def run_batch(texts):
+            self.texts.extend(texts)
+            return [classification([0.1, 0.2, 0.6, 0.05, 0.05]) for _ in texts]
+
+        self.batcher = MicroBatcher(run_batch, max_wait_ms=1, name="test_classify")
+        app.dependency_overrides[dependencies.get_classify_batcher] = lambda: self.batcher
+
+    def test_classify_returns_level_and_probabilities(self):
+        response = self.client.post("/classify?username=test_user", json={"text": "  The cat sat on the mat.  "})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"level": "B1", "probabilities": {"A1": 0.1, "A2": 0.2, "B1": 0.6,
+                                                                            "B2": 0.05, "C1": 0.05}})
+        self.assertEqual(self.texts, ["The cat sat on the mat."])
+
+    def test_classify_rejects_empty_text_and_reports_missing_model(self):
+        response = self.client.post("/classify?username=test_user", json={"text": "   "})
+        self.assertEqual(response.status_code, 400)
+
+        def unavailable(texts):
+            raise ClassifierUnavailable("PyTorch and transformers are not installed")
+
+        self.batcher.run_batch = unavailable
+        response = self.client.post("/classify?username=test_user", json={"text": "Hello"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.texts, [])
+
 
 if __name__ == "__main__":
     unittest.main()
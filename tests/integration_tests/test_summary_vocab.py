@@ -5,6 +5,8 @@ import os
 import sys
 import re
 import io
+import sqlite3
+import tempfile
 
 # Ensure /app is in the Python path
 sys.path.insert(0, '/app')
@@ -38,6 +40,14 @@ from extract_results_yt import (
     upload_and_sync_selected_folders
 )
 
+from publish_bundle import (
+    append_change,
+    build_bundle,
+    build_search_index,
+    merge_id_index,
+    upload_bundle
+)
+
 
 
 class TestSummaryVocabNews(unittest.TestCase):
@@ -406,5 +416,113 @@ class TestExtractResultsYT(unittest.TestCase):
 
 
 
+class TestPublishBundle(unittest.TestCase):
+
+    def test_build_bundle(self):
+        """Test that the bundle index slices each item back out of the content."""
+        items = [
+            {"id": 0, "Title": "First", "Text": "Caf\u00e9 news"},
+            {"id": 1, "Title": "Second", "Text": "More news"}
+        ]
+
+        content, index, manifest = build_bundle(items, "id")
+
+        self.assertEqual(manifest["count"], 2)
+        self.assertEqual(manifest["content_bytes"], len(content))
+        for item in items:
+            offset, length = index[str(item["id"])]
+            self.assertEqual(json.loads(content[offset:offset + length]), item)
+
+    @patch('publish_bundle.storage.Client')
+    def test_upload_bundle_writes_manifest_last(self, mock_storage_client):
+        """Test that the manifest is uploaded after the content and records its generation."""
+        mock_bucket = MagicMock()
+        mock_storage_client.return_value.bucket.return_value = mock_bucket
+        blobs = {}
+
+        def make_blob(name):
+            blob = MagicMock()
+            blob.generation = len(blobs) + 1
+            blobs[name] = blob
+            return blob
+
+        mock_bucket.blob.side_effect = make_blob
+        mock_bucket.get_blob.return_value = None  # No id index yet
+
+        manifest = upload_bundle("test_bucket", "yt_transcripts", "A1", [{"video_id": "abc"}], "video_id")
+
+        names = [call.args[0] for call in mock_bucket.blob.call_args_list]
+        self.assertEqual(names, [
+            "bundles/yt_transcripts/A1/content.jsonl",
+            "bundles/yt_transcripts/A1/index.json",
+            "bundles/yt_transcripts/A1/search.db",
+            "bundles/yt_transcripts/A1/changes.json",
+            "bundles/yt_transcripts/A1/manifest.json",
+            "bundles/yt_transcripts/ids.json",
+        ])
+        self.assertEqual(manifest["content_generation"], blobs["bundles/yt_transcripts/A1/content.jsonl"].generation)
+        self.assertEqual(manifest["search_generation"], blobs["bundles/yt_transcripts/A1/search.db"].generation)
+        uploaded_manifest = json.loads(blobs["bundles/yt_transcripts/A1/manifest.json"].upload_from_string.call_args[0][0])
+        self.assertEqual(uploaded_manifest["count"], 1)
+        self.assertEqual(uploaded_manifest["change_version"], 1)
+        id_index_upload = blobs["bundles/yt_transcripts/ids.json"].upload_from_string.call_args
+        self.assertEqual(json.loads(id_index_upload.args[0])["ids"], {"abc": ["A1", 0, len('{"video_id": "abc"}\n')]})
+        self.assertEqual(id_index_upload.kwargs["if_generation_match"], 0)  # Only created if still missing
+
+    def test_append_change_records_added_updated_and_removed(self):
+        """Test that each publish that changes items adds one change log entry and unchanged publishes add none."""
+        first = append_change(None, {"1": "a", "2": "b"})
+        self.assertIsNone(append_change(first, {"1": "a", "2": "b"}))
+        second = append_change(first, {"1": "a", "2": "c", "3": "d"})
+        third = append_change(second, {"2": "c", "3": "d"}, max_entries=2)
+
+        self.assertEqual(first["entries"][0]["added"], ["1", "2"])
+        self.assertEqual({key: second["entries"][-1][key] for key in ("version", "added", "updated", "removed")},
+                         {"version": 2, "added": ["3"], "updated": ["2"], "removed": []})
+        self.assertEqual(third["version"], 3)
+        self.assertEqual([entry["version"] for entry in third["entries"]], [2, 3])
+        self.assertEqual(third["entries"][-1]["removed"], ["1"])
+
+    def test_merge_id_index_replaces_one_level(self):
+        """Test that publishing a level replaces its entries and keeps those of the other levels."""
+        id_index = merge_id_index(None, "A1", "bundles/bbc_news/A1/content.jsonl", 1, {"1": [0, 10], "2": [10, 5]})
+        id_index = merge_id_index(id_index, "B1", "bundles/bbc_news/B1/content.jsonl", 2, {"3": [0, 7]})
+        id_index = merge_id_index(id_index, "A1", "bundles/bbc_news/A1/content.jsonl", 3, {"2": [0, 6]})
+
+        self.assertEqual(id_index["ids"], {"2": ["A1", 0, 6], "3": ["B1", 0, 7]})
+        self.assertEqual(id_index["levels"]["A1"], {"content": "bundles/bbc_news/A1/content.jsonl", "generation": 3})
+        self.assertEqual(id_index["levels"]["B1"]["generation"], 2)
+
+    def test_build_search_index_ranks_with_bm25(self):
+        """Test that the search index matches stemmed words in every field and ranks title matches first."""
+        items = [
+            {"id": 0, "Title": "Markets today", "Text": "Investors were running to gold.", "summary": "Gold rises.",
+             "vocab": "B1: investor, gold"},
+            {"id": 1, "Title": "Gold medal run", "Text": "The runner won.", "summary": "A race.", "vocab": ""},
+            {"video_id": "abc", "video_name": "Cooking", "transcript": [{"text": "Boil the pasta", "start": 0.0}]},
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "search.db")
+            build_search_index(items[:2], "id", path)
+            build_search_index(items[:2], "id", path)  # Rebuilding replaces the file
+            connection = sqlite3.connect(path)
+            rows = connection.execute(
+                "SELECT items.doc_id FROM documents JOIN items ON items.rowid = documents.rowid "
+                "WHERE documents MATCH ? ORDER BY rank", ('"gold" "run"',)
+            ).fetchall()
+            connection.close()
+
+            build_search_index(items[2:], "video_id", path)
+            connection = sqlite3.connect(path)
+            transcript_rows = connection.execute(
+                "SELECT items.doc_id, items.title FROM documents JOIN items ON items.rowid = documents.rowid "
+                "WHERE documents MATCH ?", ('"pasta"',)
+            ).fetchall()
+            connection.close()
+
+        self.assertEqual(rows, [("1",), ("0",)])
+        self.assertEqual(transcript_rows, [("abc", "Cooking")])
+
+
 if __name__ == "__main__":
     unittest.main()